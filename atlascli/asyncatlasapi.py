@@ -0,0 +1,134 @@
+"""
+MongoDB Atlas asyncio API
+~~~~~~~~~~~~~~~~~~~~~~~~~
+
+An asyncio counterpart to AtlasAPI. Each awaitable runs the equivalent
+AtlasAPI call on a thread pool so the event loop is never blocked, while
+the requests share AtlasAPI's pooled session and digest auth state. Many
+projects can be crawled concurrently with asyncio.gather().
+"""
+import asyncio
+import functools
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from typing import AsyncGenerator, Dict
+
+from atlascli.atlasapi import AtlasAPI
+from atlascli.atlascluster import AtlasCluster
+from atlascli.atlaskey import AtlasKey
+from atlascli.atlasorganization import AtlasOrganization
+from atlascli.atlasproject import AtlasProject
+from atlascli.errors import AtlasGetError
+
+
+class AsyncAtlasAPI:
+
+    def __init__(self, api: AtlasAPI = None, max_workers: int = 10, **kwargs):
+        """
+        :param api: an existing AtlasAPI to wrap, one is created if not supplied
+        :param max_workers: number of requests that can be in flight at once
+        :param kwargs: passed to AtlasAPI() when 'api' is not supplied
+        """
+        self._log = logging.getLogger(__name__)
+        if api:
+            self._api = api
+        else:
+            kwargs.setdefault("pool_maxsize", max_workers)
+            self._api = AtlasAPI(**kwargs)
+        self._max_workers = max_workers
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="atlasapi")
+
+    @property
+    def api(self) -> AtlasAPI:
+        return self._api
+
+    def authenticate(self, key: AtlasKey = None):
+        self._api.authenticate(key)
+
+    def is_authenticated(self):
+        return self._api.is_authenticated()
+
+    async def _run(self, func, *args, **kwargs):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, functools.partial(func, *args, **kwargs))
+
+    async def get(self, resource, headers=None, page_num=1, items_per_page=None):
+        return await self._run(self._api.get, resource, headers=headers,
+                               page_num=page_num, items_per_page=items_per_page)
+
+    async def post(self, resource, data):
+        return await self._run(self._api.post, resource, data)
+
+    async def patch(self, resource, patch_doc):
+        return await self._run(self._api.patch, resource, patch_doc)
+
+    async def delete(self, resource):
+        return await self._run(self._api.delete, resource)
+
+    async def atlas_get(self, resource=None, page_num=1, items_per_page=None):
+        return await self._run(self._api.atlas_get, resource, page_num=page_num, items_per_page=items_per_page)
+
+    async def atlas_post(self, resource, data):
+        return await self._run(self._api.atlas_post, resource, data)
+
+    async def atlas_patch(self, resource, data):
+        return await self._run(self._api.atlas_patch, resource, data)
+
+    async def atlas_delete(self, resource):
+        return await self._run(self._api.atlas_delete, resource)
+
+    async def get_resource_by_item(self, resource) -> AsyncGenerator[Dict, None]:
+        self._log.debug(f"get_resource_by_item({resource})")
+
+        doc = await self.atlas_get(resource)
+        while True:
+            if 'results' not in doc:
+                raise AtlasGetError(f"No 'results' field in '{doc}'")
+            for i in doc["results"]:
+                yield i
+            last_link = doc['links'][-1]
+            if "rel" in last_link and "next" == last_link["rel"]:
+                doc = await self.get(last_link["href"])
+            else:
+                break
+
+    async def get_this_organization(self) -> AtlasOrganization:
+        async for org in self.get_resource_by_item("/orgs"):
+            return AtlasOrganization(org)
+
+    async def get_projects(self) -> AsyncGenerator[AtlasProject, None]:
+        async for project in self.get_resource_by_item("/groups"):
+            yield AtlasProject(project)
+
+    async def get_one_project(self, project_id) -> AtlasProject:
+        return AtlasProject(await self.atlas_get(f"/groups/{project_id}"))
+
+    async def get_clusters(self, project_id) -> AsyncGenerator[AtlasCluster, None]:
+        async for cluster in self.get_resource_by_item(f"/groups/{project_id}/clusters"):
+            yield AtlasCluster(project_id, cluster["name"], cluster)
+
+    async def get_one_cluster(self, project_id: str, cluster_name: str) -> AtlasCluster:
+        result = await self.atlas_get(AtlasAPI.cluster_url(project_id, cluster_name))
+        return AtlasCluster(project_id, result["name"], result)
+
+    async def pause_cluster(self, c: AtlasCluster) -> AtlasCluster:
+        result = await self.atlas_patch(AtlasAPI.cluster_url(c.project_id, c.name), {"paused": True})
+        return AtlasCluster(c.project_id, c.name, result)
+
+    async def resume_cluster(self, c: AtlasCluster) -> AtlasCluster:
+        result = await self.atlas_patch(AtlasAPI.cluster_url(c.project_id, c.name), {"paused": False})
+        return AtlasCluster(c.project_id, c.name, result)
+
+    def close(self):
+        self._executor.shutdown(wait=True)
+        self._api.close()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        # shutdown(wait=True) blocks, so run it off the event loop
+        await asyncio.get_running_loop().run_in_executor(None, self.close)
+
+    def __repr__(self):
+        return f"AsyncAtlasAPI(api={self._api!r}, max_workers={self._max_workers})"
@@ -10,18 +10,29 @@ more clusters.
 
 Author:joe@joedrumgoole.com
 """
+import hashlib
 import logging
+import math
 import pprint
 import random
 import string
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 from functools import lru_cache
-from typing import Generator, Dict
+from typing import Generator, Dict, Union
 
 import requests
-from requests.auth import HTTPDigestAuth
+from requests.adapters import HTTPAdapter
 
+from atlascli import jsoncodec
 from atlascli.atlascluster import AtlasCluster
 from atlascli.atlaskey import AtlasKey
+from atlascli.digestauth import PreemptiveDigestAuth
+from atlascli.pagesize import PageSizeController
+from atlascli.responsecache import ResponseCache
+from atlascli.retry import RetryPolicy, TokenBucket
+from atlascli.singleflight import SingleFlight
 from atlascli.atlasorganization import AtlasOrganization
 from atlascli.atlasproject import AtlasProject
 from atlascli.errors import AtlasError, AtlasInitialisationError, AtlasGetError, AtlasPostError, AtlasPatchError, \
@@ -37,22 +48,124 @@ class AtlasAPI:
     ATLAS_HEADERS = {"Accept"       : "application/json",
                      "Content-Type" : "application/json"}
 
-    def __init__(self, page_size: int = 100):
+    AUTO_PAGE_SIZE = "auto"
+
+    def __init__(self,
+                 page_size: Union[int, str] = 100,
+                 pool_connections: int = 10,
+                 pool_maxsize: int = 10,
+                 pool_block: bool = False,
+                 keep_alive: bool = True,
+                 page_workers: int = 1,
+                 max_inflight_pages: int = 4,
+                 retry_policy: RetryPolicy = None,
+                 rate_limit: float = None,
+                 cache: ResponseCache = None,
+                 coalesce: bool = True):
+        """
+        :param page_size: items per page for paginated requests (1..500) or AUTO_PAGE_SIZE
+        to let a PageSizeController pick the page size for each resource
+        :param pool_connections: number of per-host connection pools to cache
+        :param pool_maxsize: maximum number of connections kept open to a single host
+        :param pool_block: block when a host has 'pool_maxsize' connections in use
+        rather than opening (and then discarding) an extra connection
+        :param keep_alive: reuse connections between requests
+        :param page_workers: number of threads used to fetch the pages of a paginated
+        resource concurrently. 1 follows the 'next' links one page at a time
+        :param max_inflight_pages: maximum number of pages fetched but not yet consumed
+        when fetching pages concurrently, this caps the memory used by a listing
+        :param retry_policy: how failed requests are retried, defaults to RetryPolicy()
+        :param rate_limit: maximum requests per second across all threads, None for no limit
+        :param cache: a ResponseCache used to revalidate rather than re-download GETs
+        :param coalesce: when several threads GET the same URL at the same time only
+        send one request and share the response
+        """
         self._auth = None
         self._log = logging.getLogger(__name__)
         self._page_size = page_size
+        self._page_size_controller = None
 
-        if self._page_size < 1 or self._page_size > 500 :
+        if self._page_size == AtlasAPI.AUTO_PAGE_SIZE:
+            self._page_size_controller = PageSizeController()
+        elif self._page_size < 1 or self._page_size > 500 :
             raise AtlasInitialisationError("'page_size' must be between 1 and 500")
 
+        if pool_connections < 1 or pool_maxsize < 1:
+            raise AtlasInitialisationError("'pool_connections' and 'pool_maxsize' must be at least 1")
+
+        if page_workers < 1 or max_inflight_pages < 1:
+            raise AtlasInitialisationError("'page_workers' and 'max_inflight_pages' must be at least 1")
+
+        self._page_workers = page_workers
+        self._max_inflight_pages = max_inflight_pages
+        self._pool_connections = pool_connections
+        self._pool_maxsize = pool_maxsize
+        self._pool_block = pool_block
+        self._keep_alive = keep_alive
+        self._session = self._make_session()
+
+        self._retry_policy = retry_policy if retry_policy else RetryPolicy()
+        self._rate_limiter = TokenBucket(rate_limit) if rate_limit else None
+        self._cache = cache
+        self._single_flight = SingleFlight() if coalesce else None
+
+    def _make_session(self) -> requests.Session:
+        #
+        # One session (and therefore one urllib3 pool manager) is shared by every
+        # verb and every page of a paginated request. urllib3 pools are thread safe
+        # so a single AtlasAPI can be used from multiple threads.
+        #
+        session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=self._pool_connections,
+                              pool_maxsize=self._pool_maxsize,
+                              pool_block=self._pool_block)
+        session.mount("https://", adapter)
+        session.mount("http://", adapter)
+        if not self._keep_alive:
+            session.headers["Connection"] = "close"
+        return session
+
+    @property
+    def session(self) -> requests.Session:
+        return self._session
+
+    def close(self):
+        """
+        Close all pooled connections. The API object can still be used
+        afterwards, a new pool is created on demand.
+        """
+        if self._session is not None:
+            self._session.close()
+            self._session = None
+
+    def _get_session(self) -> requests.Session:
+        if self._session is None:
+            self._session = self._make_session()
+        return self._session
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
     def authenticate(self, key: AtlasKey = None):
         if not key:
             key = AtlasKey.get_from_env()
-        self._auth = HTTPDigestAuth(key.public_key, key.private_key)
+        self._auth = PreemptiveDigestAuth(key.public_key, key.private_key)
 
     def is_authenticated(self):
         return self._auth is not None
 
+    def key_fingerprint(self) -> str:
+        """
+        A short digest identifying the API key in use, safe to write to disk.
+        The public key identifies the key, the private key is never part of it.
+        """
+        if not self.is_authenticated():
+            raise AtlasError("You have not authenticated your Atlas API key")
+        return hashlib.sha256(self._auth.username.encode("utf-8")).hexdigest()[:16]
+
     def set_logging_level(self, level):
         self._log.setLevel(level)
 
@@ -60,6 +173,41 @@ class AtlasAPI:
     def random_name(prefix="ATLASCLI"):
         return prefix +''.join(random.choices(string.ascii_uppercase + string.digits, k=5))
 
+    def _request(self, method: str, url: str, **kwargs) -> requests.Response:
+        """
+        Send a request through the pooled session, waiting for the rate limiter
+        and retrying according to the retry policy. HTTP errors are returned
+        in the response for the caller to raise.
+        """
+        self._retry_policy.record_request()
+        attempt = 0
+        while True:
+            if self._rate_limiter:
+                self._rate_limiter.acquire()
+            retry_after = None
+            try:
+                r = self._get_session().request(method, url, auth=self._auth, **kwargs)
+            except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as e:
+                if not self._retry_policy.should_retry(method, None, attempt):
+                    raise
+                reason = f"{type(e).__name__}"
+            else:
+                if r.status_code not in RetryPolicy.RETRY_STATUSES or \
+                        not self._retry_policy.should_retry(method, r.status_code, attempt):
+                    return r
+                reason = f"HTTP {r.status_code}"
+                retry_after = r.headers.get("Retry-After")
+
+            delay = self._retry_policy.backoff(attempt, retry_after)
+            attempt += 1
+            self._log.warning(f"{method} {url} failed with {reason}, "
+                              f"retry {attempt}/{self._retry_policy.max_retries} in {delay:.2f}s")
+            if self._rate_limiter and retry_after is not None:
+                # hold back every thread, our own retry waits in acquire()
+                self._rate_limiter.hold(delay)
+            else:
+                time.sleep(delay)
+
     def post(self, resource, data):
         self._log.debug(f"post({resource}, {data})")
 
@@ -70,20 +218,19 @@ class AtlasAPI:
             #print(f"requests.post(url={resource}, data={data}, headers={self.ATLAS_HEADERS}, auth={self._auth})")
             #print("printing data")
             #pprint.pprint(data)
-            r = requests.post(url=resource,
+            r = self._request("POST", resource,
                               json=data,
                               #json=json.dumps(data),
-                              headers=self.ATLAS_HEADERS,
-                              auth=self._auth)
+                              headers=self.ATLAS_HEADERS)
             #print(r.url)
             r.raise_for_status()
 
         except requests.exceptions.HTTPError as e:
             error = pprint.pformat(r.json())
-            raise AtlasPostError(error)
-        return r.json()
+            raise AtlasPostError(error, response=r)
+        return jsoncodec.loads(r.content)
 
-    def get(self, resource, headers=None, page_num=1, items_per_page=100):
+    def get(self, resource, headers=None, page_num=1, items_per_page=None):
         self._log.debug(f"get({resource})")
         # Need to use the raw URL when getting linked data
 
@@ -91,6 +238,9 @@ class AtlasAPI:
         if not self.is_authenticated():
             raise AtlasError("You have not authenticated your Atlas API key")
 
+        if items_per_page is None:
+            items_per_page = self.items_per_page(resource)
+
         args =""
         if "itemsPerPage" not in resource:
             args=args+f"?itemsPerPage={items_per_page}"
@@ -102,20 +252,59 @@ class AtlasAPI:
 
         resource = resource + args
 
+        if self._single_flight:
+            key = (self._cache_key(resource), tuple(sorted(headers.items())) if headers else None)
+            doc, shared = self._single_flight.do(key, self._get, resource, headers)
+            if shared:
+                self._log.debug(f"get({resource}) shared an in flight request")
+            return doc
+        return self._get(resource, headers)
+
+    def _get(self, resource, headers):
+        entry = None
+        if self._cache is not None:
+            cache_key = self._cache_key(resource)
+            entry = self._cache.lookup(cache_key)
+            if entry:
+                if self._cache.is_fresh(entry):
+                    self._cache.hit(cache_key, entry, revalidated=False)
+                    return entry.doc()
+                headers = dict(headers) if headers else {}
+                headers.update(entry.conditional_headers())
+
         try:
-            r = requests.get(resource,
-                             headers=headers,
-                             auth=self._auth)
+            r = self._request("GET", resource, headers=headers)
             r.raise_for_status()
         except requests.exceptions.HTTPError as e:
             error = pprint.pformat(r.json())
-            raise AtlasGetError(error)
-        return r.json()
+            raise AtlasGetError(error, response=r)
+
+        if entry and r.status_code == 304:
+            self._log.debug(f"get({resource}) not modified")
+            self._cache.hit(cache_key, entry)
+            return entry.doc()
+
+        doc = jsoncodec.loads(r.content)
+        if self._cache is not None:
+            self._cache.store(cache_key, r)
+        if self._page_size_controller and isinstance(doc, dict) and "results" in doc:
+            self._page_size_controller.observe(resource,
+                                               items=len(doc["results"]),
+                                               total_count=doc.get("totalCount"),
+                                               nbytes=len(r.content),
+                                               seconds=r.elapsed.total_seconds())
+        return doc
+
+    def _cache_key(self, url: str) -> str:
+        # responses are only visible to the key that fetched them
+        if isinstance(self._auth, PreemptiveDigestAuth):
+            return f"{self._auth.username}@{url}"
+        return url
 
     def atlas_post(self, resource, data):
         return self.post(resource=f"{self.ATLAS_BASE_URL}{resource}", data=data)
 
-    def atlas_get(self,resource=None, page_num=1, items_per_page=100):
+    def atlas_get(self,resource=None, page_num=1, items_per_page=None):
         if resource is None:
             resource = ""
         return self.get(f"{self.ATLAS_BASE_URL}{resource}", items_per_page=items_per_page, page_num=page_num)
@@ -132,35 +321,50 @@ class AtlasAPI:
         if not self.is_authenticated():
             raise AtlasError("You have not authenticated your Atlas API key")
         try:
-            p = requests.patch(f"{resource}",
-                               json=patch_doc,
-                               headers=self.ATLAS_HEADERS,
-                               auth=self._auth
-                               )
+            p = self._request("PATCH", f"{resource}",
+                              json=patch_doc,
+                              headers=self.ATLAS_HEADERS
+                              )
             p.raise_for_status()
         except requests.exceptions.HTTPError as e:
             error = pprint.pformat(p.json())
-            raise AtlasPatchError(error)
-        return p.json()
+            raise AtlasPatchError(error, response=p)
+        return jsoncodec.loads(p.content)
 
     def delete(self, resource):
         self._log.debug(f"delete({resource})")
         if not self.is_authenticated():
             raise AtlasError("You have not authenticated your Atlas API key")
         try:
-            d = requests.delete(f"{resource}", headers=self.ATLAS_HEADERS, auth=self._auth)
+            d = self._request("DELETE", f"{resource}", headers=self.ATLAS_HEADERS)
             d.raise_for_status()
         except requests.exceptions.HTTPError as e:
-            raise AtlasDeleteError(e, d.json()["detail"])
+            raise AtlasDeleteError(e, d.json()["detail"], response=d)
 
-        return d.json()
+        return jsoncodec.loads(d.content)
 
-    def get_resource_by_item(self, resource):
+    def get_resource_by_item(self, resource, concurrent: bool = None):
+        """
+        Yield each item of a paginated resource in order.
+
+        :param resource: the resource path relative to ATLAS_BASE_URL
+        :param concurrent: fetch pages 2..N concurrently using 'totalCount' from
+        the first page. Defaults to True when the API has more than one page worker.
+        """
 
         self._log.debug(f"get_resource_by_item({resource})")
 
-        doc = self.atlas_get(resource)
+        if concurrent is None:
+            concurrent = self._page_workers > 1
+
+        items_per_page = self.items_per_page(resource)
+        doc = self.atlas_get(resource, items_per_page=items_per_page)
         yield from self._get_results(doc)
+
+        if concurrent and "totalCount" in doc:
+            yield from self._get_remaining_pages(resource, doc["totalCount"], items_per_page)
+            return
+
         links = doc['links']
         last_link = links[-1]
 
@@ -170,6 +374,32 @@ class AtlasAPI:
             links = doc['links']
             last_link = links[-1]
 
+    def _get_remaining_pages(self, resource, total_count: int, items_per_page: int):
+        #
+        # Pages are requested by 'pageNum' and consumed in order. At most
+        # 'max_inflight_pages' pages are requested ahead of the consumer.
+        #
+        pages = math.ceil(total_count / items_per_page)
+        if pages < 2:
+            return
+
+        self._log.debug(f"fetching pages 2..{pages} of {resource} with {self._page_workers} workers")
+        window = deque()
+        next_page = 2
+        with ThreadPoolExecutor(max_workers=min(self._page_workers, pages - 1)) as executor:
+            try:
+                while next_page <= pages or window:
+                    while next_page <= pages and len(window) < self._max_inflight_pages:
+                        window.append(executor.submit(self.atlas_get, resource,
+                                                      page_num=next_page,
+                                                      items_per_page=items_per_page))
+                        next_page += 1
+                    doc = window.popleft().result()
+                    yield from self._get_results(doc)
+            finally:
+                for f in window:
+                    f.cancel()
+
     def get_resource_by_page(self, resource):
         """
         return each array of resources as a single
@@ -198,6 +428,32 @@ class AtlasAPI:
 
         return results, next_link
 
+    def items_per_page(self, resource: str) -> int:
+        """
+        The 'itemsPerPage' to request for 'resource'
+        """
+        if self._page_size_controller:
+            return self._page_size_controller.choose(resource)
+        return self._page_size
+
+    def stats(self) -> Dict:
+        """
+        Counters and decisions useful when debugging performance
+        """
+        if self._page_size_controller:
+            page_size = self._page_size_controller.stats()
+        else:
+            page_size = {"items_per_page": self._page_size}
+        stats = {"page_size": page_size,
+                 "retry": self._retry_policy.stats()}
+        if self._rate_limiter:
+            stats["rate_limit"] = self._rate_limiter.stats()
+        if self._cache is not None:
+            stats["cache"] = self._cache.stats()
+        if self._single_flight:
+            stats["coalesced"] = self._single_flight.stats()
+        return stats
+
     def _get_results(self, doc):
         if 'results' in doc:
             for i in doc["results"]:
@@ -316,6 +572,16 @@ class AtlasAPI:
         for cluster in self.get_resource_by_item(f"/groups/{project_id}/clusters"):
             yield AtlasCluster(project_id, cluster["name"], cluster)
 
+    def get_all_clusters(self) -> Generator[Dict, None, None]:
+        """
+        https://docs.atlas.mongodb.com/reference/api/all-clusters/
+        GET /api/atlas/v1.0/clusters
+        curl -u "{PUBLIC-KEY}:{PRIVATE-KEY}" --digest "https://cloud.mongodb.com/api/atlas/v1.0/clusters"
+        :return: a generator of one document per project the key can see, each with 'groupId',
+        'groupName', 'orgId' and a 'clusters' list summarising that project's clusters
+        """
+        yield from self.get_resource_by_item("/clusters")
+
     def delete_cluster(self, c: AtlasCluster) -> Dict:
         """
         DELETE /api/atlas/v1.0/groups/{GROUP-ID}/clusters/{CLUSTER-NAME}
@@ -354,7 +620,8 @@ class AtlasAPI:
         return AtlasCluster(c.project_id, c.name, result)
 
     def __repr__(self):
-        return f"AtlasAPI(page_size={self._page_size})"
+        return f"AtlasAPI(page_size={self._page_size}, pool_connections={self._pool_connections}, " \
+               f"pool_maxsize={self._pool_maxsize})"
 
 
 
@@ -10,6 +10,28 @@ from atlascli.atlasresource import AtlasResource
 from atlascli.clusterid import ClusterID
 
 
+def cluster_status(state: str, paused: bool) -> str:
+    """
+    A colourised description of a cluster's state for summaries
+    """
+    if state == "REPAIRING":
+        if paused:
+            return f"{Fore.LIGHTRED_EX}pausing...{Fore.RESET}"
+        else:
+            return f"{Fore.LIGHTRED_EX}resuming...{Fore.RESET}"
+    elif state == "CREATING":
+        return f"{Fore.LIGHTRED_EX}creating...{Fore.RESET}"
+    elif state == "DELETING":
+        return f"{Fore.LIGHTRED_EX}deleting...{Fore.RESET}"
+    elif state == "IDLE":
+        if paused:
+            return f"{Fore.LIGHTBLUE_EX}paused{Fore.RESET}"
+        else:
+            return f"{Fore.RED}running{Fore.RESET}"
+    else:
+        return f"{state}"
+
+
 class AtlasCluster(AtlasResource):
 
 
@@ -86,22 +108,7 @@ class AtlasCluster(AtlasResource):
         return f"{pprint.pformat(self.resource)}"
 
     def status(self) -> str:
-        if self.resource["stateName"] == "REPAIRING":
-            if self.is_paused():
-                return f"{Fore.LIGHTRED_EX}pausing...{Fore.RESET}"
-            else:
-                return f"{Fore.LIGHTRED_EX}resuming...{Fore.RESET}"
-        elif self.resource["stateName"] == "CREATING":
-            return f"{Fore.LIGHTRED_EX}creating...{Fore.RESET}"
-        elif self.resource["stateName"] == "DELETING":
-            return f"{Fore.LIGHTRED_EX}deleting...{Fore.RESET}"
-        elif self.resource["stateName"] == "IDLE":
-            if self.is_paused():
-                return f"{Fore.LIGHTBLUE_EX}paused{Fore.RESET}"
-            else:
-                return f"{Fore.RED}running{Fore.RESET}"
-        else:
-            return f"{self.resource['stateName']}"
+        return cluster_status(self.resource["stateName"], self.is_paused())
 
     @property
     def state(self):
@@ -113,6 +120,12 @@ class AtlasCluster(AtlasResource):
     def instance_size(self):
         return self.resource["providerSettings"]["instanceSizeName"]
 
+    def provider_name(self):
+        return self.resource["providerSettings"]["providerName"]
+
+    def region_name(self):
+        return self.resource["providerSettings"].get("regionName")
+
     def pretty_instance_size(self):
         return f"{Fore.LIGHTWHITE_EX}{self.instance_size()}{Fore.RESET}"
 
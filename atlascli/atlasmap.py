@@ -1,12 +1,23 @@
 import itertools
-from typing import Dict, List, Generator
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Dict, List, Generator, Optional
 
+from requests.exceptions import RequestException
+
+from atlascli import jsoncodec
 from atlascli.atlasapi import AtlasAPI
 from atlascli.atlascluster import AtlasCluster
 from atlascli.atlaskey import AtlasKey
 from atlascli.atlasorganization import AtlasOrganization
 from atlascli.atlasproject import AtlasProject
 from atlascli.clusterid import ClusterID
+from atlascli.clusterquery import ClusterIndex, Condition, parse_query
+from atlascli.errors import AtlasError
+from atlascli.records import ClusterRecord, ProjectRecord
 
 
 class AtlasMap:
@@ -18,26 +29,81 @@ class AtlasMap:
     # Each cluster represents a group of machines/nodes. Clusters may be sharded.
     #
 
-    def __init__(self, org: AtlasOrganization = None, api: AtlasAPI = None, populate: bool = False):
+    PROJECTS_STRATEGY = "projects"
+    # list the clusters of every project
+    ORG_CLUSTERS_STRATEGY = "org"
+    # use the organization wide cluster summary to only list the clusters
+    # of projects that have some
+    STRATEGIES = (PROJECTS_STRATEGY, ORG_CLUSTERS_STRATEGY)
+
+    SNAPSHOT_VERSION = 1
+
+    def __init__(self, org: AtlasOrganization = None, api: AtlasAPI = None, populate: bool = False,
+                 crawl_workers: int = 1, strategy: str = PROJECTS_STRATEGY,
+                 snapshot_dir: str = None, snapshot_ttl: float = 3600, refresh: bool = False,
+                 compact: bool = False):
+        """
+        :param org: the organization this map describes
+        :param api: an authenticated AtlasAPI
+        :param populate: crawl the organization now rather than on first use
+        :param crawl_workers: number of projects whose clusters are listed concurrently
+        :param strategy: PROJECTS_STRATEGY or ORG_CLUSTERS_STRATEGY
+        :param snapshot_dir: save the map here after each crawl and start from the
+        saved snapshot rather than crawling the organization
+        :param snapshot_ttl: seconds a snapshot is used as is. An older snapshot is
+        still used but a crawl is started in the background to replace it
+        :param refresh: ignore any snapshot and crawl the organization
+        :param compact: keep ProjectRecords and ClusterRecords rather than the full
+        documents. The full document is fetched from Atlas when it is asked for.
+        """
 
         self._org = org
         self._populate = populate
-        self._clusters : List[AtlasCluster] = None
-        self._project_map : Dict[str, Dict] = None  # map of all project ids to projects
+        self._log = logging.getLogger(__name__)
+        self._lock = threading.RLock()
+        self._crawl_workers = crawl_workers
+        if strategy not in AtlasMap.STRATEGIES:
+            raise ValueError(f"'strategy' must be one of {AtlasMap.STRATEGIES}")
+        self._strategy = strategy
+        self._compact = compact
+        self._crawl_errors: Dict[str, Exception] = {}  # project id to the error listing its clusters
+
+        self._snapshot_dir = snapshot_dir
+        self._snapshot_ttl = snapshot_ttl
+        self._use_snapshot = snapshot_dir is not None and not refresh
+        self._snapshot_age: Optional[float] = None  # age of the snapshot the map was loaded from
+        self._refresh_thread: Optional[threading.Thread] = None
+        self._snapshot_dirty = False  # the map has changed since the snapshot was saved
+
+        self._project_map : Dict[str, AtlasProject] = None  # map of all project ids to projects
+        self._project_name_index: Dict[str, List[str]] = {}  # project name to project ids
 
         self._project_cluster_map: Dict[str, Dict[str, AtlasCluster]] = {}
         # map from project id to a dict of clusters
         # because cluster names are not unique across and organization
         # we have to key each collection of clusters under a specific project id.
+        # self._project_cluster_map[project_id][name] is the (project_id, name) index.
+        self._cluster_map_populated = False
+
+        self._clusters : List[AtlasCluster] = None
+        self._cluster_name_index: Dict[str, List[AtlasCluster]] = {}  # cluster name to clusters
+        self._cluster_index = ClusterIndex()  # secondary indexes for query()
 
+        # Projects and clusters fetched one at a time by resolve_project() and
+        # resolve_cluster() before the organization has been crawled.
+        self._resolved_projects: Dict[str, AtlasProject] = {}
+        self._resolved_clusters: Dict[tuple, AtlasCluster] = {}  # (project id, name) to cluster
+        self._listed_at: Dict[str, float] = {}  # project id to when refresh_project_clusters last listed it
 
         if api:
             self._api = api
         else:
             self._api = AtlasAPI()
+        self._project_loader = self._api.get_one_project
+        self._cluster_loader = self._api.get_one_cluster
 
         if self._populate:
-            self.populate()
+            self.populate_cluster_map()
 
     def authenticate(self, k: AtlasKey = None):
         self._api.authenticate(k)
@@ -46,26 +112,202 @@ class AtlasMap:
     def api(self):
         return self._api
 
-    @property
-    def projects(self):
+    #
+    # Indexes are rebuilt whenever a map is replaced, so every lookup
+    # below is a dict access rather than a scan of the organization.
+    #
+
+    def _set_projects(self, project_map: Dict[str, AtlasProject]):
+        name_index = {}
+        for project_id, project in project_map.items():
+            name_index.setdefault(project.name, []).append(project_id)
+        with self._lock:
+            self._project_map = project_map
+            self._project_name_index = name_index
+            self._resolved_projects = {}
+
+    def _set_clusters(self, project_cluster_map: Dict[str, Dict[str, AtlasCluster]]):
+        clusters = []
+        name_index = {}
+        for cluster_dict in project_cluster_map.values():
+            for cluster in cluster_dict.values():
+                clusters.append(cluster)
+                name_index.setdefault(cluster.name, []).append(cluster)
+        cluster_index = ClusterIndex(clusters)
+        with self._lock:
+            self._project_cluster_map = project_cluster_map
+            self._clusters = clusters
+            self._cluster_index = cluster_index
+            self._cluster_name_index = name_index
+            self._cluster_map_populated = True
+            self._resolved_clusters = {}
+
+    def _project_record(self, project: AtlasProject):
+        if self._compact and isinstance(project, AtlasProject):
+            return ProjectRecord.from_project(project, self._project_loader)
+        return project
+
+    def _cluster_record(self, cluster: AtlasCluster):
+        if self._compact and isinstance(cluster, AtlasCluster):
+            return ClusterRecord.from_cluster(cluster, self._cluster_loader)
+        return cluster
+
+    @staticmethod
+    def _doc(item) -> Dict:
+        if isinstance(item, (ProjectRecord, ClusterRecord)):
+            return item.to_dict()
+        return item.resource
+
+    def _get_project_map(self) -> Dict[str, AtlasProject]:
         if self._project_map is None:
-            self._project_map = {x.id: x for x in self._api.get_projects()}
-        return list(self._project_map.values())
+            if not self._start_from_snapshot():
+                self._set_projects({x.id: self._project_record(x) for x in self._api.get_projects()})
+        return self._project_map
 
-    @property
-    def clusters(self):
-        if self._clusters is None:
-            clusters = []
-            if len(self._project_cluster_map) == 0:
+    def _ensure_cluster_map(self):
+        if not self._cluster_map_populated:
+            if not self._start_from_snapshot():
                 self.populate_cluster_map()
 
-            # return list(itertools.chain.from_iterable(self._project_cluster_map.values()))
-            for project_id, cluster_dict in self._project_cluster_map.items():
-                for cluster_name, cluster in cluster_dict.items():
-                    clusters.append(cluster)
+    #
+    # Snapshots
+    #
 
-            self._clusters = clusters
+    def snapshot_path(self) -> str:
+        org_id = self._org.id if self._org else "default"
+        return os.path.join(self._snapshot_dir, f"{org_id}-{self._api.key_fingerprint()}.json")
+
+    @property
+    def snapshot_age(self) -> Optional[float]:
+        """
+        Age in seconds of the snapshot the map was loaded from, None if it was crawled
+        """
+        return self._snapshot_age
+
+    def save_snapshot(self):
+        if not self._snapshot_dir or not self._cluster_map_populated:
+            return
+        with self._lock:
+            self._snapshot_dirty = False
+            doc = {"version": AtlasMap.SNAPSHOT_VERSION,
+                   "org_id": self._org.id if self._org else None,
+                   "fingerprint": self._api.key_fingerprint(),
+                   "saved_at": time.time(),
+                   "projects": [self._doc(p) for p in self._project_map.values()],
+                   "clusters": {pid: [self._doc(c) for c in clusters.values()]
+                                for pid, clusters in self._project_cluster_map.items()}}
+        path = self.snapshot_path()
+        os.makedirs(self._snapshot_dir, exist_ok=True)
+        tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            jsoncodec.dump(doc, f)
+        os.replace(tmp, path)
+        self._log.debug(f"saved snapshot {path}")
+
+    def flush_snapshot(self):
+        """
+        Save the snapshot if the map has changed since it was saved. Changes
+        are applied to the map as they are made but only saved here, so a
+        command that changes many clusters rewrites the snapshot once.
+        """
+        with self._lock:
+            dirty = self._snapshot_dirty
+        if dirty:
+            self.save_snapshot()
+
+    def load_snapshot(self) -> Optional[float]:
+        """
+        Replace the map with the saved snapshot for this organization and key.
+
+        :return: the age of the snapshot in seconds or None if there is no usable snapshot
+        """
+        path = self.snapshot_path()
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                doc = jsoncodec.load(f)
+            if doc.get("version") != AtlasMap.SNAPSHOT_VERSION or \
+                    doc.get("fingerprint") != self._api.key_fingerprint() or \
+                    doc.get("org_id") != (self._org.id if self._org else None):
+                self._log.debug(f"ignoring snapshot {path} taken with a different key or organization")
+                return None
+            if self._compact:
+                project_map = {p["id"]: ProjectRecord.from_dict(p, self._project_loader) for p in doc["projects"]}
+                project_cluster_map = {pid: {c["name"]: ClusterRecord.from_dict(pid, c, self._cluster_loader)
+                                             for c in clusters}
+                                       for pid, clusters in doc["clusters"].items()}
+            else:
+                project_map = {p["id"]: AtlasProject(p) for p in doc["projects"]}
+                project_cluster_map = {pid: {c["name"]: AtlasCluster(pid, c["name"], c) for c in clusters}
+                                       for pid, clusters in doc["clusters"].items()}
+        except FileNotFoundError:
+            return None
+        except (ValueError, KeyError, TypeError, OSError) as e:
+            self._log.warning(f"ignoring unreadable snapshot {path}: {e}")
+            return None
+
+        with self._lock:
+            self._set_projects(project_map)
+            self._set_clusters(project_cluster_map)
+            self._snapshot_age = max(0.0, time.time() - doc["saved_at"])
+        return self._snapshot_age
+
+    def _start_from_snapshot(self) -> bool:
+        #
+        # Load the snapshot the first time the map is needed. A snapshot older
+        # than the TTL is served while a crawl replaces it in the background.
+        #
+        if not self._use_snapshot:
+            return False
+        self._use_snapshot = False
+        age = self.load_snapshot()
+        if age is None:
+            return False
+        if age > self._snapshot_ttl:
+            self._log.debug(f"snapshot is {age:.0f}s old, refreshing in the background")
+            self.refresh(background=True)
+        return True
+
+    def refresh(self, background: bool = False):
+        """
+        Crawl the organization again. A background refresh runs in a daemon
+        thread so a short command does not wait for the crawl when it exits.
+        The snapshot is replaced atomically, so a refresh cut short leaves the
+        previous snapshot in place to be refreshed by a later run. Use
+        wait_for_refresh() to wait for it.
+        """
+        if not background:
+            self.populate_cluster_map()
+            return
+        with self._lock:
+            if self._refresh_thread and self._refresh_thread.is_alive():
+                return
+            self._refresh_thread = threading.Thread(target=self._background_refresh, name="atlasmap-refresh",
+                                                    daemon=True)
+            self._refresh_thread.start()
+
+    def _background_refresh(self):
+        try:
+            self.populate_cluster_map()
+        except Exception as e:
+            self._log.warning(f"background refresh of the organization failed: {e}")
+
+    def wait_for_refresh(self, timeout: float = None) -> bool:
+        """
+        :return: True if no background refresh is running when this returns
+        """
+        thread = self._refresh_thread
+        if thread:
+            thread.join(timeout)
+            return not thread.is_alive()
+        return True
 
+    @property
+    def projects(self):
+        return list(self._get_project_map().values())
+
+    @property
+    def clusters(self):
+        self._ensure_cluster_map()
         return self._clusters
 
     @property
@@ -77,30 +319,137 @@ class AtlasMap:
 
     @property
     def project_cluster_map(self):
-        if len(self._project_cluster_map) == 0:
-            self.populate_cluster_map()
+        self._ensure_cluster_map()
         return self._project_cluster_map
 
-    def populate_cluster_map(self):
+    @property
+    def crawl_errors(self) -> Dict[str, Exception]:
+        """
+        Projects whose clusters could not be listed by the last crawl
+        """
+        return dict(self._crawl_errors)
+
+    def populate_cluster_map(self, workers: int = None):
+        """
+        Crawl the organization. Each project's clusters are listed on a thread
+        pool of 'workers' threads as the pages of projects arrive. A project
+        whose clusters cannot be listed is reported in crawl_errors and keeps
+        the clusters it had before, the rest of the map is still replaced.
+
+        With the ORG_CLUSTERS_STRATEGY projects without clusters are not listed.
+        """
+        if workers is None:
+            workers = self._crawl_workers
         new_projects_map = {}
         new_project_cluster_map = {}
-        for project in self._api.get_projects():
-            new_projects_map[project.id] = project
-            new_project_cluster_map[project.id] = {}
-            for cluster in self._api.get_clusters(project.id):
-                new_project_cluster_map[project.id][cluster.name] = cluster
-            assert len(new_projects_map) == len(new_project_cluster_map)
+        errors = {}
+
+        occupied = None
+        if self._strategy == AtlasMap.ORG_CLUSTERS_STRATEGY:
+            occupied = self._occupied_project_ids()
+
+        with ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix="atlasmap") as executor:
+            futures = {}
+            for project in self._api.get_projects():
+                new_projects_map[project.id] = self._project_record(project)
+                if occupied is None or project.id in occupied:
+                    futures[executor.submit(self._list_clusters, project.id)] = project.id
+                else:
+                    new_project_cluster_map[project.id] = {}
+
+            for future in as_completed(futures):
+                project_id = futures[future]
+                try:
+                    new_project_cluster_map[project_id] = future.result()
+                except RequestException as e:
+                    self._log.warning(f"Could not list the clusters in project {project_id}: {e}")
+                    errors[project_id] = e
+                    new_project_cluster_map[project_id] = self._project_cluster_map.get(project_id, {})
+
+        assert len(new_projects_map) == len(new_project_cluster_map)
+
+        with self._lock:
+            self._set_projects(new_projects_map)
+            self._set_clusters(new_project_cluster_map)
+            self._crawl_errors = errors
+            self._snapshot_age = None
+            self._use_snapshot = False
+
+        self.save_snapshot()
+
+    def _occupied_project_ids(self):
+        """
+        The ids of the projects that have clusters according to the organization
+        wide cluster summary, or None if the summary is not available.
+        """
+        try:
+            return {entry["groupId"] for entry in self._api.get_all_clusters() if entry.get("clusters")}
+        except AtlasError as e:
+            self._log.warning(f"Could not list the organization's clusters, listing every project instead: {e}")
+            return None
+
+    def _list_clusters(self, project_id: str) -> Dict[str, AtlasCluster]:
+        return {cluster.name: self._cluster_record(cluster) for cluster in self._api.get_clusters(project_id)}
+
+    #
+    # Demand-driven resolution. A fully qualified project id or
+    # project id:cluster name can be checked with one GET each rather than
+    # by crawling the organization, so these only use the maps once they
+    # have been loaded.
+    #
 
-        self._project_cluster_map = new_project_cluster_map
-        self._project_map = new_projects_map
+    def resolve_project(self, project_id: str) -> Optional[AtlasProject]:
+        """
+        :return: the project or None if there is no such project in this organization
+        """
+        if self._project_map is None:
+            self._start_from_snapshot()
+        if self._project_map is not None:
+            return self._project_map.get(project_id)
+        with self._lock:
+            project = self._resolved_projects.get(project_id)
+        if project is None:
+            try:
+                project = self._project_record(self._api.get_one_project(project_id))
+            except AtlasError as e:
+                if self._is_not_found(e):
+                    return None
+                raise
+            with self._lock:
+                if self._project_map is None:
+                    self._resolved_projects[project_id] = project
+        return project
+
+    def resolve_cluster(self, project_id: str, cluster_name: str) -> Optional[AtlasCluster]:
+        """
+        :return: the cluster or None if there is no such project or cluster
+        """
+        if not self._cluster_map_populated:
+            self._start_from_snapshot()
+        if self._cluster_map_populated:
+            return self._project_cluster_map.get(project_id, {}).get(cluster_name)
+        with self._lock:
+            cluster = self._resolved_clusters.get((project_id, cluster_name))
+        if cluster is None:
+            if self.resolve_project(project_id) is None:
+                return None
+            try:
+                cluster = self._cluster_record(self._api.get_one_cluster(project_id, cluster_name))
+            except AtlasError as e:
+                if self._is_not_found(e):
+                    return None
+                raise
+            with self._lock:
+                if not self._cluster_map_populated:
+                    self._resolved_clusters[(project_id, cluster_name)] = cluster
+        return cluster
 
     def is_project_id(self, project_id: str) -> bool:
-        return project_id in [ x.id for x in self.projects]
+        return self.resolve_project(project_id) is not None
 
     def is_cluster_name(self, cluster_name: str) -> bool:
-        # print(f"is_cluster_name({cluster_name})")
-        # pprint.pprint([x.name for x in self._clusters])
-        return any([x.name == cluster_name for x in self.clusters])
+        self._ensure_cluster_map()
+        return cluster_name in self._cluster_name_index
 
     def is_unique_cluster(self, cluster_name: str) -> bool:
         l = self.get_cluster(cluster_name)
@@ -114,33 +463,32 @@ class AtlasMap:
             yield i.name
 
     def get_cluster_project_ids(self, cluster_name: str):
-        project_ids = []
-        for project_id, cluster_map in self.project_cluster_map.items():
-            for name, cluster in cluster_map.items():
-                if name == cluster_name:
-                    project_ids.append(project_id)
-        return project_ids
+        self._ensure_cluster_map()
+        return [x.project_id for x in self._cluster_name_index.get(cluster_name, [])]
 
     def get_project_ids(self) -> List[str]:
-        return [ x.id for x in self.projects]
+        return list(self._get_project_map().keys())
 
     def get_one_project(self, project_id:str) -> AtlasProject:
-        return self._project_map[project_id]
+        project = self.resolve_project(project_id)
+        if project is None:
+            raise KeyError(project_id)
+        return project
 
     def get_projects(self) -> Dict[str, AtlasProject]:
         return self._project_map
 
     def get_project_id(self, project_name: str):
-        for i in self.projects:
-            #print(i.name)
-            if i.name == project_name:
-                return i.id
+        self._get_project_map()
+        project_ids = self._project_name_index.get(project_name)
+        if project_ids:
+            return project_ids[0]
         return None
 
     def get_project_name(self, project_id: str):
-        for i in self.projects:
-            if i.id == project_id:
-                return i.name
+        project = self._get_project_map().get(project_id)
+        if project:
+            return project.name
         return None
 
     def get_cluster(self, cluster_name: str, project_id: object = None) -> List[AtlasCluster]:
@@ -148,14 +496,13 @@ class AtlasMap:
         # Cluster names are not unique so we might get more than one cluster
         # when we request a cluster.
         #
-        clusters = []
-        for i in self.clusters:
-            if i.name == cluster_name:
-                if project_id is None:
-                    clusters.append(i)
-                elif project_id == i.project_id:
-                    clusters.append(i)
-        return clusters
+        if project_id is None:
+            self._ensure_cluster_map()
+            return list(self._cluster_name_index.get(cluster_name, []))
+        cluster = self.resolve_cluster(project_id, cluster_name)
+        if cluster:
+            return [cluster]
+        return []
 
     def get_one_cluster(self, project_id:str, cluster_name:str) -> AtlasCluster:
         clist = self.get_cluster(cluster_name, project_id)
@@ -165,16 +512,237 @@ class AtlasMap:
             assert len(clist) == 1
             return clist[0]
 
+    def query(self, conditions: List) -> List[AtlasCluster]:
+        """
+        The clusters that satisfy every condition, see clusterquery for the syntax.
+        A project condition may name the project rather than give its id.
+
+        :param conditions: condition strings such as "size>=M40" or parsed Conditions
+        """
+        parsed = []
+        for condition in conditions:
+            if isinstance(condition, Condition):
+                parsed.append(condition)
+            else:
+                parsed.extend(parse_query([condition]))
+        self._ensure_cluster_map()
+        conditions = []
+        for condition in parsed:
+            if condition.field == "project":
+                project_ids = []
+                for value in condition.values:
+                    project_ids.extend(self._project_name_index.get(value, [value]))
+                condition = Condition(condition.field, condition.op, project_ids)
+            conditions.append(condition)
+        with self._lock:
+            keys = self._cluster_index.select(conditions)
+            return [self._project_cluster_map[pid][name] for pid, name in sorted(keys)]
+
     def get_clusters(self, project_id: str = None) -> Generator[AtlasCluster, None, None]:
-        for c in self.clusters:
-            if project_id is None:
-                yield c
-            elif project_id == c.project_id:
-                yield c
-
-    def create_cluster(self, project_id:str, cluster_name: str) -> AtlasCluster:
-        c = self._api.create_cluster(project_id, cluster_name)
-        self._project_cluster_map[project_id]
+        if project_id is None:
+            yield from self.clusters
+        else:
+            self._ensure_cluster_map()
+            yield from list(self._project_cluster_map.get(project_id, {}).values())
+
+    #
+    # Targeted refreshes and write-through updates. Each one replaces the
+    # affected entries copy-on-write under the lock so the map and its
+    # indexes stay consistent without crawling the organization again.
+    #
+
+    def apply_project(self, project: AtlasProject) -> AtlasProject:
+        project = self._project_record(project)
+        with self._lock:
+            if self._project_map is None:
+                self._resolved_projects[project.id] = project
+                return project
+            project_map = dict(self._project_map)
+            project_map[project.id] = project
+            self._set_projects(project_map)
+            self._snapshot_dirty = True
+            if self._cluster_map_populated and project.id not in self._project_cluster_map:
+                self._project_cluster_map = dict(self._project_cluster_map)
+                self._project_cluster_map[project.id] = {}
+        return project
+
+    def remove_project(self, project_id: str):
+        with self._lock:
+            if self._cluster_map_populated:
+                for cluster in list(self._project_cluster_map.get(project_id, {}).values()):
+                    self.remove_cluster(project_id, cluster.name)
+            self._resolved_projects.pop(project_id, None)
+            self._resolved_clusters = {k: v for k, v in self._resolved_clusters.items() if k[0] != project_id}
+            if self._project_map is None:
+                return
+            project_map = dict(self._project_map)
+            project_map.pop(project_id, None)
+            self._set_projects(project_map)
+            self._snapshot_dirty = True
+            if project_id in self._project_cluster_map:
+                self._project_cluster_map = dict(self._project_cluster_map)
+                del self._project_cluster_map[project_id]
+
+    def apply_cluster(self, cluster: AtlasCluster) -> AtlasCluster:
+        """
+        Add or replace a single cluster in the map, typically with the document
+        returned by a PATCH or POST.
+        """
+        cluster = self._cluster_record(cluster)
+        with self._lock:
+            if not self._cluster_map_populated:
+                self._resolved_clusters[(cluster.project_id, cluster.name)] = cluster
+                return cluster
+            old = self._project_cluster_map.get(cluster.project_id, {}).get(cluster.name)
+
+            project_clusters = dict(self._project_cluster_map.get(cluster.project_id, {}))
+            project_clusters[cluster.name] = cluster
+            project_cluster_map = dict(self._project_cluster_map)
+            project_cluster_map[cluster.project_id] = project_clusters
+
+            named = [c for c in self._cluster_name_index.get(cluster.name, []) if c is not old]
+            named.append(cluster)
+            name_index = dict(self._cluster_name_index)
+            name_index[cluster.name] = named
+
+            if old is None:
+                clusters = self._clusters + [cluster]
+            else:
+                clusters = [cluster if c is old else c for c in self._clusters]
+
+            self._project_cluster_map = project_cluster_map
+            self._cluster_name_index = name_index
+            self._clusters = clusters
+            self._cluster_index.add(cluster)
+            self._snapshot_dirty = True
+        return cluster
+
+    def remove_cluster(self, project_id: str, cluster_name: str):
+        with self._lock:
+            self._resolved_clusters.pop((project_id, cluster_name), None)
+            if not self._cluster_map_populated:
+                return
+            old = self._project_cluster_map.get(project_id, {}).get(cluster_name)
+            if old is None:
+                return
+
+            project_clusters = dict(self._project_cluster_map[project_id])
+            del project_clusters[cluster_name]
+            project_cluster_map = dict(self._project_cluster_map)
+            project_cluster_map[project_id] = project_clusters
+
+            name_index = dict(self._cluster_name_index)
+            named = [c for c in name_index[cluster_name] if c is not old]
+            if named:
+                name_index[cluster_name] = named
+            else:
+                del name_index[cluster_name]
+
+            self._project_cluster_map = project_cluster_map
+            self._cluster_name_index = name_index
+            self._clusters = [c for c in self._clusters if c is not old]
+            self._cluster_index.remove(project_id, cluster_name)
+            self._snapshot_dirty = True
+
+    @staticmethod
+    def _is_not_found(e: AtlasError) -> bool:
+        return e.response is not None and e.response.status_code == 404
+
+    def refresh_cluster(self, project_id: str, cluster_name: str) -> Optional[AtlasCluster]:
+        """
+        Read one cluster from Atlas into the map.
+
+        :return: the refreshed cluster or None if it no longer exists
+        """
+        try:
+            cluster = self._api.get_one_cluster(project_id, cluster_name)
+        except AtlasError as e:
+            if self._is_not_found(e):
+                self.remove_cluster(project_id, cluster_name)
+                return None
+            raise
+        return self.apply_cluster(cluster)
+
+    def refresh_project(self, project_id: str) -> Optional[AtlasProject]:
+        """
+        Read one project and its clusters from Atlas into the map.
+
+        :return: the refreshed project or None if it no longer exists
+        """
+        try:
+            project = self._api.get_one_project(project_id)
+        except AtlasError as e:
+            if self._is_not_found(e):
+                self.remove_project(project_id)
+                return None
+            raise
+        clusters = self._list_clusters(project_id)
+        with self._lock:
+            self.apply_project(project)
+            self._replace_project_clusters(project_id, clusters)
+        return project
+
+    def _replace_project_clusters(self, project_id: str, clusters: Dict[str, AtlasCluster]):
+        with self._lock:
+            known = list(self._project_cluster_map.get(project_id, {}).values()) + \
+                [c for (pid, _), c in self._resolved_clusters.items() if pid == project_id]
+            for cluster in known:
+                if cluster.name not in clusters:
+                    self.remove_cluster(project_id, cluster.name)
+            for cluster in clusters.values():
+                self.apply_cluster(cluster)
+            self._crawl_errors.pop(project_id, None)
+            self._listed_at[project_id] = time.monotonic()
+
+    def refresh_project_clusters(self, project_ids: List[str], workers: int = None, max_age: float = 0):
+        """
+        List the clusters of each project from Atlas again, concurrently, and
+        update the map. This is one request per project however many of its
+        clusters are wanted.
+
+        :param max_age: skip projects whose clusters were listed this many seconds ago or less
+        """
+        now = time.monotonic()
+        with self._lock:
+            stale = [pid for pid in dict.fromkeys(project_ids)
+                     if max_age <= 0 or now - self._listed_at.get(pid, float("-inf")) > max_age]
+        if not stale:
+            return
+        if workers is None:
+            workers = self._crawl_workers
+        with ThreadPoolExecutor(max_workers=max(1, min(workers, len(stale))),
+                                thread_name_prefix="atlasmap") as executor:
+            listings = dict(zip(stale, executor.map(self._list_clusters, stale)))
+        for project_id, clusters in listings.items():
+            self._replace_project_clusters(project_id, clusters)
+
+    def pause_cluster(self, cluster: AtlasCluster) -> AtlasCluster:
+        return self._write_through(self._api.pause_cluster(cluster))
+
+    def resume_cluster(self, cluster: AtlasCluster) -> AtlasCluster:
+        return self._write_through(self._api.resume_cluster(cluster))
+
+    def modify_cluster(self, cluster: AtlasCluster, modifications: Dict) -> AtlasCluster:
+        return self._write_through(self._api.modify_cluster(cluster, modifications))
+
+    def create_cluster(self, project_id: str, cluster_name: str, config: Dict) -> AtlasCluster:
+        return self._write_through(self._api.create_cluster(project_id, cluster_name, config))
+
+    def delete_cluster(self, cluster: AtlasCluster) -> AtlasCluster:
+        """
+        Delete a cluster. Atlas keeps the cluster in the DELETING state until it
+        is gone so the map does the same, refresh_cluster() drops it once Atlas has.
+        """
+        self._api.delete_cluster(cluster)
+        if isinstance(cluster, ClusterRecord):
+            return self._write_through(cluster.replace(state="DELETING"))
+        resource = dict(cluster.resource)
+        resource["stateName"] = "DELETING"
+        return self._write_through(AtlasCluster(cluster.project_id, cluster.name, resource))
+
+    def _write_through(self, cluster: AtlasCluster) -> AtlasCluster:
+        # the snapshot is saved by flush_snapshot() once the command is done
+        return self.apply_cluster(cluster)
 
 
     def parse_cluster_id(self, cluster_str: str) -> ClusterID:
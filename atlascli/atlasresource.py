@@ -1,11 +1,11 @@
 import pprint
-import json
 from datetime import datetime
-from dateutil import parser
-from typing import Dict
+from typing import Dict, Optional
 
 from colorama import Fore
 
+from atlascli import jsoncodec
+from atlascli.jsoncodec import json_datetime_encoder  # noqa: F401 re-exported for existing importers
 from atlascli.outputformat import OutputFormat
 from pygments import highlight
 from pygments.styles import default, colorful, emacs, get_style_by_name
@@ -13,8 +13,21 @@ from pygments.lexers import JsonLexer
 from pygments.formatters import Terminal256Formatter
 
 
-def json_datetime_encoder(item: datetime):
-    return str(item)
+def parse_timestamp(timestamp) -> datetime:
+    """
+    Parse an Atlas timestamp. Atlas uses ISO 8601 which datetime.fromisoformat
+    handles directly once a trailing 'Z' is spelt as an offset, anything else is
+    left to dateutil which is only imported when it is needed.
+    """
+    if isinstance(timestamp, datetime):
+        return timestamp
+    try:
+        if timestamp.endswith("Z"):
+            return datetime.fromisoformat(f"{timestamp[:-1]}+00:00")
+        return datetime.fromisoformat(timestamp)
+    except ValueError:
+        from dateutil import parser
+        return parser.parse(timestamp)
 
 
 class AtlasResource:
@@ -22,13 +35,18 @@ class AtlasResource:
     Base class for Atlas Resources
     """
 
+    _UNPARSED = object()
+
     def __init__(self, resource: Dict = None):
+        #
+        # The resource dict is kept as Atlas returned it, 'created' is only
+        # parsed when it is asked for.
+        #
         if resource:
             self._resource = resource
-            if "created" in self._resource:  # convert date string to datetime obj
-                self._resource["created"] = parser.parse(self._resource["created"])
         else:
             self._resource = {}
+        self._created = AtlasResource._UNPARSED
 
     def __eq__(self, rhs):
         """Overrides the default implementation"""
@@ -44,6 +62,13 @@ class AtlasResource:
     def resource(self) -> Dict:
         return self._resource
 
+    @property
+    def created(self) -> Optional[datetime]:
+        if self._created is AtlasResource._UNPARSED:
+            created = self._resource.get("created")
+            self._created = parse_timestamp(created) if created else None
+        return self._created
+
     @property
     def name(self) -> str :
         return self._resource["name"]
@@ -58,6 +83,8 @@ class AtlasResource:
 
     def __setitem__(self, key, value):
         self._resource[key] = value
+        if key == "created":
+            self._created = AtlasResource._UNPARSED
     
     def __getitem__(self, key):
         return self._resource[key]
@@ -68,9 +95,10 @@ class AtlasResource:
     @resource.setter
     def resource(self, item: Dict):
         self._resource = item
+        self._created = AtlasResource._UNPARSED
 
     def json(self, indent=2):
-        return json.dumps(self._resource, indent=indent, default=json_datetime_encoder)
+        return jsoncodec.dumps(self._resource, indent=indent)
 
     @staticmethod
     def iter_print(iter, func, format):
@@ -87,7 +115,7 @@ class AtlasResource:
 
     @classmethod
     def pretty_dict(cls, d: Dict) -> str:
-        return highlight(json.dumps(d, indent=2, default=json_datetime_encoder), JsonLexer(),
+        return highlight(jsoncodec.dumps(d, indent=2), JsonLexer(),
                               Terminal256Formatter(style=get_style_by_name('emacs')))
 
     @staticmethod
@@ -99,13 +127,13 @@ class AtlasResource:
 
     @staticmethod
     def dump(output_filename: str, d: Dict):
-        with open(output_filename, "w") as output_file:
-            output_file.write(json.dumps(d, indent=2))
+        with open(output_filename, "w", encoding="utf-8") as output_file:
+            jsoncodec.dump(d, output_file, indent=2)
 
     @staticmethod
     def load(input_filename: str):
-        with open(input_filename, "r") as input_file:
-            return json.load(input_file)
+        with open(input_filename, "r", encoding="utf-8") as input_file:
+            return jsoncodec.load(input_file)
 
     # def __call__(self):
     #     return self._resource
@@ -0,0 +1,186 @@
+"""
+Bulk cluster operations
+~~~~~~~~~~~~~~~~~~~~~~~
+
+Run many cluster mutations (pause, resume, modify, delete, create)
+concurrently. A failure is recorded against its own item and does not
+stop the others. The number of concurrent requests is capped both overall
+and per project, as Atlas rate limits requests per project. Items wait in
+a queue per project and are only handed to a worker once their project has
+a free slot, so a large project cannot tie up the workers another project
+could be using.
+"""
+import logging
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from enum import Enum
+from typing import Callable, Dict, Iterable, List, Tuple, Union
+
+from atlascli.atlasapi import AtlasAPI
+
+
+class BulkOp(Enum):
+    PAUSE = "pause"
+    RESUME = "resume"
+    MODIFY = "modify"
+    DELETE = "delete"
+    CREATE = "create"
+
+    def __str__(self):
+        return self.value
+
+
+class BulkResult:
+
+    def __init__(self, index: int, op: BulkOp, target, value=None, error: Exception = None, latency: float = 0.0):
+        self._index = index
+        self._op = op
+        self._target = target
+        self._value = value
+        self._error = error
+        self._latency = latency
+
+    @property
+    def index(self) -> int:
+        return self._index
+
+    @property
+    def op(self) -> BulkOp:
+        return self._op
+
+    @property
+    def target(self):
+        return self._target
+
+    @property
+    def value(self):
+        """
+        What the AtlasAPI call returned, usually the updated AtlasCluster
+        """
+        return self._value
+
+    @property
+    def error(self) -> Exception:
+        return self._error
+
+    @property
+    def latency(self) -> float:
+        return self._latency
+
+    @property
+    def ok(self) -> bool:
+        return self._error is None
+
+    @property
+    def project_id(self) -> str:
+        return self._target.project_id
+
+    @property
+    def name(self) -> str:
+        return self._target.name
+
+    def __repr__(self):
+        outcome = "ok" if self.ok else f"error={self._error!r}"
+        return f"BulkResult({self._op}, {self.project_id}:{self.name}, {outcome}, latency={self._latency:.3f})"
+
+
+BulkItem = Union[Tuple[Union[BulkOp, str], object], Tuple[Union[BulkOp, str], object, Dict]]
+
+
+class BulkExecutor:
+
+    def __init__(self, api: AtlasAPI, workers: int = 8, per_project: int = 2):
+        """
+        :param api: an authenticated AtlasAPI, or an AtlasMap to apply each result to the map
+        :param workers: maximum number of requests in flight
+        :param per_project: maximum number of requests in flight for any one project in a run
+        """
+        if workers < 1 or per_project < 1:
+            raise ValueError("'workers' and 'per_project' must be at least 1")
+        self._log = logging.getLogger(__name__)
+        self._api = api
+        self._workers = workers
+        self._per_project = per_project
+
+    def _call(self, op: BulkOp, target, data):
+        if op is BulkOp.PAUSE:
+            return self._api.pause_cluster(target)
+        elif op is BulkOp.RESUME:
+            return self._api.resume_cluster(target)
+        elif op is BulkOp.MODIFY:
+            return self._api.modify_cluster(target, data)
+        elif op is BulkOp.DELETE:
+            return self._api.delete_cluster(target)
+        elif op is BulkOp.CREATE:
+            return self._api.create_cluster(target.project_id, target.name, dict(data))
+        raise ValueError(f"Unknown bulk operation: {op}")
+
+    def _execute(self, index: int, op: BulkOp, target, data) -> BulkResult:
+        start = time.monotonic()
+        try:
+            value = self._call(op, target, data)
+            return BulkResult(index, op, target, value=value, latency=time.monotonic() - start)
+        except Exception as e:
+            self._log.debug(f"{op} {target.project_id}:{target.name} failed: {e}")
+            return BulkResult(index, op, target, error=e, latency=time.monotonic() - start)
+
+    def _submit_ready(self, executor: ThreadPoolExecutor, queued: Dict[str, deque], running: Dict[Future, str],
+                      in_flight: Dict[str, int]):
+        """
+        Hand queued items to the pool while there is a free worker, taking one
+        from each project with a free slot in turn
+        """
+        while len(running) < self._workers:
+            ready = [pid for pid, queue in queued.items() if queue and in_flight[pid] < self._per_project]
+            if not ready:
+                return
+            for project_id in ready[:self._workers - len(running)]:
+                future = executor.submit(self._execute, *queued[project_id].popleft())
+                running[future] = project_id
+                in_flight[project_id] += 1
+
+    def run(self, items: Iterable[BulkItem], on_result: Callable[[BulkResult], None] = None) -> List[BulkResult]:
+        """
+        Execute each (operation, target[, data]) item. Targets are AtlasClusters
+        or ClusterIDs, 'data' is the modifications for MODIFY and the cluster
+        config for CREATE.
+
+        :param on_result: called in the calling thread as each item completes
+        :return: a BulkResult per item, in the order the items were supplied
+        :raises ValueError: if any item is malformed, before any item is executed
+        """
+        # validate every item before any request is sent so a bad one cannot leave the batch half done
+        normalised = []
+        for item in items:
+            if len(item) not in (2, 3):
+                raise ValueError(f"a bulk item is (operation, target[, data]), not {item!r}")
+            normalised.append((BulkOp(item[0]), item[1], item[2] if len(item) > 2 else None))
+
+        queued: Dict[str, deque] = {}
+        for index, (op, target, data) in enumerate(normalised):
+            queued.setdefault(target.project_id, deque()).append((index, op, target, data))
+        in_flight = {project_id: 0 for project_id in queued}
+        running: Dict[Future, str] = {}
+        results = []
+        with ThreadPoolExecutor(max_workers=self._workers, thread_name_prefix="atlasbulk") as executor:
+            self._submit_ready(executor, queued, running, in_flight)
+            while running:
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    in_flight[running.pop(future)] -= 1
+                    result = future.result()
+                    results.append(result)
+                    if on_result:
+                        on_result(result)
+                self._submit_ready(executor, queued, running, in_flight)
+        results.sort(key=lambda r: r.index)
+        return results
+
+    @staticmethod
+    def summary(results: List[BulkResult]) -> Dict[str, int]:
+        ok = sum(1 for r in results if r.ok)
+        return {"total": len(results), "succeeded": ok, "failed": len(results) - ok}
+
+    def __repr__(self):
+        return f"BulkExecutor(workers={self._workers}, per_project={self._per_project})"
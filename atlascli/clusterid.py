@@ -85,6 +85,16 @@ class ClusterID:
                     return None
         return cluster_name
 
+    @staticmethod
+    def validate_cluster_arg(cluster_arg: str) -> str:
+        #
+        # A cluster argument is a cluster name optionally qualified by a
+        # project id or an organization and a project id, e.g. org:project_id:name.
+        # Only the name is checked here. Used by argparse.
+        #
+        ClusterID.validate_cluster_name(cluster_arg.rpartition(":")[2])
+        return cluster_arg
+
     @staticmethod
     def parse(s: str) -> ClusterID:
         project_id, separator, cluster_name = s.partition(":")
@@ -0,0 +1,284 @@
+"""
+Cluster queries
+~~~~~~~~~~~~~~~
+
+Select clusters by their fields rather than by name, e.g.
+
+    atlascli list --where "state=IDLE" "paused=false" "size>=M40" "provider=AWS" "region=US_EAST_1"
+
+A query is a list of conditions of the form <field><op><value> that must all
+hold. The fields are state (stateName), paused, size (instanceSizeName),
+provider (providerName), region (regionName), disk (diskSizeGB) and project
+(a project id or name). The operators are =, !=, <, <=, > and >=, and a
+comma separated value matches any of its values, e.g. region=US_EAST_1,US_WEST_2.
+size= and size!= match the exact instance size name, so size=M40 does not
+match R40 or M40_NVME, while <, <=, > and >= compare instance sizes by their
+number so M40 < M200 and R40 >= M40.
+
+A ClusterIndex keeps a secondary index per field so a query touches only the
+clusters that match instead of every cluster in the organization.
+"""
+import bisect
+import re
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+ClusterKey = Tuple[str, str]  # (project id, cluster name)
+
+OPERATORS = ("!=", "<=", ">=", "=", "<", ">")
+
+_CONDITION = re.compile(r"^\s*([A-Za-z_]+)\s*(!=|<=|>=|=|<|>)\s*(.+?)\s*$")
+_INSTANCE_SIZE = re.compile(r"^[A-Za-z]*(\d+)")
+
+
+def instance_size_rank(size) -> Optional[int]:
+    """
+    The number in an instance size, M40 -> 40, R200_NVME -> 200
+    """
+    if size is None:
+        return None
+    if isinstance(size, (int, float)):
+        return int(size)
+    match = _INSTANCE_SIZE.match(str(size))
+    if match is None:
+        raise ValueError(f"'{size}' is not an instance size")
+    return int(match.group(1))
+
+
+def instance_size_name(size) -> Optional[str]:
+    """
+    The instance size name as Atlas spells it, m40_nvme -> M40_NVME
+    """
+    if size is None:
+        return None
+    instance_size_rank(size)  # raises ValueError for anything that is not an instance size
+    return str(size).upper()
+
+
+def _parse_bool(s: str) -> bool:
+    if s.lower() in ("true", "yes", "1"):
+        return True
+    if s.lower() in ("false", "no", "0"):
+        return False
+    raise ValueError(f"'{s}' is not true or false")
+
+
+def _field_value(getter):
+    def get(cluster):
+        try:
+            return getter(cluster)
+        except (KeyError, TypeError):
+            return None
+    return get
+
+
+class Field:
+
+    def __init__(self, name: str, getter, parse=str, ordered: bool = False, rank=None):
+        """
+        :param getter: reads the field's value from an AtlasCluster or ClusterRecord
+        :param parse: converts a value in a query to the type the getter returns
+        :param ordered: the field supports <, <=, > and >=
+        :param rank: maps a value to what <, <=, > and >= compare, the value itself if None
+        """
+        self.name = name
+        self.get = _field_value(getter)
+        self.parse = parse
+        self.ordered = ordered
+        self.rank = rank if rank else lambda value: value
+
+
+FIELDS: Dict[str, Field] = {
+    "state": Field("state", lambda c: c.state, str.upper),
+    "paused": Field("paused", lambda c: c.is_paused(), _parse_bool),
+    "size": Field("size", lambda c: instance_size_name(c.instance_size()), instance_size_name, ordered=True,
+                  rank=instance_size_rank),
+    "provider": Field("provider", lambda c: c.provider_name(), str.upper),
+    "region": Field("region", lambda c: c.region_name(), str.upper),
+    "disk": Field("disk", lambda c: c.disk_size(), float, ordered=True),
+    "project": Field("project", lambda c: c.project_id),
+}
+
+ALIASES = {
+    "statename": "state",
+    "instancesizename": "size",
+    "instancesize": "size",
+    "instance_size": "size",
+    "providername": "provider",
+    "regionname": "region",
+    "disksizegb": "disk",
+    "projectid": "project",
+    "project_id": "project",
+    "groupid": "project",
+}
+
+
+class Condition:
+
+    def __init__(self, field: str, op: str, values: List):
+        self.field = field
+        self.op = op
+        self.values = values
+
+    def matches(self, value) -> bool:
+        if value is None:
+            return self.op == "!=" and None not in self.values
+        if self.op == "=":
+            return value in self.values
+        if self.op == "!=":
+            return value not in self.values
+        value = FIELDS[self.field].rank(value)
+        target = self.values[0]
+        if self.op == "<":
+            return value < target
+        if self.op == "<=":
+            return value <= target
+        if self.op == ">":
+            return value > target
+        return value >= target
+
+    def __eq__(self, rhs):
+        if isinstance(rhs, Condition):
+            return (self.field, self.op, self.values) == (rhs.field, rhs.op, rhs.values)
+        return NotImplemented
+
+    def __repr__(self):
+        return f"Condition({self.field!r}, {self.op!r}, {self.values!r})"
+
+
+def parse_condition(s: str) -> Condition:
+    match = _CONDITION.match(s)
+    if match is None:
+        raise ValueError(f"'{s}' is not a condition of the form <field><op><value>, e.g. size>=M40")
+    name, op, value = match.groups()
+    name = ALIASES.get(name.lower(), name.lower())
+    if name not in FIELDS:
+        raise ValueError(f"'{name}' is not one of the fields {', '.join(FIELDS)}")
+    field = FIELDS[name]
+    if op not in ("=", "!=") and not field.ordered:
+        raise ValueError(f"'{name}' can only be compared with = or !=")
+    values = [v.strip() for v in value.split(",")] if op in ("=", "!=") else [value]
+    try:
+        values = [field.parse(v) for v in values]
+        if op not in ("=", "!="):
+            values = [field.rank(v) for v in values]
+    except ValueError as e:
+        raise ValueError(f"bad value in '{s}': {e}")
+    return Condition(name, op, values)
+
+
+def parse_query(conditions: Iterable[str]) -> List[Condition]:
+    """
+    Parse each condition. A condition string may hold several conditions
+    separated by whitespace or 'and'.
+    """
+    parsed = []
+    for s in conditions:
+        for term in re.split(r"\s+and\s+|\s+", s.strip(), flags=re.IGNORECASE):
+            if term:
+                parsed.append(parse_condition(term))
+    return parsed
+
+
+class ClusterIndex:
+    """
+    A secondary index on each query field: field -> value -> keys of the
+    clusters with that value. Ordered fields also index the clusters by the
+    rank of their value and keep the distinct ranks sorted so range conditions
+    are answered with a bisect. The index is not locked, AtlasMap updates and
+    queries it under its own lock.
+    """
+
+    def __init__(self, clusters: Iterable = ()):
+        self._keys: Set[ClusterKey] = set()
+        self._values: Dict[ClusterKey, Dict[str, object]] = {}  # what each cluster was indexed under
+        self._index: Dict[str, Dict[object, Set[ClusterKey]]] = {name: {} for name in FIELDS}
+        self._ranked: Dict[str, Dict[object, Set[ClusterKey]]] = {name: {} for name, f in FIELDS.items() if f.ordered}
+        self._sorted: Dict[str, List] = {name: [] for name in self._ranked}
+        for cluster in clusters:
+            self.add(cluster)
+
+    def __len__(self):
+        return len(self._keys)
+
+    @staticmethod
+    def key(cluster) -> ClusterKey:
+        return cluster.project_id, cluster.name
+
+    def add(self, cluster):
+        key = self.key(cluster)
+        if key in self._keys:
+            self.remove(*key)
+        values = {name: field.get(cluster) for name, field in FIELDS.items()}
+        for name, value in values.items():
+            self._index[name].setdefault(value, set()).add(key)
+            if name in self._ranked and value is not None:
+                rank = FIELDS[name].rank(value)
+                keys = self._ranked[name].get(rank)
+                if keys is None:
+                    keys = self._ranked[name][rank] = set()
+                    bisect.insort(self._sorted[name], rank)
+                keys.add(key)
+        self._values[key] = values
+        self._keys.add(key)
+
+    def remove(self, project_id: str, cluster_name: str):
+        key = (project_id, cluster_name)
+        values = self._values.pop(key, None)
+        if values is None:
+            return
+        self._keys.discard(key)
+        for name, value in values.items():
+            keys = self._index[name][value]
+            keys.discard(key)
+            if not keys:
+                del self._index[name][value]
+            if name in self._ranked and value is not None:
+                rank = FIELDS[name].rank(value)
+                keys = self._ranked[name][rank]
+                keys.discard(key)
+                if not keys:
+                    del self._ranked[name][rank]
+                    ordered = self._sorted[name]
+                    del ordered[bisect.bisect_left(ordered, rank)]
+
+    def _select(self, condition: Condition) -> Set[ClusterKey]:
+        index = self._index[condition.field]
+        if condition.op == "=":
+            selected = set()
+            for value in condition.values:
+                selected |= index.get(value, set())
+            return selected
+        if condition.op == "!=":
+            excluded = set()
+            for value in condition.values:
+                excluded |= index.get(value, set())
+            return self._keys - excluded
+        ordered = self._sorted[condition.field]
+        target = condition.values[0]
+        if condition.op == "<":
+            values = ordered[:bisect.bisect_left(ordered, target)]
+        elif condition.op == "<=":
+            values = ordered[:bisect.bisect_right(ordered, target)]
+        elif condition.op == ">":
+            values = ordered[bisect.bisect_right(ordered, target):]
+        else:
+            values = ordered[bisect.bisect_left(ordered, target):]
+        ranked = self._ranked[condition.field]
+        selected = set()
+        for value in values:
+            selected |= ranked[value]
+        return selected
+
+    def select(self, conditions: List[Condition]) -> Set[ClusterKey]:
+        """
+        :return: the keys of the clusters that satisfy every condition
+        """
+        if not conditions:
+            return set(self._keys)
+        selections = sorted((self._select(c) for c in conditions), key=len)
+        result = selections[0]
+        for selection in selections[1:]:
+            if not result:
+                break
+            result = result & selection
+        return result
@@ -1,18 +1,30 @@
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
-import json
 import os.path
 from typing import List
 
+from requests.exceptions import RequestException
+
+from atlascli import jsoncodec
 from atlascli.atlascluster import AtlasCluster
 from atlascli.atlasmap import AtlasMap
 from atlascli.atlasresource import AtlasResource, inputhighlight
+from atlascli.bulk import BulkExecutor, BulkOp, BulkResult
 from atlascli.clusterid import ClusterID
+from atlascli.errors import AtlasError
+from atlascli.federatedmap import FederatedAtlasMap
+from atlascli.fleet import DesiredStatePlan, FleetApplier, FleetSpec, plan_fleet
+from atlascli.scheduler import Scheduler, load_schedule
+from atlascli.selector import ClusterSelector, FleetPlan, is_glob
+from atlascli.waiter import ClusterWaiter, WaitResult, WaitTarget
 
 from colorama import init, Fore
 
 
 class Commands:
 
+    FRESH_SECONDS = 5  # a project listed this recently is not listed again before a pause or resume
+
     def __init__(self, map: AtlasMap):
         self._map = map
 
@@ -44,12 +56,13 @@ class Commands:
                                      f"you need to specify the project id")
                 else:
                     project_id = project_ids[0]
-            if project_id and self._map.is_project_id(project_id):
-                if cluster_name and self._map.is_cluster_name(cluster_name):
+            if project_id and self._is_visible_project(project_id):
+                if cluster_name and self._is_visible_cluster(project_id, cluster_name):
                     return ClusterID(project_id, cluster_name)
                 else:
                     if cluster_name:
-                        raise SystemExit(f"{inputhighlight(cluster_name)} is not a cluster name in this organization")
+                        raise SystemExit(f"{inputhighlight(cluster_name)} is not a cluster name in project "
+                                         f"{inputhighlight(project_id)}")
                     else:
                         raise SystemExit(f"No cluster name supplied as an argument")
             else:
@@ -61,27 +74,73 @@ class Commands:
             raise SystemExit(e)
 
 
+    #
+    # Atlas answers 400 for a malformed id and 401/403 for a project the key
+    # cannot see, to the user all of these are just not a project of theirs.
+    # Any other failure, an outage or running out of retries, is raised.
+    #
+    NOT_VISIBLE = (400, 401, 403, 404)
+
+    def _is_visible_project(self, project_id: str) -> bool:
+        try:
+            return self._map.is_project_id(project_id)
+        except AtlasError as e:
+            if e.response is not None and e.response.status_code in self.NOT_VISIBLE:
+                return False
+            raise
+
+    def _is_visible_cluster(self, project_id: str, cluster_name: str) -> bool:
+        try:
+            return self._map.resolve_cluster(project_id, cluster_name) is not None
+        except AtlasError as e:
+            if e.response is not None and e.response.status_code in self.NOT_VISIBLE:
+                return False
+            raise
+
     @staticmethod
     def default_cluster_cmd(output_file=None):
         default_cluster = AtlasCluster.default_single_region_cluster()
         if output_file:
-            output_file.write(json.dumps(default_cluster, indent=2))
+            jsoncodec.dump(default_cluster, output_file, indent=2)
             print(f"default cluster config created in {inputhighlight(output_file.name)}")
         else:
             print(AtlasCluster.pretty_dict(default_cluster))
 
-    def create_cluster_cmd(self, cluster_name: str, cfg_file, output_file=None):
+    def wait_for(self, targets: List[WaitTarget], timeout: float = None) -> WaitResult:
+        """
+        Wait for the clusters to reach their target states, printing each as it does.
+        Exits if the timeout expires first.
+        """
+        if not targets:
+            return WaitResult({}, {}, 0.0, 0)
+        print(f"Waiting for {len(targets)} cluster(s)" + (f" for up to {timeout:.0f}s" if timeout else ""))
+
+        def report(target: WaitTarget, cluster):
+            print(f"Cluster '{target.name}' is {target.describe()} at {datetime.now().strftime('%H:%M:%S')}")
+
+        result = ClusterWaiter(self._map.api, self._map).wait(targets, timeout=timeout, on_reached=report)
+        if result.timed_out:
+            for target in result.pending.values():
+                print(f"{Fore.RED}Timed out{Fore.RESET} waiting for '{target.project_id}:{target.name}' "
+                      f"to be {target.describe()}")
+            raise SystemExit(f"timed out after {result.elapsed:.0f}s with {len(result.pending)} cluster(s) pending")
+        return result
+
+    def create_cluster_cmd(self, cluster_name: str, cfg_file, output_file=None, wait: bool = False,
+                           timeout: float = None):
         project_id, cluster_name = ClusterID.parse_id_name(cluster_name)
         if cfg_file:
-            cfg_dict = json.load(cfg_file)
+            cfg_dict = jsoncodec.load(cfg_file)
             print(f"Creating cluster {Fore.YELLOW}{project_id}{Fore.RESET}:{Fore.MAGENTA}{cluster_name}"
                   f"{Fore.RESET} from cluster configuration {Fore.GREEN}{cfg_file.name}")
-            new_cluster = self._map.api.create_cluster(project_id, cluster_name, cfg_dict)
+            new_cluster = self._map.create_cluster(project_id, cluster_name, cfg_dict)
             if output_file:
-                json.dump(output_file, new_cluster)
+                jsoncodec.dump(new_cluster.resource, output_file, indent=2)
                 print(f"Cluster config created in '{Fore.MAGENTA}{output_file.name}{Fore.RESET}'")
             else:
                 print(new_cluster.pretty())
+            if wait:
+                self.wait_for([WaitTarget.created_cluster(new_cluster)], timeout)
 
     def create_project_cmd(self, project_arg:str, output_file=None):
         org_id, project_name = ClusterID.parse_id_name(project_arg)
@@ -89,7 +148,7 @@ class Commands:
             print(f"Creating project {org_id}:{project_name}")
             project = self._map.api.create_project(org_id, project_name)
             if output_file:
-                json.dump(output_file, project)
+                jsoncodec.dump(project.resource, output_file, indent=2)
                 print(f"Cluster config created in '{Fore.MAGENTA}{output_file.name}{Fore.RESET}'")
             else:
                 print(project.pretty())
@@ -98,10 +157,10 @@ class Commands:
 
     @staticmethod
     def template_cluster_cmd(cfg_file, output_file=None):
-        cfg = json.load(cfg_file)
+        cfg = jsoncodec.load(cfg_file)
         new_cfg = AtlasCluster.strip_cluster_dict(cfg)
         if output_file:
-            output_file.write(json.dumps(new_cfg))
+            jsoncodec.dump(new_cfg, output_file)
             print(f"Template config created in '{Fore.MAGENTA}{output_file.name}{Fore.RESET}'")
         else:
             print(AtlasCluster.pretty_dict(new_cfg))
@@ -111,18 +170,23 @@ class Commands:
         cluster = self._map.get_one_cluster(cluster_id.project_id, cluster_id.name)
         new_cfg = AtlasCluster.strip_cluster_dict(cluster.resource)
         if output_file:
-            output_file.write(json.dumps(new_cfg))
+            jsoncodec.dump(new_cfg, output_file)
             print(f"Cloned cluster {cluster.pretty_id_name()} into {Fore.LIGHTWHITE_EX}{output_file.name}")
         else:
             print(AtlasResource.pretty_dict(new_cfg))
 
-    def delete_cluster_cmd(self, cluster_name: str):
+    def delete_cluster_cmd(self, cluster_name: str, wait: bool = False, timeout: float = None):
         cluster_id = self.preflight_cluster_arg(cluster_name)
         print(f"deleting cluster: {cluster_id.pretty()} (project : {self._map.get_project_name(cluster_id.project_id)})")
         if Commands.prompt("Are you sure: ", "Y"):
-            cluster = self._map.api.get_one_cluster(cluster_id.project_id, cluster_id.name)
-            self._map.api.delete_cluster(cluster)
-            print("delete completed")
+            cluster = self._map.refresh_cluster(cluster_id.project_id, cluster_id.name)
+            if cluster:
+                self._map.delete_cluster(cluster)
+                print("delete completed")
+                if wait:
+                    self.wait_for([WaitTarget.deleted_cluster(cluster)], timeout)
+            else:
+                print(f"cluster {cluster_id.pretty()} no longer exists")
         else:
             print("delete aborted")
 
@@ -132,6 +196,7 @@ class Commands:
         if Commands.prompt("Are you sure: ", "Y"):
             project = self._map.api.get_one_project(self._map.get_project_id(project_name))
             self._map.api.delete_project(project.id)
+            self._map.remove_project(project.id)
             print("delete completed")
         else:
             print("delete aborted")
@@ -175,26 +240,260 @@ class Commands:
             if cluster_names:
                 self.list_cluster(cluster_names, output)
 
-    def pause_cmd(self, cluster_names: List[str]):
+    @staticmethod
+    def federated_list_cmd(federated_map: FederatedAtlasMap, print_org: bool,
+                           project_ids: List[str], cluster_names: List[str], where: List[str] = None):
+        if where:
+            try:
+                found = federated_map.query(where)
+            except ValueError as e:
+                raise SystemExit(e)
+            for name, cluster in found:
+                print(f"[{name}] {cluster.summary()}")
+        elif not print_org and project_ids is None and cluster_names is None:
+            federated_map.populate()
+            federated_map.pprint()
+            return
+
+        if print_org:
+            for name, atlas_map in federated_map.maps.items():
+                print(f"[{name}]")
+                print(AtlasResource.pretty_dict(atlas_map.organization.resource))
+
+        if project_ids is not None:
+            if len(project_ids) == 0:
+                federated_map.populate()
+                for name, project in federated_map.projects():
+                    print(f"[{name}] {project.pretty_project_id()}")
+            for pid in project_ids:
+                found = federated_map.find_project(pid)
+                if not found:
+                    print(f"{pid} is not a valid project_id in any organization")
+                for name, atlas_map in found:
+                    print(f"[{name}]")
+                    print(atlas_map.get_one_project(pid).pretty(), end="")
+
+        if cluster_names is not None:
+            if len(cluster_names) == 0:
+                federated_map.populate()
+                for name, cluster in federated_map.clusters():
+                    print(f"[{name}] {cluster.summary()}")
+            for cluster_arg in cluster_names:
+                try:
+                    found = federated_map.get_clusters(cluster_arg)
+                except ValueError as e:
+                    raise SystemExit(e)
+                if not found:
+                    qualifier = " that could be read" if federated_map.errors else ""
+                    print(f"{inputhighlight(cluster_arg)} is not a cluster in any organization{qualifier}")
+                for name, cluster in found:
+                    print(f"\nOrganization: '{name}' Project: '{cluster.project_id}' Cluster: '{cluster.name}'")
+                    print(cluster.pretty())
+
+        for name, error in federated_map.errors.items():
+            print(f"[{name}] could not be read: {error}")
+
+    def query_cmd(self, conditions: List[str], output=None):
+        try:
+            clusters = self._map.query(conditions)
+        except ValueError as e:
+            raise SystemExit(e)
+        for cluster in clusters:
+            if output:
+                output.write(cluster.json())
+            else:
+                print(cluster.summary())
+        if output:
+            print(f"wrote {len(clusters)} clusters to {output.name}")
+        elif not clusters:
+            print("No clusters match")
+
+    def resolve_cluster_args(self, cluster_args: List[str], workers: int = 4) -> (List[AtlasCluster], List[tuple]):
+        """
+        Resolve every cluster argument before anything is changed. Fully
+        qualified ids are resolved concurrently, bare names from one crawl.
 
-        for cluster_name in cluster_names:
-            cluster_id = self.preflight_cluster_arg(cluster_name)
-            cluster = self._map.get_one_cluster(cluster_id.project_id, cluster_id.name)
-            if cluster.is_paused():
-                print(f"Cluster '{cluster.name}' is already paused")
+        :return: the distinct clusters and a list of (argument, reason) for the
+        arguments that could not be resolved
+        """
+        if any(ClusterID.parse_id_name(arg)[0] is None for arg in cluster_args):
+            self._map.clusters  # crawl once rather than once per thread
+
+        def resolve(arg):
+            cluster_id = self.preflight_cluster_arg(arg)
+            return self._map.get_one_cluster(cluster_id.project_id, cluster_id.name)
+
+        clusters = {}
+        unresolved = []
+        with ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix="resolve") as executor:
+            futures = [(arg, executor.submit(resolve, arg)) for arg in cluster_args]
+            for arg, future in futures:
+                try:
+                    cluster = future.result()
+                except (SystemExit, ValueError, RequestException) as e:
+                    unresolved.append((arg, str(e)))
+                    continue
+                clusters.setdefault((cluster.project_id, cluster.name), cluster)
+        return list(clusters.values()), unresolved
+
+    def _pause_resume(self, cluster_args: List[str], op: BulkOp, parallel: int, wait: bool = False,
+                      timeout: float = None, selector: ClusterSelector = None, dry_run: bool = False) -> dict:
+        pause = op is BulkOp.PAUSE
+        verb, done, state = ("pause", "Paused", "paused") if pause else ("resume", "Resumed", "running")
+
+        cluster_args = cluster_args or []
+        globs = [arg for arg in cluster_args if is_glob(arg)]
+        if globs:
+            try:
+                selector = (selector or ClusterSelector()).with_names(globs)
+            except ValueError as e:
+                raise SystemExit(str(e))
+        names = [arg for arg in cluster_args if not is_glob(arg)]
+        if not names and (selector is None or selector.is_empty()):
+            raise SystemExit(f"Nothing to {verb}: name clusters with -c or select them with --project or --all, "
+                             f"--instance-size and --state only narrow the selection")
+
+        clusters, unresolved = self.resolve_cluster_args(names, parallel)
+        for arg, reason in unresolved:
+            print(f"{Fore.RED}Skipping{Fore.RESET} '{arg}': {reason}")
+        if selector is not None:
+            try:
+                selected = selector.select(self._map)
+            except ValueError as e:
+                raise SystemExit(e)
+            known = {(c.project_id, c.name) for c in clusters}
+            clusters.extend(c for c in selected if (c.project_id, c.name) not in known)
+
+        # The map may come from a snapshot or predate changes made elsewhere, so
+        # list the clusters' projects again before deciding which to skip.
+        try:
+            self._map.refresh_project_clusters([c.project_id for c in clusters], parallel,
+                                               max_age=self.FRESH_SECONDS)
+        except RequestException as e:
+            raise SystemExit(f"Cannot read the current state of the clusters: {e}")
+        current = []
+        for cluster in clusters:
+            now = self._map.resolve_cluster(cluster.project_id, cluster.name)
+            if now is None:
+                unresolved.append((f"{cluster.project_id}:{cluster.name}", "no longer exists"))
+            else:
+                current.append(now)
+        clusters = current
+
+        plan = FleetPlan(op, clusters)
+        if dry_run:
+            plan.pprint(self._map)
+            if unresolved:
+                raise SystemExit(f"{len(unresolved)} cluster(s) could not be found")
+            return {done.lower(): len(plan.changes), "skipped": len(plan.unchanged), "failed": 0,
+                    "api_calls": plan.api_calls}
+
+        skipped = plan.unchanged
+        for cluster in skipped:
+            print(f"Cluster '{cluster.name}' is already {state}")
+        todo = plan.changes
+
+        def report(result: BulkResult):
+            if result.ok:
+                print(f"{done} cluster '{result.name}' at {datetime.now().strftime('%H:%M:%S')}")
             else:
-                print(f"Trying to pause: '{cluster.name}'")
-                self._map.api.pause_cluster(cluster)
-                print(f"Paused cluster '{cluster.name}' at {datetime.now().strftime('%H:%M:%S')}")
-
-    def resume_cmd(self, cluster_ids: List[str]):
-
-        for cluster_name in cluster_ids:
-            cluster_id = self.preflight_cluster_arg(cluster_name)
-            cluster = self._map.get_one_cluster(cluster_id.project_id, cluster_id.name)
-            if cluster.is_paused():
-                print(f"Trying to resume: '{cluster.name}'")
-                self._map.api.resume_cluster(cluster)
-                print(f"Resumed cluster '{cluster.name}' at {datetime.now().strftime('%H:%M:%S')}")
+                print(f"{Fore.RED}Failed{Fore.RESET} to {verb} '{result.name}': {result.error}")
+
+        if todo:
+            print(f"Trying to {verb}: {', '.join(repr(c.name) for c in todo)}")
+        executor = BulkExecutor(self._map, workers=max(1, parallel), per_project=max(1, parallel))
+        results = executor.run(((op, c) for c in todo), on_result=report)
+
+        failed = [(f"{r.project_id}:{r.name}", str(r.error)) for r in results if not r.ok] + unresolved
+        summary = {done.lower(): sum(1 for r in results if r.ok),
+                   "skipped": len(skipped),
+                   "failed": len(failed)}
+        print()
+        for label, count in summary.items():
+            print(f"  {label:<10}{count:>5}")
+        for name, reason in failed:
+            print(f"  {Fore.RED}failed{Fore.RESET}    {name}: {reason}")
+
+        if wait:
+            make_target = WaitTarget.paused_cluster if pause else WaitTarget.resumed_cluster
+            # a cluster just changed can still look settled, so only skipped ones are checked up front
+            targets = [make_target(r.value, changing=True) for r in results if r.ok]
+            targets += [t for t in map(make_target, skipped) if not t.reached(self._map.resolve_cluster(*t.key))]
+            self.wait_for(targets, timeout)
+        if failed:
+            raise SystemExit(f"{len(failed)} cluster(s) could not be {done.lower()}")
+        return summary
+
+    def pause_cmd(self, cluster_names: List[str], parallel: int = 4, wait: bool = False,
+                  timeout: float = None, selector: ClusterSelector = None, dry_run: bool = False) -> dict:
+        return self._pause_resume(cluster_names, BulkOp.PAUSE, parallel, wait, timeout, selector, dry_run)
+
+    def resume_cmd(self, cluster_ids: List[str], parallel: int = 4, wait: bool = False,
+                   timeout: float = None, selector: ClusterSelector = None, dry_run: bool = False) -> dict:
+        return self._pause_resume(cluster_ids, BulkOp.RESUME, parallel, wait, timeout, selector, dry_run)
+
+    def schedule_cmd(self, schedule_file: str, status_file: str = None, parallel: int = 4,
+                     refresh_interval: float = 900, check: bool = False):
+        try:
+            rules = load_schedule(schedule_file)
+        except (OSError, ValueError) as e:
+            raise SystemExit(f"Cannot use schedule {inputhighlight(schedule_file)}: {e}")
+        if not rules:
+            raise SystemExit(f"No rules in schedule {inputhighlight(schedule_file)}")
+        scheduler = Scheduler(self, rules, status_file, parallel, refresh_interval)
+        for rule in rules:
+            print(f"  {rule.name:<20}{rule.action:<8}{str(rule.cron):<20}"
+                  f"next {scheduler.next_due()[rule.name]:%Y-%m-%d %H:%M}")
+        if check:
+            return scheduler
+        scheduler.run()
+        return scheduler
+
+    def plan_cmd(self, fleet_file: str, parallel: int = 4) -> DesiredStatePlan:
+        try:
+            spec = FleetSpec.load(fleet_file, self._map)
+            # plan against the clusters as they are now rather than a snapshot of them
+            self._map.refresh_project_clusters(spec.project_ids, parallel)
+            plan = plan_fleet(spec, self._map)
+        except RequestException as e:
+            raise SystemExit(f"Cannot read the current state of the clusters: {e}")
+        except (OSError, ValueError) as e:
+            raise SystemExit(f"Cannot plan {inputhighlight(fleet_file)}: {e}")
+        plan.pprint(self._map)
+        return plan
+
+    def apply_cmd(self, fleet_file: str, parallel: int = 4, wait: bool = False, timeout: float = None,
+                  yes: bool = False) -> dict:
+        plan = self.plan_cmd(fleet_file, parallel)
+        if not plan.changes:
+            return {"failed": 0}
+        if plan.deletes and not yes:
+            if not Commands.prompt(f"{len(plan.deletes)} cluster(s) will be deleted, are you sure: ", "Y"):
+                print("apply aborted")
+                return {"failed": 0}
+
+        def report(result: BulkResult):
+            if result.ok:
+                print(f"{str(result.op).capitalize()} '{result.project_id}:{result.name}' "
+                      f"at {datetime.now().strftime('%H:%M:%S')}")
             else:
-                print(f"Cluster '{cluster.name}' is already running")
+                print(f"{Fore.RED}Failed{Fore.RESET} to {result.op} '{result.project_id}:{result.name}': "
+                      f"{result.error}")
+
+        def settled(target: WaitTarget):
+            print(f"Cluster '{target.project_id}:{target.name}' is {target.describe()} "
+                  f"at {datetime.now().strftime('%H:%M:%S')}")
+
+        applier = FleetApplier(self._map, workers=max(1, parallel), per_project=max(1, parallel))
+        result = applier.apply(plan, wait, timeout, on_result=report, on_settled=settled)
+        summary = result.summary()
+        print()
+        for label, count in summary.items():
+            print(f"  {label:<10}{count:>5}")
+        for (project_id, name), reason in result.failed.items():
+            print(f"  {Fore.RED}failed{Fore.RESET}    {project_id}:{name}: {reason}")
+        if result.failed:
+            raise SystemExit(f"{len(result.failed)} cluster(s) could not be brought to the desired state")
+        if result.pending:
+            raise SystemExit(f"timed out with {len(result.pending)} cluster(s) still changing")
+        return summary
@@ -83,6 +83,12 @@ class Config:
     def is_org(self, org:str):
         return org in self._cfg
 
+    def get_orgs(self):
+        """
+        The organizations that have both keys in the config file
+        """
+        return [org for org in self._cfg.sections() if self.has_keys(org)]
+
     def load(self, input_file=None):
         if input_file:
             self._filename = input_file
@@ -0,0 +1,77 @@
+"""
+Preemptive HTTP Digest Authentication
+~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+requests.auth.HTTPDigestAuth keeps the server challenge in thread local
+storage, so every new thread (and every new AtlasAPI) pays for an extra
+401 round trip before its first request is accepted.
+
+PreemptiveDigestAuth keeps a single copy of the challenge (realm, nonce,
+opaque, qop) shared by all threads and signs each request with it up
+front, incrementing the nonce count under a lock. A fresh challenge is
+only taken when the server rejects a request, which Atlas does when the
+nonce goes stale.
+"""
+import threading
+from typing import Optional
+
+from requests.auth import HTTPDigestAuth
+
+
+class PreemptiveDigestAuth(HTTPDigestAuth):
+
+    def __init__(self, username: str, password: str):
+        super().__init__(username, password)
+        self._lock = threading.RLock()
+        self._chal = {}
+        self._last_nonce = ""
+        self._nonce_count = 0
+        self._challenges = 0
+
+    @property
+    def challenges(self) -> int:
+        """
+        Number of challenges received from the server, i.e. the number
+        of extra 401 round trips this auth object has cost.
+        """
+        return self._challenges
+
+    @property
+    def nonce(self) -> Optional[str]:
+        return self._chal.get("nonce")
+
+    def build_digest_header(self, method, url):
+        with self._lock:
+            tl = self._thread_local
+            if tl.chal is not self._chal:
+                #
+                # handle_401() has installed a new challenge for this thread, it
+                # replaces the shared one and restarts the nonce count.
+                #
+                self._chal = tl.chal
+                self._last_nonce = ""
+                self._nonce_count = 0
+                self._challenges += 1
+            tl.last_nonce = self._last_nonce
+            tl.nonce_count = self._nonce_count
+            header = super().build_digest_header(method, url)
+            self._last_nonce = tl.last_nonce
+            self._nonce_count = tl.nonce_count
+            return header
+
+    def __call__(self, r):
+        self.init_per_thread_state()
+        tl = self._thread_local
+        with self._lock:
+            tl.chal = self._chal
+            if self._chal:
+                header = self.build_digest_header(r.method, r.url)
+                if header:
+                    r.headers["Authorization"] = header
+
+        tell = getattr(r.body, "tell", None)
+        tl.pos = tell() if tell is not None else None
+        r.register_hook("response", self.handle_401)
+        r.register_hook("response", self.handle_redirect)
+        tl.num_401_calls = 1
+        return r
@@ -0,0 +1,228 @@
+"""
+Federated AtlasMap
+~~~~~~~~~~~~~~~~~~
+
+An AtlasMap describes one organization reached with one API key. A
+FederatedAtlasMap holds an AtlasMap for each organization in the config
+file, each authenticated with that organization's keys, and crawls them
+concurrently. An organization that cannot be reached is reported in
+errors and does not stop the others.
+
+Clusters are addressed across organizations as org:project_id:cluster where
+org is the organization's name in the config file or its id.
+"""
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, Generator, List, Optional, Tuple
+
+from requests.exceptions import RequestException
+
+from atlascli.atlasapi import AtlasAPI
+from atlascli.atlascluster import AtlasCluster
+from atlascli.atlaskey import AtlasKey
+from atlascli.atlasmap import AtlasMap
+from atlascli.atlasproject import AtlasProject
+from atlascli.config import Config
+from atlascli.errors import AtlasError
+
+
+class FederatedAtlasMap:
+
+    def __init__(self, workers: int = 4):
+        """
+        :param workers: number of organizations connected to and crawled concurrently
+        """
+        self._workers = max(1, workers)
+        self._log = logging.getLogger(__name__)
+        self._lock = threading.Lock()
+        self._maps: Dict[str, AtlasMap] = {}  # config name of the organization to its map
+        self._errors: Dict[str, Exception] = {}  # config name to the error reaching it
+
+    @classmethod
+    def from_config(cls, config: Config, orgs: List[str] = None, workers: int = 4,
+                    api_factory: Callable[[str], AtlasAPI] = None, **map_kwargs) -> "FederatedAtlasMap":
+        """
+        Connect to each organization in the config file.
+
+        :param orgs: the names of the organizations to use, every organization with keys if None
+        :param api_factory: called with an organization's name to make its unauthenticated AtlasAPI
+        :param map_kwargs: passed to each AtlasMap
+        """
+        federated = cls(workers)
+        if orgs is None:
+            orgs = config.get_orgs()
+        if api_factory is None:
+            api_factory = lambda name: AtlasAPI()
+
+        def connect(name: str) -> AtlasMap:
+            public_key, private_key = config.public_key(name), config.private_key(name)
+            if public_key is None or private_key is None:
+                raise ValueError(f"No keys for organization '{name}' in {config.filename}")
+            api = api_factory(name)
+            api.authenticate(AtlasKey(public_key, private_key))
+            return AtlasMap(api.get_this_organization(), api, **map_kwargs)
+
+        federated._fan_out(orgs, connect, federated.add)
+        return federated
+
+    def _fan_out(self, names: List[str], func, on_success=None):
+        #
+        # Run func(name) for each organization concurrently, recording failures
+        # per organization rather than raising them.
+        #
+        with ThreadPoolExecutor(max_workers=self._workers, thread_name_prefix="federated") as executor:
+            futures = {name: executor.submit(func, name) for name in names}
+            for name, future in futures.items():
+                try:
+                    result = future.result()
+                except (RequestException, ValueError) as e:
+                    self._log.warning(f"organization '{name}' failed: {e}")
+                    with self._lock:
+                        self._errors[name] = e
+                    continue
+                with self._lock:
+                    self._errors.pop(name, None)
+                if on_success:
+                    on_success(name, result)
+
+    def add(self, name: str, atlas_map: AtlasMap):
+        with self._lock:
+            self._maps[name] = atlas_map
+
+    def populate(self):
+        """
+        Crawl every organization concurrently
+        """
+        self._fan_out(list(self._maps.keys()), lambda name: self._maps[name].populate_cluster_map())
+
+    @property
+    def names(self) -> List[str]:
+        return list(self._maps.keys())
+
+    @property
+    def maps(self) -> Dict[str, AtlasMap]:
+        return dict(self._maps)
+
+    @property
+    def errors(self) -> Dict[str, Exception]:
+        """
+        Organizations that could not be reached or crawled
+        """
+        with self._lock:
+            return dict(self._errors)
+
+    def get_map(self, org: str) -> Optional[AtlasMap]:
+        """
+        :param org: the organization's name in the config file or its id
+        """
+        if org in self._maps:
+            return self._maps[org]
+        for atlas_map in self._maps.values():
+            if atlas_map.organization and atlas_map.organization.id == org:
+                return atlas_map
+        return None
+
+    @staticmethod
+    def is_not_here(e: RequestException) -> bool:
+        """
+        Atlas answers 401 or 403 when a key asks about another organization's
+        project, so those answers, like a 404, mean it is not in that organization
+        """
+        return e.response is not None and e.response.status_code in (401, 403, 404)
+
+    def find_project(self, project_id: str) -> List[Tuple[str, AtlasMap]]:
+        """
+        The organizations holding the project, asked concurrently
+        """
+        def holds(name: str) -> bool:
+            try:
+                return self._maps[name].is_project_id(project_id)
+            except AtlasError as e:
+                if self.is_not_here(e):
+                    return False
+                raise
+
+        found = set()
+        self._fan_out(list(self._maps.keys()), holds, lambda name, held: found.add(name) if held else None)
+        return [(name, atlas_map) for name, atlas_map in self._maps.items() if name in found]
+
+    @staticmethod
+    def parse_id(cluster_arg: str) -> Tuple[Optional[str], Optional[str], str]:
+        """
+        Split org:project_id:cluster, project_id:cluster or cluster into
+        (org, project_id, cluster) with None for the parts that are missing.
+        """
+        parts = cluster_arg.split(":")
+        if len(parts) > 3:
+            raise ValueError(f"'{cluster_arg}' is not of the form org:project_id:cluster")
+        parts = [p if p else None for p in parts]
+        return tuple([None] * (3 - len(parts)) + parts)
+
+    def get_clusters(self, cluster_arg: str) -> List[Tuple[str, AtlasCluster]]:
+        """
+        Find clusters across organizations.
+
+        :return: a list of (organization name, cluster). A bare name may match
+        clusters in several projects and organizations. An organization that
+        fails for any other reason than not holding the cluster is recorded
+        in errors.
+        """
+        org, project_id, name = self.parse_id(cluster_arg)
+        if org is not None:
+            atlas_map = self.get_map(org)
+            if atlas_map is None:
+                raise ValueError(f"'{org}' is not an organization in this map")
+            candidates = [(self._name_of(atlas_map), atlas_map)]
+        else:
+            candidates = list(self._maps.items())
+
+        found = []
+        for org_name, atlas_map in candidates:
+            try:
+                clusters = atlas_map.get_cluster(name, project_id)
+            except RequestException as e:
+                if org is not None:
+                    raise
+                if self.is_not_here(e):
+                    self._log.debug(f"'{cluster_arg}' not found in organization '{org_name}': {e}")
+                else:
+                    self._log.warning(f"organization '{org_name}' failed: {e}")
+                    with self._lock:
+                        self._errors[org_name] = e
+                continue
+            found.extend((org_name, cluster) for cluster in clusters)
+        return found
+
+    def _name_of(self, atlas_map: AtlasMap) -> str:
+        for name, m in self._maps.items():
+            if m is atlas_map:
+                return name
+        raise KeyError(atlas_map)
+
+    def projects(self) -> Generator[Tuple[str, AtlasProject], None, None]:
+        for name, atlas_map in self.maps.items():
+            for project in atlas_map.projects:
+                yield name, project
+
+    def clusters(self) -> Generator[Tuple[str, AtlasCluster], None, None]:
+        for name, atlas_map in self.maps.items():
+            for cluster in atlas_map.clusters:
+                yield name, cluster
+
+    def query(self, conditions: List) -> List[Tuple[str, AtlasCluster]]:
+        """
+        The clusters in every organization that satisfy all the conditions,
+        see AtlasMap.query
+        """
+        self.populate()
+        return [(name, cluster) for name, atlas_map in self.maps.items()
+                if name not in self.errors
+                for cluster in atlas_map.query(conditions)]
+
+    def pprint(self):
+        for name, atlas_map in self.maps.items():
+            print(f"[{name}]")
+            atlas_map.pprint()
+        for name, error in self.errors.items():
+            print(f"[{name}] could not be read: {error}")
@@ -0,0 +1,404 @@
+"""
+Desired-state plan and apply
+~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+Describe the clusters each project should have and let atlascli work out
+the calls that get there, e.g.
+
+    atlascli plan -f fleet.json
+    atlascli apply -f fleet.json --wait
+
+with a fleet file like
+
+    {
+      "projects": {
+        "dev-project": {
+          "prune": false,
+          "clusters": {
+            "dev1": {"instanceSize": "M20", "diskSizeGB": 40, "paused": false},
+            "dev2": {"paused": true},
+            "scratch": {"delete": true},
+            "new": {"instanceSize": "M10", "config": {"providerSettings": {"regionName": "EU_WEST_1"}}}
+          }
+        }
+      }
+    }
+
+Projects are keyed by id or name. A cluster's instanceSize, diskSizeGB and
+paused are compared with the AtlasMap and only what differs is changed. Fields
+that are left out are not changed. A cluster that does not exist is created
+from its "config", which is merged over the default single region cluster.
+"delete": true deletes a cluster, and "prune": true deletes the clusters of
+the project that the file does not list.
+
+Each cluster's changes are one chain of API calls. A resize and a disk change
+are merged into one PATCH. Atlas will not modify a paused cluster or pause a
+cluster that is still changing, so a paused cluster is resumed before it is
+modified and paused again afterwards, and a cluster created paused is paused
+once it is IDLE. FleetApplier runs the first call of every chain concurrently,
+waits with a ClusterWaiter for the clusters that have more to do, then runs
+the next call of each chain, and so on.
+"""
+import copy
+import logging
+import time
+from typing import Callable, Dict, List, Optional, Tuple
+
+from colorama import Fore
+
+from atlascli import jsoncodec
+from atlascli.atlascluster import AtlasCluster
+from atlascli.bulk import BulkExecutor, BulkOp, BulkResult
+from atlascli.clusterid import ClusterID
+from atlascli.waiter import ClusterWaiter, WaitTarget
+
+ClusterKey = Tuple[str, str]  # (project id, cluster name)
+
+
+def merge_config(base: Dict, overrides: Dict) -> Dict:
+    """
+    A copy of base with overrides merged in, nested dicts are merged rather than replaced
+    """
+    merged = copy.deepcopy(base)
+    for k, v in overrides.items():
+        if isinstance(v, dict) and isinstance(merged.get(k), dict):
+            merged[k] = merge_config(merged[k], v)
+        else:
+            merged[k] = copy.deepcopy(v)
+    return merged
+
+
+class ClusterSpec:
+
+    FIELDS = ("instanceSize", "diskSizeGB", "paused", "config", "delete")
+
+    def __init__(self, project_id: str, name: str, instance_size: str = None, disk_size: float = None,
+                 paused: bool = None, config: Dict = None, delete: bool = False):
+        """
+        :param instance_size: e.g. M10, unchanged if None
+        :param disk_size: in GB, unchanged if None
+        :param paused: unchanged if None
+        :param config: the cluster config for a create, merged over the default single region cluster
+        :param delete: the cluster should not exist
+        """
+        self.project_id = project_id
+        self.name = ClusterID.validate_cluster_name(name)
+        self.instance_size = instance_size
+        self.disk_size = float(disk_size) if disk_size is not None else None
+        self.paused = paused
+        self.config = config or {}
+        self.delete = delete
+
+    @classmethod
+    def from_dict(cls, project_id: str, name: str, doc: Dict) -> "ClusterSpec":
+        unknown = set(doc) - set(cls.FIELDS)
+        if unknown:
+            raise ValueError(f"cluster '{name}': unknown fields {', '.join(sorted(unknown))}")
+        return cls(project_id, name, doc.get("instanceSize"), doc.get("diskSizeGB"), doc.get("paused"),
+                   doc.get("config"), doc.get("delete", False))
+
+    @property
+    def key(self) -> ClusterKey:
+        return self.project_id, self.name
+
+    def create_config(self) -> Dict:
+        config = merge_config(AtlasCluster.default_single_region_cluster(), self.config)
+        if self.instance_size is not None:
+            config.setdefault("providerSettings", {})["instanceSizeName"] = self.instance_size
+        if self.disk_size is not None:
+            config["diskSizeGB"] = self.disk_size
+        config["name"] = self.name
+        return config
+
+    def __repr__(self):
+        return f"ClusterSpec({self.project_id}:{self.name})"
+
+
+class FleetSpec:
+
+    def __init__(self, clusters: List[ClusterSpec], prune: List[str] = None):
+        """
+        :param prune: ids of the projects whose unlisted clusters are deleted
+        """
+        self.clusters = clusters
+        self.prune = list(prune or [])
+
+    @property
+    def project_ids(self) -> List[str]:
+        """
+        The projects the spec describes clusters in or prunes
+        """
+        return list(dict.fromkeys([c.project_id for c in self.clusters] + self.prune))
+
+    @classmethod
+    def from_dict(cls, doc: Dict, atlas_map) -> "FleetSpec":
+        """
+        :param atlas_map: resolves project names to ids
+        """
+        clusters = []
+        prune = []
+        for project, project_doc in doc.get("projects", {}).items():
+            if atlas_map.is_project_id(project):
+                project_id = project
+            else:
+                project_id = atlas_map.get_project_id(project)
+                if project_id is None:
+                    raise ValueError(f"'{project}' is not a project id or name in this organization")
+            if project_doc.get("prune", False):
+                prune.append(project_id)
+            for name, cluster_doc in project_doc.get("clusters", {}).items():
+                clusters.append(ClusterSpec.from_dict(project_id, name, cluster_doc))
+        keys = [c.key for c in clusters]
+        if len(set(keys)) != len(keys):
+            raise ValueError("a cluster is listed more than once")
+        return cls(clusters, prune)
+
+    @classmethod
+    def load(cls, path: str, atlas_map) -> "FleetSpec":
+        with open(path, encoding="utf-8") as f:
+            return cls.from_dict(jsoncodec.load(f), atlas_map)
+
+
+class FleetStep:
+
+    def __init__(self, op: BulkOp, target, data: Dict = None, settle: WaitTarget = None):
+        """
+        :param target: the cluster, or a ClusterID for a create
+        :param data: the modifications for MODIFY, the config for CREATE
+        :param settle: what the cluster must reach before the next step
+        """
+        self.op = op
+        self.target = target
+        self.data = data
+        self.settle = settle
+
+    def describe(self) -> str:
+        if self.op is BulkOp.MODIFY:
+            changes = []
+            if "providerSettings" in self.data:
+                changes.append(f"instance size {self.data['providerSettings']['instanceSizeName']}")
+            if "diskSizeGB" in self.data:
+                changes.append(f"disk {self.data['diskSizeGB']}GB")
+            return f"modify {', '.join(changes)}"
+        if self.op is BulkOp.CREATE:
+            return f"create {self.data['providerSettings'].get('instanceSizeName')} " \
+                   f"disk {self.data.get('diskSizeGB')}GB"
+        return str(self.op)
+
+    def __repr__(self):
+        return f"FleetStep({self.op}, {self.target.project_id}:{self.target.name})"
+
+
+class ClusterChange:
+
+    def __init__(self, project_id: str, name: str, steps: List[FleetStep], settle_first: WaitTarget = None):
+        """
+        :param steps: the calls for this cluster, in order
+        :param settle_first: wait for this before the first step, the cluster is still changing
+        """
+        self.project_id = project_id
+        self.name = name
+        self.steps = steps
+        self.settle_first = settle_first
+
+    @property
+    def key(self) -> ClusterKey:
+        return self.project_id, self.name
+
+    def describe(self) -> str:
+        return " then ".join(step.describe() for step in self.steps)
+
+
+class DesiredStatePlan:
+
+    def __init__(self, changes: List[ClusterChange], unchanged: List[ClusterKey]):
+        self.changes = changes
+        self.unchanged = unchanged
+
+    @property
+    def api_calls(self) -> int:
+        """
+        The requests that change clusters, not counting the listings made while waiting
+        """
+        return sum(len(c.steps) for c in self.changes)
+
+    def count(self, op: BulkOp) -> int:
+        return sum(1 for c in self.changes for s in c.steps if s.op is op)
+
+    @property
+    def deletes(self) -> List[ClusterKey]:
+        return [c.key for c in self.changes if any(s.op is BulkOp.DELETE for s in c.steps)]
+
+    def pprint(self, atlas_map=None):
+        for change in self.changes:
+            project = atlas_map.get_project_name(change.project_id) if atlas_map else None
+            colour = Fore.RED if any(s.op is BulkOp.DELETE for s in change.steps) else Fore.YELLOW
+            print(f"  {colour}{change.project_id}:{change.name}{Fore.RESET}" +
+                  (f" ({project})" if project else "") + f": {change.describe()}")
+        for project_id, name in self.unchanged:
+            print(f"  {project_id}:{name} is up to date")
+        print(f"{Fore.LIGHTWHITE_EX}{len(self.changes)}{Fore.RESET} cluster(s) to change, "
+              f"{len(self.unchanged)} up to date, {self.api_calls} API call(s)")
+
+
+def _modifications(cluster, spec: ClusterSpec) -> Dict:
+    modifications = {}
+    if spec.instance_size is not None and spec.instance_size != cluster.instance_size():
+        modifications["providerSettings"] = {"providerName": cluster.provider_name(),
+                                             "instanceSizeName": spec.instance_size}
+    if spec.disk_size is not None and spec.disk_size != float(cluster.disk_size()):
+        modifications["diskSizeGB"] = spec.disk_size
+    return modifications
+
+
+def _cluster_steps(cluster, spec: ClusterSpec) -> List[FleetStep]:
+    key = spec.key
+    if spec.delete:
+        if cluster is None or cluster.state == "DELETING":
+            return []
+        return [FleetStep(BulkOp.DELETE, cluster, settle=WaitTarget(*key, deleted=True))]
+
+    if cluster is None:
+        steps = [FleetStep(BulkOp.CREATE, ClusterID(*key), spec.create_config(), WaitTarget(*key, changing=True))]
+        if spec.paused:
+            steps.append(FleetStep(BulkOp.PAUSE, ClusterID(*key), settle=WaitTarget(*key, paused=True, changing=True)))
+        return steps
+
+    paused = cluster.is_paused()
+    want_paused = paused if spec.paused is None else spec.paused
+    modifications = _modifications(cluster, spec)
+    steps = []
+    if modifications:
+        if paused:
+            steps.append(FleetStep(BulkOp.RESUME, cluster, settle=WaitTarget(*key, paused=False, changing=True)))
+        steps.append(FleetStep(BulkOp.MODIFY, cluster, modifications, WaitTarget(*key, paused=False, changing=True)))
+        if want_paused:
+            steps.append(FleetStep(BulkOp.PAUSE, cluster, settle=WaitTarget(*key, paused=True, changing=True)))
+    elif want_paused != paused:
+        op = BulkOp.PAUSE if want_paused else BulkOp.RESUME
+        steps.append(FleetStep(op, cluster, settle=WaitTarget(*key, paused=want_paused, changing=True)))
+    return steps
+
+
+def plan_fleet(spec: FleetSpec, atlas_map) -> DesiredStatePlan:
+    """
+    Compare the desired state with the AtlasMap and return the fewest calls
+    that make them match.
+    """
+    listed = {c.key for c in spec.clusters}
+    specs = list(spec.clusters)
+    for project_id in spec.prune:
+        specs.extend(ClusterSpec(project_id, c.name, delete=True)
+                     for c in atlas_map.get_clusters(project_id) if (project_id, c.name) not in listed)
+
+    changes = []
+    unchanged = []
+    for cluster_spec in sorted(specs, key=lambda s: s.key):
+        cluster = atlas_map.resolve_cluster(*cluster_spec.key)
+        if cluster is not None and cluster.state == "DELETING" and not cluster_spec.delete:
+            raise ValueError(f"{cluster_spec.project_id}:{cluster_spec.name} is being deleted, "
+                             f"apply again once it is gone")
+        steps = _cluster_steps(cluster, cluster_spec)
+        if not steps:
+            unchanged.append(cluster_spec.key)
+            continue
+        settle_first = None
+        if cluster is not None and cluster.state != "IDLE" and steps[0].op is not BulkOp.DELETE:
+            settle_first = WaitTarget(*cluster_spec.key)
+        changes.append(ClusterChange(*cluster_spec.key, steps, settle_first))
+    return DesiredStatePlan(changes, unchanged)
+
+
+class ApplyResult:
+
+    def __init__(self, results: List[BulkResult], failed: Dict[ClusterKey, str], pending: List[ClusterKey]):
+        """
+        :param results: every call made
+        :param failed: clusters whose chain stopped at a failed call or a timeout, with the reason
+        :param pending: clusters whose calls were made but that had not settled when the wait ended
+        """
+        self.results = results
+        self.failed = failed
+        self.pending = pending
+
+    @property
+    def ok(self) -> bool:
+        return not self.failed and not self.pending
+
+    def summary(self) -> Dict[str, int]:
+        done = {BulkOp.CREATE: "created", BulkOp.MODIFY: "modified", BulkOp.PAUSE: "paused",
+                BulkOp.RESUME: "resumed", BulkOp.DELETE: "deleted"}
+        summary = {label: sum(1 for r in self.results if r.ok and r.op is op) for op, label in done.items()}
+        summary["failed"] = len(self.failed)
+        return summary
+
+
+class FleetApplier:
+
+    def __init__(self, atlas_map, workers: int = 8, per_project: int = 2, waiter: ClusterWaiter = None,
+                 clock: Callable[[], float] = time.monotonic):
+        """
+        :param atlas_map: the AtlasMap to change, it is kept up to date as calls complete
+        :param workers: maximum number of calls in flight
+        :param per_project: maximum number of calls in flight for any one project
+        :param waiter: waits for clusters between the steps of their chains
+        """
+        self._log = logging.getLogger(__name__)
+        self._map = atlas_map
+        self._executor = BulkExecutor(atlas_map, workers=workers, per_project=per_project)
+        self._waiter = waiter if waiter else ClusterWaiter(atlas_map.api, atlas_map, workers=workers)
+        self._clock = clock
+
+    def apply(self, plan: DesiredStatePlan, wait: bool = False, timeout: float = None,
+              on_result: Callable[[BulkResult], None] = None,
+              on_settled: Callable[[WaitTarget], None] = None) -> ApplyResult:
+        """
+        Carry out the plan, one step of every chain at a time.
+
+        :param wait: also wait for each cluster to settle after its last step
+        :param timeout: seconds for the whole apply, a chain still waiting when it
+        expires is reported as failed
+        """
+        start = self._clock()
+        chains = {c.key: list(c.steps) for c in plan.changes}
+        failed: Dict[ClusterKey, str] = {}
+        results: List[BulkResult] = []
+        pending: List[ClusterKey] = []
+
+        def remaining() -> Optional[float]:
+            return None if timeout is None else max(0.0, timeout - (self._clock() - start))
+
+        def settle(targets: List[WaitTarget], final: bool = False):
+            if not targets:
+                return
+            waited = self._waiter.wait(targets, timeout=remaining(),
+                                       on_reached=(lambda t, c: on_settled(t)) if on_settled else None)
+            for key, target in waited.pending.items():
+                if final:
+                    pending.append(key)
+                else:
+                    failed[key] = f"timed out waiting for it to be {target.describe()}"
+                    chains.pop(key, None)
+
+        settle([c.settle_first for c in plan.changes if c.settle_first])
+        last_steps = []
+        while chains:
+            wave = [(key, steps.pop(0)) for key, steps in chains.items()]
+            wave_results = self._executor.run(((step.op, step.target, step.data) for _, step in wave),
+                                              on_result=on_result)
+            results.extend(wave_results)
+            next_targets = []
+            for (key, step), result in zip(wave, wave_results):
+                if not result.ok:
+                    failed[key] = f"{result.op} failed: {result.error}"
+                    if chains.pop(key):
+                        self._log.warning(f"skipping the remaining steps for {key[0]}:{key[1]}")
+                elif chains[key]:
+                    next_targets.append(step.settle)
+                else:
+                    chains.pop(key)
+                    last_steps.append(step.settle)
+            settle(next_targets)
+        if wait:
+            settle(last_steps, final=True)
+        return ApplyResult(results, failed, pending)
@@ -0,0 +1,60 @@
+"""
+JSON encoding and decoding
+~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+All of atlascli's JSON goes through this module. When orjson is installed
+(pip install atlascli[fast]) it is used for decoding API responses and
+encoding resources, otherwise the standard library json module is used.
+The json module is called with orjson's layout, compact separators or an
+indent of 2 and non-ASCII characters written as they are, so both produce
+the same text for the documents atlascli handles, including datetime
+values, which are written as str(datetime).
+"""
+import json
+from typing import Any, IO, Union
+
+try:
+    import orjson
+except ImportError:  # orjson is an optional dependency
+    orjson = None
+
+BACKEND = "orjson" if orjson else "json"
+
+
+def json_datetime_encoder(item: Any) -> str:
+    return str(item)
+
+
+def _orjson_dumps(obj: Any, indent: int = None) -> str:
+    option = orjson.OPT_PASSTHROUGH_DATETIME  # route datetimes through json_datetime_encoder
+    if indent:
+        option |= orjson.OPT_INDENT_2
+    return orjson.dumps(obj, default=json_datetime_encoder, option=option).decode("utf-8")
+
+
+def dumps(obj: Any, indent: int = None) -> str:
+    """
+    Encode 'obj' as a JSON string. orjson only indents by 2 and only accepts
+    str keys, anything else is encoded by the json module.
+    """
+    if orjson and indent in (None, 2):
+        try:
+            return _orjson_dumps(obj, indent)
+        except TypeError:
+            pass
+    separators = (",", ":") if indent is None else (",", ": ")
+    return json.dumps(obj, indent=indent, separators=separators, ensure_ascii=False, default=json_datetime_encoder)
+
+
+def loads(s: Union[str, bytes]) -> Any:
+    if orjson:
+        return orjson.loads(s)
+    return json.loads(s)
+
+
+def dump(obj: Any, output_file: IO, indent: int = None):
+    output_file.write(dumps(obj, indent=indent))
+
+
+def load(input_file: IO) -> Any:
+    return loads(input_file.read())
@@ -24,6 +24,7 @@ Paused or Resumed
 Author: Joe.Drumgoole@mongodb.com
 """
 import argparse
+import atexit
 import requests
 import os
 import pprint
@@ -40,10 +41,53 @@ from atlascli.config import Config, initialise
 from atlascli.errors import AtlasError, AtlasGetError
 from atlascli.atlasapi import AtlasAPI
 from atlascli.config import Config
+from atlascli.responsecache import ResponseCache
+from atlascli.retry import RetryPolicy
+from atlascli.selector import ClusterSelector, is_glob
 from atlascli.version import __VERSION__
 
 from atlascli.atlasmap import AtlasMap
 from atlascli.commands import Commands
+from atlascli.federatedmap import FederatedAtlasMap
+
+
+def page_size_arg(s: str):
+    if s == AtlasAPI.AUTO_PAGE_SIZE:
+        return s
+    try:
+        size = int(s)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"'{s}' is not a number or '{AtlasAPI.AUTO_PAGE_SIZE}'")
+    if size < 1 or size > 500:
+        raise argparse.ArgumentTypeError(f"page size must be between 1 and 500")
+    return size
+
+
+def cluster_pattern_arg(s: str):
+    if is_glob(s):
+        if ":" in s:
+            raise argparse.ArgumentTypeError(f"'{s}': name globs match cluster names only, "
+                                             f"use --project to choose the project")
+        return s
+    try:
+        return ClusterID.validate_cluster_arg(s)
+    except ValueError as e:
+        raise argparse.ArgumentTypeError(str(e))
+
+
+def add_selector_args(subparser, verb: str):
+    subparser.add_argument("--project", nargs="+",
+                           help=f"{verb.capitalize()} the clusters in these projects (ids or names)")
+    subparser.add_argument("--all", dest="select_all", default=False, action="store_true",
+                           help=f"{verb.capitalize()} every cluster allowed by the other selectors")
+    subparser.add_argument("--instance-size", dest="instance_size", nargs="+",
+                           help="Only clusters of these instance sizes, e.g. M10 M20")
+    subparser.add_argument("--state", nargs="+",
+                           help="Only clusters in these states, 'running', 'paused' or an Atlas "
+                                "stateName such as IDLE")
+    subparser.add_argument("--dry-run", dest="dry_run", default=False, action="store_true",
+                           help=f"Print the clusters that would be {verb}d and the number of API calls "
+                                f"it would take, and change nothing")
 
 
 def main(argv : list[str] = None):
@@ -78,37 +122,117 @@ def main(argv : list[str] = None):
 
     clone_parser = subparsers.add_parser("clone")
 
-    clone_parser.add_argument("-c", "--cluster_name", type=ClusterID.validate_cluster_name, help="Clone this cluster")
+    clone_parser.add_argument("-c", "--cluster_name", type=ClusterID.validate_cluster_arg, help="Clone this cluster")
 
     clone_parser.add_argument('-o', '--output', type=argparse.FileType('w', encoding='UTF-8'),
                               help="Write the cloned cluster to this file")
 
     pause_parser = subparsers.add_parser('pause', help="Pause a cluster")
 
-    pause_parser.add_argument('-c', '--cluster_name', type=ClusterID.validate_cluster_name, nargs="*",
-                              help="List of Cluster names to pause")
+    pause_parser.add_argument("--wait", default=False, action="store_true",
+                              help="Wait until the clusters are paused")
+
+    pause_parser.add_argument("--timeout", type=float,
+                              help="Give up waiting after this many seconds")
+
+    pause_parser.add_argument("--parallel", type=int, default=4,
+                              help="Number of clusters to pause concurrently [default: %(default)s]")
+
+    pause_parser.add_argument('-c', '--cluster_name', type=cluster_pattern_arg, nargs="*",
+                              help="List of Cluster names or name globs such as 'dev-*' to pause")
+
+    add_selector_args(pause_parser, "pause")
 
     resume_parser = subparsers.add_parser('resume', help="Resume a cluster")
 
-    resume_parser.add_argument('-c', '--cluster_name', type=ClusterID.validate_cluster_name, nargs="*",
-                               help="List of Cluster names to resume")
+    resume_parser.add_argument("--wait", default=False, action="store_true",
+                               help="Wait until the clusters are running")
+
+    resume_parser.add_argument("--timeout", type=float,
+                               help="Give up waiting after this many seconds")
+
+    resume_parser.add_argument("--parallel", type=int, default=4,
+                               help="Number of clusters to resume concurrently [default: %(default)s]")
+
+    resume_parser.add_argument('-c', '--cluster_name', type=cluster_pattern_arg, nargs="*",
+                               help="List of Cluster names or name globs such as 'dev-*' to resume")
+
+    add_selector_args(resume_parser, "resume")
+
+    plan_parser = subparsers.add_parser('plan', help="Show the changes that would make the clusters "
+                                                     "match a fleet file")
+
+    plan_parser.add_argument("-f", "--file", required=True,
+                             help="JSON fleet file giving the instance size, disk size and paused state "
+                                  "of the clusters in each project")
+
+    apply_parser = subparsers.add_parser('apply', help="Change the clusters to match a fleet file")
+
+    apply_parser.add_argument("-f", "--file", required=True,
+                              help="JSON fleet file giving the instance size, disk size and paused state "
+                                   "of the clusters in each project")
+
+    apply_parser.add_argument("--parallel", type=int, default=4,
+                              help="Number of clusters to change concurrently [default: %(default)s]")
+
+    apply_parser.add_argument("--wait", default=False, action="store_true",
+                              help="Wait until every changed cluster has settled")
+
+    apply_parser.add_argument("--timeout", type=float,
+                              help="Give up waiting after this many seconds")
+
+    apply_parser.add_argument("-y", "--yes", default=False, action="store_true",
+                              help="Delete clusters without asking")
+
+    schedule_parser = subparsers.add_parser('schedule', help="Pause and resume clusters on a schedule "
+                                                             "until stopped")
+
+    schedule_parser.add_argument("-f", "--file", required=True,
+                                 help="JSON schedule of rules, each with a name, a cron expression, "
+                                      "an action (pause or resume) and the selectors for its clusters")
+
+    schedule_parser.add_argument("--status",
+                                 help="Record the state of each rule in this file, it is also read at "
+                                      "startup to catch up on rules missed while not running")
+
+    schedule_parser.add_argument("--parallel", type=int, default=4,
+                                 help="Number of clusters each rule changes concurrently [default: %(default)s]")
+
+    schedule_parser.add_argument("--refreshinterval", type=float, default=900,
+                                 help="Seconds between refreshes of the organization's clusters "
+                                      "[default: %(default)s]")
+
+    schedule_parser.add_argument("--check", default=False, action="store_true",
+                                 help="Check the schedule and print when each rule is next due, then exit")
 
     list_parser = subparsers.add_parser('list', help="List organizations, projects and/or clusters")
 
-    list_parser.add_argument('-c', '--cluster_name', type=ClusterID.validate_cluster_name, nargs="*",
-                             help="List of Cluster names to print")
+    list_parser.add_argument('-c', '--cluster_name', type=ClusterID.validate_cluster_arg, nargs="*",
+                             help="List of Cluster names to print, with --allorgs a name can be "
+                                  "qualified as org:project_id:cluster")
 
     list_parser.add_argument('-p', '--project_id', type=ProjectID.canonical_project_id, nargs="*",
                                help="List of project IDs to print")
 
-    list_parser.add_argument('-org', '--organization', default=False, action="store_true",
+    list_parser.add_argument('-org', '--organization', dest="print_org", default=False, action="store_true",
                              help="print out the organization")
 
     list_parser.add_argument('-o', '--output', type=argparse.FileType('w', encoding='UTF-8'),
                              help="Send the output of this list command to a file")
 
+    list_parser.add_argument('-w', '--where', nargs="+",
+                             help="List the clusters matching all of these conditions, e.g. "
+                                  "'state=IDLE' 'size>=M40' 'provider=AWS' 'region=US_EAST_1'. Fields are "
+                                  "state, paused, size, provider, region, disk and project")
+
     create_parser = subparsers.add_parser('create', help="Create a cluster")
 
+    create_parser.add_argument("--wait", default=False, action="store_true",
+                               help="Wait until the cluster is created")
+
+    create_parser.add_argument("--timeout", type=float,
+                               help="Give up waiting after this many seconds")
+
     create_parser.add_argument("-c", "--cluster_name", type=ClusterID.canonical_name,
                                help="specify the name of the cluster as <project_id>:<cluster_name>")
 
@@ -123,6 +247,12 @@ def main(argv : list[str] = None):
 
     delete_parser = subparsers.add_parser("delete", help="Delete a cluster")
 
+    delete_parser.add_argument("--wait", default=False, action="store_true",
+                               help="Wait until the cluster is deleted")
+
+    delete_parser.add_argument("--timeout", type=float,
+                               help="Give up waiting after this many seconds")
+
     delete_parser.add_argument("-c", "--cluster_name", type=ClusterID.canonical_name,
                                help="Delete cluster defined in arg")
 
@@ -142,6 +272,53 @@ def main(argv : list[str] = None):
     parser.add_argument("-d", "--debug", default=False, action="store_true",
                         help="Turn on logging at debug level")
 
+    parser.add_argument("--pagesize", type=page_size_arg, default=100,
+                        help=f"Number of items to request per page (1-500) or '{AtlasAPI.AUTO_PAGE_SIZE}' to "
+                             f"choose a page size from the size and latency of previous pages [default: %(default)s]")
+
+    parser.add_argument("--ratelimit", type=float,
+                        help="Maximum number of Atlas API requests per second, requests over "
+                             "this rate are delayed rather than rejected by Atlas")
+
+    parser.add_argument("--cachedir",
+                        help="Keep Atlas API responses in this directory and revalidate them "
+                             "with conditional GETs on later runs")
+
+    parser.add_argument("--cachettl", type=float, default=24 * 3600,
+                        help="Seconds a cached response is kept after it was last validated [default: %(default)s]")
+
+    parser.add_argument("--crawlworkers", type=int, default=4,
+                        help="Number of projects whose clusters are listed concurrently "
+                             "when reading the organization [default: %(default)s]")
+
+    parser.add_argument("--crawl", choices=AtlasMap.STRATEGIES, default=AtlasMap.ORG_CLUSTERS_STRATEGY,
+                        help=f"How to find the clusters in the organization. '{AtlasMap.ORG_CLUSTERS_STRATEGY}' "
+                             f"uses the organization wide cluster list to skip projects without clusters, "
+                             f"'{AtlasMap.PROJECTS_STRATEGY}' lists the clusters of every project [default: %(default)s]")
+
+    parser.add_argument("--snapshotdir",
+                        help="Save the organization's projects and clusters in this directory "
+                             "and start later commands from the saved copy")
+
+    parser.add_argument("--snapshotttl", type=float, default=3600,
+                        help="Seconds a saved copy of the organization is used before it is "
+                             "refreshed in the background [default: %(default)s]")
+
+    parser.add_argument("--refresh", default=False, action="store_true",
+                        help="Ignore any saved copy of the organization and read it from Atlas")
+
+    parser.add_argument("--compact", default=False, action="store_true",
+                        help="Keep only summary fields for each cluster in memory and fetch "
+                             "full cluster documents when they are needed")
+
+    parser.add_argument("--allorgs", default=False, action="store_true",
+                        help="Use every organization in the config file, each with its own keys. "
+                             "Only the list command is supported")
+
+    parser.add_argument("--retries", type=int, default=5,
+                        help="Number of times to retry a request that was rate limited "
+                             "or failed with a server error [default: %(default)s]")
+
     config_parser = subparsers.add_parser("config", help="Configure the config file for storing API keys")
 
     config_parser.add_argument("-i", "--initialize", action="store_true", default=False,
@@ -178,7 +355,7 @@ def main(argv : list[str] = None):
         config = Config()
 
     if args.organization:
-        org = args.org
+        org = args.organization
     else:
         org = config.get_default_org()
 
@@ -204,6 +381,30 @@ def main(argv : list[str] = None):
             else:
                 config.pprint()
 
+    cache = None
+    if args.cachedir:
+        cache = ResponseCache(default_ttl=args.cachettl, directory=args.cachedir)
+
+    def make_api(name: str = None) -> AtlasAPI:
+        return AtlasAPI(page_size=args.pagesize,
+                        retry_policy=RetryPolicy(max_retries=args.retries),
+                        rate_limit=args.ratelimit,
+                        cache=cache)
+
+    map_options = dict(crawl_workers=args.crawlworkers,
+                       strategy=args.crawl,
+                       snapshot_dir=args.snapshotdir,
+                       snapshot_ttl=args.snapshotttl,
+                       refresh=args.refresh,
+                       compact=args.compact)
+
+    if args.allorgs:
+        if args.subparser_name != "list":
+            raise SystemExit("--allorgs only supports the list command")
+        federated_map = FederatedAtlasMap.from_config(config, api_factory=make_api, **map_options)
+        Commands.federated_list_cmd(federated_map, args.print_org, args.project_id, args.cluster_name, args.where)
+        return
+
     if args.publickey:
         public_key = args.publickey
     else:
@@ -228,7 +429,7 @@ def main(argv : list[str] = None):
                                  "or in the atlascli.cfg file " 
                                  "arg or the environment variable ATLAS_PRIVATE_KEY")
 
-    api = AtlasAPI()
+    api = make_api()
     org = None
     api.authenticate(AtlasKey(public_key, private_key))
     try:
@@ -237,7 +438,8 @@ def main(argv : list[str] = None):
         raise SystemExit("Your keys may be invalid.  Please check the values for "
                          "ATLAS_PRIVATE_KEY and ATLAS_PUBLIC_KEY")
 
-    atlas_map = AtlasMap(org, api)
+    atlas_map = AtlasMap(org, api, **map_options)
+    atexit.register(atlas_map.flush_snapshot)  # save the changes a command made once, even if it exits early
     commands = Commands(atlas_map)
 
     if args.subparser_name == "clone":
@@ -248,7 +450,7 @@ def main(argv : list[str] = None):
 
     if args.subparser_name == "create":
         if args.cluster_name:
-            commands.create_cluster_cmd(args.cluster_name, args.jsonconfig, args.output)
+            commands.create_cluster_cmd(args.cluster_name, args.jsonconfig, args.output, args.wait, args.timeout)
         if args.project_name:
             commands.create_project_cmd(args.project_name, args.output)
 
@@ -257,17 +459,35 @@ def main(argv : list[str] = None):
 
     if args.subparser_name == "delete":
         if args.cluster_name:
-            commands.delete_cluster_cmd(args.cluster_name)
+            commands.delete_cluster_cmd(args.cluster_name, args.wait, args.timeout)
         if args.project_name:
             commands.delete_project_cmd(args.project_name)
 
+    if args.subparser_name in ("pause", "resume"):
+        selector = ClusterSelector(projects=args.project,
+                                   select_all=args.select_all,
+                                   instance_sizes=args.instance_size,
+                                   states=args.state)
+
     if args.subparser_name == "pause" :
-        commands.pause_cmd(args.cluster_name)
+        commands.pause_cmd(args.cluster_name, args.parallel, args.wait, args.timeout, selector, args.dry_run)
 
     if args.subparser_name == "resume":
-        commands.resume_cmd(args.cluster_name)
+        commands.resume_cmd(args.cluster_name, args.parallel, args.wait, args.timeout, selector, args.dry_run)
+
+    if args.subparser_name == "plan":
+        commands.plan_cmd(args.file)
+
+    if args.subparser_name == "apply":
+        commands.apply_cmd(args.file, args.parallel, args.wait, args.timeout, args.yes)
 
-    if args.subparser_name == "list":
+    if args.subparser_name == "schedule":
+        commands.schedule_cmd(args.file, args.status, args.parallel, args.refreshinterval, args.check)
+
+    if args.subparser_name == "list" and args.where:
+        commands.query_cmd(args.where, args.output)
+
+    elif args.subparser_name == "list":
 
         if args.cluster_name is not None and (len(args.cluster_name) == 0):
             cluster_names = list(atlas_map.get_cluster_names())
@@ -277,7 +497,9 @@ def main(argv : list[str] = None):
             project_ids = list(atlas_map.get_project_ids())
         else:
             project_ids = args.project_id
-        commands.list_cmd(args.organization, project_ids, cluster_names, args.output)
+        commands.list_cmd(args.print_org, project_ids, cluster_names, args.output)
+
+    logging.debug(f"api stats: {api.stats()}")
 
 
 if __name__ == "__main__":
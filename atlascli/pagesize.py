@@ -0,0 +1,137 @@
+"""
+Adaptive page sizing
+~~~~~~~~~~~~~~~~~~~~
+
+Atlas lets a client ask for between 1 and 500 items per page. Each page
+costs a round trip, so fewer, larger pages are normally faster. The
+exceptions are very large documents, where a page can grow to many
+megabytes, and slow listings, where a single page can take long enough
+to time out.
+
+PageSizeController records the response size and latency of each page it
+is told about, keyed by the shape of the resource, so the cluster listing
+of one project informs the next. It then picks the largest page size that
+stays under a byte and a latency budget. The 'totalCount' of a listing is
+kept per concrete resource, so a page is never larger than that resource is
+known to hold, but a small project does not shrink the pages of the next.
+"""
+import logging
+import math
+import re
+import threading
+from collections import deque
+from typing import Dict, Optional
+from urllib.parse import urlparse
+
+
+class PageSizeController:
+
+    MIN_PAGE_SIZE = 1
+    MAX_PAGE_SIZE = 500
+
+    ID_RE = re.compile(r"/[0-9a-fA-F]{24}(?=/|$)")
+
+    def __init__(self,
+                 initial_page_size: int = MAX_PAGE_SIZE,
+                 max_page_bytes: int = 4 * 1024 * 1024,
+                 target_page_seconds: float = 20.0,
+                 smoothing: float = 0.5,
+                 history: int = 100):
+        """
+        :param initial_page_size: page size used for a resource we know nothing about
+        :param max_page_bytes: keep the expected size of a page under this many bytes
+        :param target_page_seconds: keep the expected latency of a page under this
+        :param smoothing: weight given to the newest observation (0..1)
+        :param history: number of decisions kept for stats()
+        """
+        self._log = logging.getLogger(__name__)
+        self._initial_page_size = self.clamp(initial_page_size)
+        self._max_page_bytes = max_page_bytes
+        self._target_page_seconds = target_page_seconds
+        self._smoothing = smoothing
+        self._lock = threading.Lock()
+        self._observations: Dict[str, Dict] = {}
+        self._total_counts: Dict[str, int] = {}  # concrete resource path to its last totalCount
+        self._decisions = deque(maxlen=history)
+
+    @classmethod
+    def clamp(cls, page_size: int) -> int:
+        return max(cls.MIN_PAGE_SIZE, min(cls.MAX_PAGE_SIZE, int(page_size)))
+
+    @classmethod
+    def resource_key(cls, resource: str) -> str:
+        """
+        Reduce a URL or resource path to its shape, e.g.
+        https://.../groups/5a141a774e65811a132a8010/clusters?pageNum=2 -> /groups/{id}/clusters
+        """
+        return cls.ID_RE.sub("/{id}", cls.resource_path(resource))
+
+    @staticmethod
+    def resource_path(resource: str) -> str:
+        """
+        The path of a URL or resource without its query, e.g.
+        https://.../groups/5a141a774e65811a132a8010/clusters?pageNum=2 -> /groups/5a141a774e65811a132a8010/clusters
+        """
+        return urlparse(resource).path.split("/api/atlas/v1.0", 1)[-1]
+
+    def _smooth(self, old: Optional[float], new: float) -> float:
+        if old is None:
+            return new
+        return self._smoothing * new + (1 - self._smoothing) * old
+
+    def observe(self, resource: str, items: int, total_count: Optional[int], nbytes: int, seconds: float):
+        """
+        Record the outcome of fetching one page of 'resource'
+        """
+        key = self.resource_key(resource)
+        with self._lock:
+            obs = self._observations.setdefault(key, {"pages": 0,
+                                                      "bytes_per_item": None,
+                                                      "seconds_per_item": None})
+            obs["pages"] += 1
+            if total_count is not None:
+                self._total_counts[self.resource_path(resource)] = total_count
+            if items > 0:
+                obs["bytes_per_item"] = self._smooth(obs["bytes_per_item"], nbytes / items)
+                obs["seconds_per_item"] = self._smooth(obs["seconds_per_item"], seconds / items)
+
+    def choose(self, resource: str) -> int:
+        """
+        Pick 'itemsPerPage' for the next request of 'resource'
+        """
+        key = self.resource_key(resource)
+        with self._lock:
+            obs = self._observations.get(key)
+            total_count = self._total_counts.get(self.resource_path(resource))
+            if obs is None:
+                size = self._initial_page_size
+                reason = "no history"
+            else:
+                size = self.MAX_PAGE_SIZE
+                reason = "fewest round trips"
+                if obs["bytes_per_item"]:
+                    limit = math.floor(self._max_page_bytes / obs["bytes_per_item"])
+                    if limit < size:
+                        size, reason = limit, f"page bytes <= {self._max_page_bytes}"
+                if obs["seconds_per_item"]:
+                    limit = math.floor(self._target_page_seconds / obs["seconds_per_item"])
+                    if limit < size:
+                        size, reason = limit, f"page latency <= {self._target_page_seconds}s"
+                if total_count is not None and 0 < total_count < size:
+                    size, reason = total_count, "totalCount fits in one page"
+                size = self.clamp(size)
+
+            decision = {"resource": key, "items_per_page": size, "reason": reason}
+            self._decisions.append(decision)
+
+        self._log.debug(f"page size for {key}: {size} ({reason})")
+        return size
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {"observations": {k: dict(v) for k, v in self._observations.items()},
+                    "decisions": list(self._decisions)}
+
+    def __repr__(self):
+        return f"PageSizeController(initial_page_size={self._initial_page_size}, " \
+               f"max_page_bytes={self._max_page_bytes}, target_page_seconds={self._target_page_seconds})"
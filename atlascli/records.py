@@ -0,0 +1,297 @@
+"""
+Compact records for projects and clusters
+~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+An AtlasCluster keeps the whole document returned by Atlas, connection strings,
+replication specs, links and all. The records below keep only the fields the
+map and the summaries use in __slots__ and fetch the full document from Atlas
+when it is asked for, so an AtlasMap of a large organization stays small.
+The last few documents fetched are kept in a small LRU shared by all records,
+so that e.g. .resource followed by .pretty() fetches once without the map
+growing back to full documents. The map replaces a record whenever its
+cluster changes, and a new record fetches again.
+
+The records answer the same questions as AtlasCluster and AtlasProject so they
+can be used wherever the map hands out clusters and projects.
+"""
+import threading
+from collections import OrderedDict
+from typing import Callable, Dict, Optional
+
+from colorama import Fore
+
+from atlascli.atlascluster import AtlasCluster, cluster_status
+from atlascli.atlasproject import AtlasProject
+
+
+class LoadedDocuments:
+    """
+    The full documents most recently fetched by records, least recently used
+    first
+    """
+
+    def __init__(self, size: int = 16):
+        self._size = size
+        self._lock = threading.Lock()
+        # id(record) to (record, document), holding the record keeps its id from being reused
+        self._documents: OrderedDict = OrderedDict()
+
+    def get(self, record, load: Callable[[], object]):
+        key = id(record)
+        with self._lock:
+            entry = self._documents.get(key)
+            if entry is not None:
+                self._documents.move_to_end(key)
+                return entry[1]
+        document = load()
+        with self._lock:
+            self._documents[key] = (record, document)
+            self._documents.move_to_end(key)
+            while len(self._documents) > self._size:
+                self._documents.popitem(last=False)
+        return document
+
+    def clear(self):
+        with self._lock:
+            self._documents.clear()
+
+    def __len__(self):
+        return len(self._documents)
+
+
+loaded_documents = LoadedDocuments()
+
+
+class ProjectRecord:
+
+    __slots__ = ("_id", "_name", "_org_id", "_cluster_count", "_loader")
+
+    def __init__(self, project_id: str, name: str, org_id: str = None, cluster_count: int = None,
+                 loader: Callable[[str], AtlasProject] = None):
+        """
+        :param loader: called with the project id to fetch the full project
+        """
+        self._id = project_id
+        self._name = name
+        self._org_id = org_id
+        self._cluster_count = cluster_count
+        self._loader = loader
+
+    @classmethod
+    def from_project(cls, project: AtlasProject, loader: Callable[[str], AtlasProject] = None) -> "ProjectRecord":
+        return cls.from_dict(project.resource, loader)
+
+    @classmethod
+    def from_dict(cls, doc: Dict, loader: Callable[[str], AtlasProject] = None) -> "ProjectRecord":
+        return cls(doc["id"], doc["name"], doc.get("orgId"), doc.get("clusterCount"), loader)
+
+    @property
+    def id(self) -> str:
+        return self._id
+
+    @property
+    def name(self) -> str:
+        return self._name
+
+    @property
+    def org_id(self) -> Optional[str]:
+        return self._org_id
+
+    @property
+    def cluster_count(self) -> Optional[int]:
+        return self._cluster_count
+
+    def load(self) -> AtlasProject:
+        """
+        The full project, fetched from Atlas unless it is one of the last few fetched
+        """
+        if self._loader is None:
+            return AtlasProject(self.to_dict())
+        return loaded_documents.get(self, lambda: self._loader(self._id))
+
+    @property
+    def resource(self) -> Dict:
+        return self.load().resource
+
+    def to_dict(self) -> Dict:
+        """
+        The fields held by the record in the shape Atlas returns them
+        """
+        doc = {"id": self._id, "name": self._name}
+        if self._org_id is not None:
+            doc["orgId"] = self._org_id
+        if self._cluster_count is not None:
+            doc["clusterCount"] = self._cluster_count
+        return doc
+
+    def json(self, indent=2):
+        return self.load().json(indent)
+
+    def pretty(self) -> str:
+        return self.load().pretty()
+
+    def pretty_project_id(self):
+        return f"{Fore.LIGHTWHITE_EX}{self._id}:{self._name}{Fore.RESET}"
+
+    def __eq__(self, rhs):
+        if isinstance(rhs, ProjectRecord):
+            return self.to_dict() == rhs.to_dict()
+        return NotImplemented
+
+    def __repr__(self):
+        return f"ProjectRecord(project_id={self._id!r}, name={self._name!r})"
+
+
+class ClusterRecord:
+
+    __slots__ = ("_id", "_name", "_project_id", "_state", "_paused", "_instance_size",
+                 "_disk_size", "_provider", "_region", "_loader")
+
+    def __init__(self, project_id: str, name: str, cluster_id: str = None, state: str = None,
+                 paused: bool = False, instance_size: str = None, disk_size: float = None,
+                 provider: str = None, region: str = None,
+                 loader: Callable[[str, str], AtlasCluster] = None):
+        """
+        :param loader: called with the project id and cluster name to fetch the full cluster
+        """
+        self._project_id = project_id
+        self._name = name
+        self._id = cluster_id
+        self._state = state
+        self._paused = paused
+        self._instance_size = instance_size
+        self._disk_size = disk_size
+        self._provider = provider
+        self._region = region
+        self._loader = loader
+
+    @classmethod
+    def from_cluster(cls, cluster: AtlasCluster, loader: Callable[[str, str], AtlasCluster] = None) -> "ClusterRecord":
+        return cls.from_dict(cluster.project_id, cluster.resource, loader)
+
+    @classmethod
+    def from_dict(cls, project_id: str, doc: Dict,
+                  loader: Callable[[str, str], AtlasCluster] = None) -> "ClusterRecord":
+        provider_settings = doc.get("providerSettings", {})
+        return cls(project_id,
+                   doc["name"],
+                   cluster_id=doc.get("id"),
+                   state=doc.get("stateName"),
+                   paused=doc.get("paused", False),
+                   instance_size=provider_settings.get("instanceSizeName"),
+                   disk_size=doc.get("diskSizeGB"),
+                   provider=provider_settings.get("providerName"),
+                   region=provider_settings.get("regionName"),
+                   loader=loader)
+
+    def replace(self, **changes) -> "ClusterRecord":
+        """
+        A copy of this record with some fields changed, e.g. replace(state="DELETING")
+        """
+        fields = {"cluster_id": self._id, "state": self._state, "paused": self._paused,
+                  "instance_size": self._instance_size, "disk_size": self._disk_size,
+                  "provider": self._provider, "region": self._region, "loader": self._loader}
+        fields.update(changes)
+        return ClusterRecord(self._project_id, self._name, **fields)
+
+    @property
+    def id(self) -> Optional[str]:
+        return self._id
+
+    @property
+    def cluster_id(self) -> Optional[str]:
+        return self._id
+
+    @property
+    def name(self) -> str:
+        return self._name
+
+    @property
+    def project_id(self) -> str:
+        return self._project_id
+
+    @property
+    def state(self) -> str:
+        return self._state
+
+    def is_paused(self) -> bool:
+        return self._paused
+
+    def instance_size(self) -> str:
+        return self._instance_size
+
+    def disk_size(self) -> float:
+        return self._disk_size
+
+    def provider_name(self) -> str:
+        return self._provider
+
+    def region_name(self) -> str:
+        return self._region
+
+    def status(self) -> str:
+        return cluster_status(self._state, self._paused)
+
+    def short_name(self):
+        return f"{self._project_id}:{self._name}"
+
+    def load(self) -> AtlasCluster:
+        """
+        The full cluster, fetched from Atlas unless it is one of the last few fetched
+        """
+        if self._loader is None:
+            return AtlasCluster(self._project_id, self._name, self.to_dict())
+        return loaded_documents.get(self, lambda: self._loader(self._project_id, self._name))
+
+    @property
+    def resource(self) -> Dict:
+        return self.load().resource
+
+    def to_dict(self) -> Dict:
+        """
+        The fields held by the record in the shape Atlas returns them
+        """
+        doc = {"name": self._name,
+               "groupId": self._project_id,
+               "stateName": self._state,
+               "paused": self._paused,
+               "diskSizeGB": self._disk_size,
+               "providerSettings": {"providerName": self._provider,
+                                    "instanceSizeName": self._instance_size,
+                                    "regionName": self._region}}
+        if self._id is not None:
+            doc["id"] = self._id
+        return doc
+
+    def json(self, indent=2):
+        return self.load().json(indent)
+
+    def pretty(self) -> str:
+        return self.load().pretty()
+
+    def pretty_id(self):
+        return f"{Fore.CYAN}{self._project_id}{Fore.RESET}"
+
+    def pretty_name(self):
+        return f"{Fore.GREEN}{self._name}{Fore.RESET}"
+
+    def pretty_id_name(self):
+        return f"{self.pretty_id()}:{self.pretty_name()}"
+
+    def pretty_instance_size(self):
+        return f"{Fore.LIGHTWHITE_EX}{self._instance_size}{Fore.RESET}"
+
+    def pretty_disk_size(self):
+        return f"{Fore.LIGHTWHITE_EX}{self._disk_size}{Fore.RESET}"
+
+    def summary(self):
+        return f"{self.pretty_id_name():65} instance size:{self.pretty_instance_size():>15} "\
+               f" disk GB:{self.pretty_disk_size():>15} state: {self.status():20}"
+
+    def __eq__(self, rhs):
+        if isinstance(rhs, ClusterRecord):
+            return self.to_dict() == rhs.to_dict()
+        return NotImplemented
+
+    def __repr__(self):
+        return f"ClusterRecord(project_id={self._project_id!r}, name={self._name!r}, state={self._state!r})"
@@ -0,0 +1,257 @@
+"""
+HTTP response cache
+~~~~~~~~~~~~~~~~~~~
+
+A cache of GET responses keyed by URL. Each entry keeps the response body
+with its validators ('ETag' and 'Last-Modified'). A later GET of the same
+URL sends them back as 'If-None-Match'/'If-Modified-Since', and a 304 Not
+Modified answer is served from the cache.
+
+Entries live in an in memory LRU bounded by entry count and bytes, and
+optionally in a directory bounded by bytes. Both are evicted least
+recently used first. Every entry expires after a TTL, which can be set per
+resource shape, e.g. {"/groups/{id}/clusters": 300}.
+"""
+import hashlib
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Optional
+
+import requests
+
+from atlascli import jsoncodec
+from atlascli.pagesize import PageSizeController
+
+
+class CacheEntry:
+
+    def __init__(self, url: str, body: bytes, etag: str = None, last_modified: str = None, stored: float = None):
+        self.url = url
+        self.body = body
+        self.etag = etag
+        self.last_modified = last_modified
+        self.stored = stored if stored else time.time()
+
+    @property
+    def size(self) -> int:
+        return len(self.body)
+
+    def age(self) -> float:
+        return time.time() - self.stored
+
+    def has_validators(self) -> bool:
+        return bool(self.etag or self.last_modified)
+
+    def conditional_headers(self) -> Dict[str, str]:
+        headers = {}
+        if self.etag:
+            headers["If-None-Match"] = self.etag
+        if self.last_modified:
+            headers["If-Modified-Since"] = self.last_modified
+        return headers
+
+    def doc(self):
+        # decode on every hit so each caller gets its own copy
+        return jsoncodec.loads(self.body)
+
+    def to_dict(self) -> Dict:
+        return {"url": self.url,
+                "etag": self.etag,
+                "last_modified": self.last_modified,
+                "stored": self.stored,
+                "body": self.body.decode("utf-8")}
+
+    @classmethod
+    def from_dict(cls, d: Dict) -> "CacheEntry":
+        return cls(d["url"], d["body"].encode("utf-8"), d.get("etag"), d.get("last_modified"), d["stored"])
+
+    def __repr__(self):
+        return f"CacheEntry(url={self.url!r}, etag={self.etag!r}, last_modified={self.last_modified!r}, " \
+               f"size={self.size})"
+
+
+class ResponseCache:
+
+    def __init__(self,
+                 max_entries: int = 1000,
+                 max_bytes: int = 64 * 1024 * 1024,
+                 default_ttl: float = 3600,
+                 ttls: Dict[str, float] = None,
+                 fresh_for: float = 0,
+                 directory: str = None,
+                 max_disk_bytes: int = 256 * 1024 * 1024):
+        """
+        :param max_entries: maximum number of entries held in memory
+        :param max_bytes: maximum bytes of response bodies held in memory
+        :param default_ttl: seconds an entry is kept after it was last validated
+        :param ttls: TTL overrides keyed by resource shape, see PageSizeController.resource_key
+        :param fresh_for: seconds an entry is served without asking the server at all.
+        With the default of 0 every reuse is revalidated and only responses
+        with validators are cached.
+        :param directory: also keep entries in this directory
+        :param max_disk_bytes: maximum bytes used in 'directory'
+        """
+        self._log = logging.getLogger(__name__)
+        self._max_entries = max_entries
+        self._max_bytes = max_bytes
+        self._default_ttl = default_ttl
+        self._ttls = ttls if ttls else {}
+        self._fresh_for = fresh_for
+        self._directory = directory
+        self._max_disk_bytes = max_disk_bytes
+        self._lock = threading.RLock()
+        self._entries: OrderedDict[str, CacheEntry] = OrderedDict()
+        self._bytes = 0
+        self._disk_bytes = 0
+        self._counters = {"hits": 0, "fresh_hits": 0, "misses": 0, "stores": 0, "evictions": 0, "expired": 0}
+
+        if self._directory:
+            os.makedirs(self._directory, exist_ok=True)
+            self._disk_bytes = sum(os.path.getsize(p) for p in self._disk_files())
+
+    def ttl(self, url: str) -> float:
+        return self._ttls.get(PageSizeController.resource_key(url), self._default_ttl)
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self._directory, hashlib.sha256(key.encode("utf-8")).hexdigest() + ".json")
+
+    def _disk_files(self):
+        for name in os.listdir(self._directory):
+            if name.endswith(".json"):
+                yield os.path.join(self._directory, name)
+
+    def lookup(self, key: str) -> Optional[CacheEntry]:
+        """
+        Return the entry for 'key' if it has not expired
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None and self._directory:
+                entry = self._load(key)
+                if entry:
+                    self._remember(key, entry)
+            if entry is None:
+                self._counters["misses"] += 1
+                return None
+            if entry.age() > self.ttl(entry.url):
+                self._counters["expired"] += 1
+                self._counters["misses"] += 1
+                self.discard(key)
+                return None
+            self._entries.move_to_end(key)
+            return entry
+
+    def is_fresh(self, entry: CacheEntry) -> bool:
+        return entry.age() <= self._fresh_for
+
+    def hit(self, key: str, entry: CacheEntry, revalidated: bool = True):
+        """
+        Record that 'entry' was served, 'revalidated' if a 304 confirmed it
+        """
+        with self._lock:
+            if revalidated:
+                self._counters["hits"] += 1
+                entry.stored = time.time()
+                if self._directory:
+                    self._save(key, entry)
+            else:
+                self._counters["fresh_hits"] += 1
+
+    def store(self, key: str, r: requests.Response):
+        entry = CacheEntry(r.url if r.url else key, r.content,
+                           r.headers.get("ETag"), r.headers.get("Last-Modified"))
+        if not entry.has_validators() and self._fresh_for <= 0:
+            return
+        if entry.size > self._max_bytes:
+            return
+        with self._lock:
+            self.discard(key, disk=False)
+            self._remember(key, entry)
+            self._counters["stores"] += 1
+            if self._directory:
+                self._save(key, entry)
+
+    def discard(self, key: str, disk: bool = True):
+        with self._lock:
+            entry = self._entries.pop(key, None)
+            if entry:
+                self._bytes -= entry.size
+            if disk and self._directory:
+                self._remove_file(self._path(key))
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+            if self._directory:
+                for path in list(self._disk_files()):
+                    self._remove_file(path)
+
+    def _remember(self, key: str, entry: CacheEntry):
+        self._entries[key] = entry
+        self._bytes += entry.size
+        while self._entries and (len(self._entries) > self._max_entries or self._bytes > self._max_bytes):
+            _, evicted = self._entries.popitem(last=False)
+            self._bytes -= evicted.size
+            self._counters["evictions"] += 1
+
+    def _load(self, key: str) -> Optional[CacheEntry]:
+        path = self._path(key)
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                entry = CacheEntry.from_dict(jsoncodec.load(f))
+            os.utime(path)  # mtime orders the disk LRU
+            return entry
+        except FileNotFoundError:
+            return None
+        except (ValueError, KeyError, OSError) as e:
+            self._log.debug(f"discarding unreadable cache file {path}: {e}")
+            self._remove_file(path)
+            return None
+
+    def _save(self, key: str, entry: CacheEntry):
+        path = self._path(key)
+        tmp = f"{path}.{threading.get_ident()}.tmp"
+        data = jsoncodec.dumps(entry.to_dict())
+        self._remove_file(path)
+        with open(tmp, "w", encoding="utf-8") as f:
+            f.write(data)
+        os.replace(tmp, path)
+        self._disk_bytes += os.path.getsize(path)
+        if self._disk_bytes > self._max_disk_bytes:
+            self._evict_disk()
+
+    def _remove_file(self, path: str):
+        try:
+            size = os.path.getsize(path)
+            os.unlink(path)
+            self._disk_bytes -= size
+        except FileNotFoundError:
+            pass
+
+    def _evict_disk(self):
+        files = sorted(self._disk_files(), key=os.path.getmtime)
+        self._disk_bytes = sum(os.path.getsize(p) for p in files)
+        for path in files:
+            if self._disk_bytes <= self._max_disk_bytes:
+                break
+            self._remove_file(path)
+            self._counters["evictions"] += 1
+
+    def stats(self) -> Dict:
+        with self._lock:
+            stats = dict(self._counters)
+            stats.update({"entries": len(self._entries), "bytes": self._bytes})
+            if self._directory:
+                stats["disk_bytes"] = self._disk_bytes
+            return stats
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __repr__(self):
+        return f"ResponseCache(max_entries={self._max_entries}, max_bytes={self._max_bytes}, " \
+               f"default_ttl={self._default_ttl}, directory={self._directory!r})"
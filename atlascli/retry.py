@@ -0,0 +1,196 @@
+"""
+Retries and client side rate limiting
+~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+Atlas rejects requests over its per-project limits with a 429 and
+occasionally answers with a 5xx while it is busy. RetryPolicy decides
+whether a failed request can be replayed and how long to wait first.
+TokenBucket keeps a client under a request rate, so that the limits are
+hit less often in the first place.
+"""
+import email.utils
+import logging
+import random
+import threading
+import time
+from typing import Dict, Optional
+
+
+class RetryPolicy:
+
+    RETRY_STATUSES = frozenset([429, 500, 502, 503, 504])
+    IDEMPOTENT_METHODS = frozenset(["GET", "HEAD", "OPTIONS", "PUT", "DELETE"])
+
+    def __init__(self,
+                 max_retries: int = 5,
+                 backoff_factor: float = 0.5,
+                 max_backoff: float = 60.0,
+                 jitter: bool = True,
+                 budget_ratio: float = 0.2,
+                 budget_min: int = 10):
+        """
+        :param max_retries: retries allowed for a single request
+        :param backoff_factor: the first retry waits up to this many seconds,
+        each subsequent retry doubles the wait
+        :param max_backoff: cap on any single wait, including 'Retry-After'
+        :param jitter: wait a random time up to the backoff ("full jitter")
+        :param budget_ratio: retries allowed as a fraction of all requests made
+        :param budget_min: retries always allowed regardless of 'budget_ratio'
+        """
+        self._log = logging.getLogger(__name__)
+        self._max_retries = max_retries
+        self._backoff_factor = backoff_factor
+        self._max_backoff = max_backoff
+        self._jitter = jitter
+        self._budget_ratio = budget_ratio
+        self._budget_min = budget_min
+        self._lock = threading.Lock()
+        self._requests = 0
+        self._retries = 0
+        self._exhausted = 0
+        self._statuses: Dict[str, int] = {}
+
+    @property
+    def max_retries(self) -> int:
+        return self._max_retries
+
+    @classmethod
+    def is_retryable(cls, method: str, status: Optional[int]) -> bool:
+        """
+        A 429 is always safe to replay as Atlas rejected the request without
+        acting on it. A 5xx or a connection failure may have happened after
+        the request was acted on, so only idempotent requests are replayed.
+
+        :param method: HTTP method
+        :param status: HTTP status or None if no response was received
+        """
+        if status == 429:
+            return True
+        if status is None or status in cls.RETRY_STATUSES:
+            return method.upper() in cls.IDEMPOTENT_METHODS
+        return False
+
+    def record_request(self):
+        with self._lock:
+            self._requests += 1
+
+    def should_retry(self, method: str, status: Optional[int], attempt: int) -> bool:
+        """
+        Decide whether the 'attempt'th retry (0 based) of a failed request
+        should go ahead. A retry that goes ahead is charged to the budget.
+        """
+        if not self.is_retryable(method, status):
+            return False
+        with self._lock:
+            if attempt >= self._max_retries:
+                self._exhausted += 1
+                return False
+            if self._retries >= self._budget_min + self._budget_ratio * self._requests:
+                self._exhausted += 1
+                self._log.warning(f"retry budget exhausted ({self._retries} retries for {self._requests} requests)")
+                return False
+            self._retries += 1
+            key = str(status) if status else "connection"
+            self._statuses[key] = self._statuses.get(key, 0) + 1
+            return True
+
+    @staticmethod
+    def parse_retry_after(retry_after: Optional[str]) -> Optional[float]:
+        """
+        'Retry-After' is either a number of seconds or an HTTP date
+        """
+        if not retry_after:
+            return None
+        retry_after = retry_after.strip()
+        try:
+            return max(0.0, float(retry_after))
+        except ValueError:
+            pass
+        try:
+            when = email.utils.parsedate_to_datetime(retry_after)
+        except (TypeError, ValueError):
+            return None
+        return max(0.0, when.timestamp() - time.time())
+
+    def backoff(self, attempt: int, retry_after: Optional[str] = None) -> float:
+        """
+        Seconds to wait before the 'attempt'th retry (0 based)
+        """
+        delay = self.parse_retry_after(retry_after)
+        if delay is None:
+            delay = min(self._max_backoff, self._backoff_factor * (2 ** attempt))
+            if self._jitter:
+                delay = random.uniform(0, delay)
+        return min(self._max_backoff, delay)
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {"requests": self._requests,
+                    "retries": self._retries,
+                    "exhausted": self._exhausted,
+                    "statuses": dict(self._statuses)}
+
+    def __repr__(self):
+        return f"RetryPolicy(max_retries={self._max_retries}, backoff_factor={self._backoff_factor}, " \
+               f"max_backoff={self._max_backoff}, budget_ratio={self._budget_ratio})"
+
+
+class TokenBucket:
+    """
+    A token bucket shared by all the threads using an AtlasAPI. Each request
+    takes a token, tokens are replaced at 'rate' per second up to 'capacity'.
+    """
+
+    def __init__(self, rate: float, capacity: float = None):
+        """
+        :param rate: sustained requests per second
+        :param capacity: largest burst allowed, defaults to one second of requests
+        """
+        if rate <= 0:
+            raise ValueError("'rate' must be greater than zero")
+        self._rate = rate
+        self._capacity = capacity if capacity else max(1.0, rate)
+        self._tokens = self._capacity
+        self._last = time.monotonic()
+        self._lock = threading.Lock()
+        self._acquired = 0
+        self._waited = 0.0
+
+    def _refill(self, now: float):
+        self._tokens = min(self._capacity, self._tokens + (now - self._last) * self._rate)
+        self._last = now
+
+    def acquire(self, tokens: float = 1.0) -> float:
+        """
+        Take 'tokens', sleeping until they are available. Tokens are reserved
+        under the lock so waiting threads are served in arrival order.
+
+        :return: seconds spent waiting
+        """
+        with self._lock:
+            self._refill(time.monotonic())
+            self._tokens -= tokens
+            wait = max(0.0, -self._tokens / self._rate)
+            self._acquired += 1
+            self._waited += wait
+        if wait > 0:
+            time.sleep(wait)
+        return wait
+
+    def hold(self, seconds: float):
+        """
+        Stop handing out tokens for 'seconds', used when the server tells us
+        to back off with 'Retry-After'.
+        """
+        with self._lock:
+            self._refill(time.monotonic())
+            self._tokens = min(self._tokens, -seconds * self._rate)
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {"rate": self._rate,
+                    "acquired": self._acquired,
+                    "waited": round(self._waited, 3)}
+
+    def __repr__(self):
+        return f"TokenBucket(rate={self._rate}, capacity={self._capacity})"
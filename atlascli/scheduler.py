@@ -0,0 +1,362 @@
+"""
+Scheduled pause and resume
+~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+`atlascli schedule -f schedule.json` runs until it is stopped. It keeps one
+authenticated AtlasAPI and one AtlasMap warm and pauses or resumes the
+clusters picked by each rule's selectors when the rule's cron expression
+comes round. A schedule file looks like
+
+    {
+      "rules": [
+        {"name": "evening", "cron": "0 19 * * mon-fri", "action": "pause",
+         "select": {"projects": ["dev"], "names": ["dev-*"]}},
+        {"name": "morning", "cron": "0 7 * * mon-fri", "action": "resume",
+         "select": {"projects": ["dev"], "names": ["dev-*"]}, "catch_up": 7200}
+      ]
+    }
+
+"select" takes the ClusterSelector arguments projects, all, names,
+instance_sizes and states. A rule that comes due while the scheduler is busy,
+asleep or not running (with a status file to remember when it last fired) is
+still fired once if it is no more than "catch_up" seconds late (default 3600, 0 to
+never catch up). Rules that come due together run concurrently. If the
+clusters cannot be read when rules come due, the error is recorded against
+each rule and they stay due, to be tried again within their catch up window.
+
+The status file records when each rule last fired, what it did and when it
+fires next, and is rewritten after each firing.
+"""
+import calendar
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from typing import Callable, Dict, List, Optional, Set
+
+from atlascli import jsoncodec
+from atlascli.bulk import BulkOp
+from atlascli.selector import ClusterSelector
+
+DAY_NAMES = {name.lower(): (n + 1) % 7 for n, name in enumerate(calendar.day_abbr)}  # sun=0 as in cron
+MONTH_NAMES = {name.lower(): n for n, name in enumerate(calendar.month_abbr) if name}
+
+
+class CronExpr:
+    """
+    A five field cron expression: minute hour day-of-month month day-of-week.
+    Fields take *, numbers, names (jan-dec, sun-sat), ranges a-b, lists a,b
+    and steps */n or a-b/n. As in cron, if both day fields are restricted a
+    time matches when either does.
+    """
+
+    FIELDS = (("minute", 0, 59, {}),
+              ("hour", 0, 23, {}),
+              ("day", 1, 31, {}),
+              ("month", 1, 12, MONTH_NAMES),
+              ("weekday", 0, 7, DAY_NAMES))
+
+    def __init__(self, expr: str):
+        self._expr = expr
+        fields = expr.split()
+        if len(fields) != 5:
+            raise ValueError(f"'{expr}' is not a cron expression, it needs five fields")
+        parsed = [self._parse_field(f, *spec) for f, spec in zip(fields, self.FIELDS)]
+        self._minutes, self._hours, self._days, self._months, weekdays = parsed
+        self._weekdays = {d % 7 for d in weekdays}  # 7 is also sunday
+        self._any_day = fields[2] == "*"
+        self._any_weekday = fields[4] == "*"
+
+    @staticmethod
+    def _value(s: str, name: str, names: Dict[str, int]) -> int:
+        if s.lower() in names:
+            return names[s.lower()]
+        try:
+            return int(s)
+        except ValueError:
+            raise ValueError(f"'{s}' is not a valid {name}")
+
+    @classmethod
+    def _parse_field(cls, field: str, name: str, low: int, high: int, names: Dict[str, int]) -> Set[int]:
+        values = set()
+        for part in field.split(","):
+            spec, _, step = part.partition("/")
+            step = int(step) if step else 1
+            if step < 1:
+                raise ValueError(f"bad step in '{part}'")
+            if spec == "*":
+                start, end = low, high
+            elif "-" in spec:
+                a, b = spec.split("-", 1)
+                start, end = cls._value(a, name, names), cls._value(b, name, names)
+            else:
+                start = cls._value(spec, name, names)
+                end = high if step > 1 else start
+            if not (low <= start <= high and low <= end <= high and start <= end):
+                raise ValueError(f"'{part}' is out of range for {name} ({low}-{high})")
+            values.update(range(start, end + 1, step))
+        return values
+
+    def _day_matches(self, dt: datetime) -> bool:
+        day = dt.day in self._days
+        weekday = (dt.isoweekday() % 7) in self._weekdays
+        if self._any_day:
+            return weekday
+        if self._any_weekday:
+            return day
+        return day or weekday
+
+    def matches(self, dt: datetime) -> bool:
+        return dt.month in self._months and self._day_matches(dt) and \
+            dt.hour in self._hours and dt.minute in self._minutes
+
+    def next_after(self, dt: datetime) -> datetime:
+        """
+        The first matching minute strictly after dt
+        """
+        t = dt.replace(second=0, microsecond=0) + timedelta(minutes=1)
+        limit = t + timedelta(days=366 * 5)
+        while t < limit:
+            if t.month not in self._months:
+                t = (t.replace(day=1, hour=0, minute=0) + timedelta(days=32)).replace(day=1)
+            elif not self._day_matches(t):
+                t = t.replace(hour=0, minute=0) + timedelta(days=1)
+            elif t.hour not in self._hours:
+                t = t.replace(minute=0) + timedelta(hours=1)
+            elif t.minute not in self._minutes:
+                t += timedelta(minutes=1)
+            else:
+                return t
+        raise ValueError(f"'{self._expr}' never matches")
+
+    def __str__(self):
+        return self._expr
+
+    def __repr__(self):
+        return f"CronExpr({self._expr!r})"
+
+
+class ScheduleRule:
+
+    ACTIONS = {"pause": BulkOp.PAUSE, "resume": BulkOp.RESUME}
+    SELECT_ARGS = {"projects": "projects", "all": "select_all", "names": "names",
+                   "instance_sizes": "instance_sizes", "states": "states"}
+
+    def __init__(self, name: str, cron: str, action: str, select: Dict, catch_up: float = 3600):
+        if action not in self.ACTIONS:
+            raise ValueError(f"rule '{name}': action must be one of {', '.join(self.ACTIONS)}")
+        unknown = set(select) - set(self.SELECT_ARGS)
+        if unknown:
+            raise ValueError(f"rule '{name}': unknown selectors {', '.join(sorted(unknown))}")
+        self.name = name
+        self.cron = CronExpr(cron)
+        self.action = action
+        self.op = self.ACTIONS[action]
+        self.select = dict(select)
+        try:
+            self.selector = ClusterSelector(**{self.SELECT_ARGS[k]: v for k, v in select.items()})
+        except ValueError as e:
+            raise ValueError(f"rule '{name}': {e}")
+        if self.selector.is_empty():
+            raise ValueError(f"rule '{name}' selects nothing, give \"projects\" or \"names\" or use "
+                             f"\"all\": true, \"instance_sizes\" and \"states\" only narrow the selection")
+        self.catch_up = float(catch_up)
+
+    @classmethod
+    def from_dict(cls, doc: Dict) -> "ScheduleRule":
+        try:
+            return cls(doc["name"], doc["cron"], doc["action"], doc.get("select", {}), doc.get("catch_up", 3600))
+        except KeyError as e:
+            raise ValueError(f"schedule rule {doc} has no {e}")
+
+    def __repr__(self):
+        return f"ScheduleRule({self.name!r}, {str(self.cron)!r}, {self.action!r})"
+
+
+def load_schedule(path: str) -> List[ScheduleRule]:
+    with open(path, encoding="utf-8") as f:
+        doc = jsoncodec.load(f)
+    rules = [ScheduleRule.from_dict(r) for r in doc.get("rules", [])]
+    names = [r.name for r in rules]
+    if len(set(names)) != len(names):
+        raise ValueError(f"rule names in {path} must be unique")
+    return rules
+
+
+class Scheduler:
+
+    def __init__(self, commands, rules: List[ScheduleRule], status_file: str = None, parallel: int = 4,
+                 refresh_interval: float = 900, max_sleep: float = 60, retry_interval: float = 30,
+                 now: Callable[[], datetime] = datetime.now, sleep: Callable[[float], None] = None):
+        """
+        :param commands: a Commands for the organization, its AtlasMap is kept warm
+        :param status_file: where to record the state of each rule, also read at startup
+        to catch up on rules that came due while the scheduler was not running
+        :param parallel: clusters paused or resumed concurrently by each rule
+        :param refresh_interval: seconds between background refreshes of the AtlasMap
+        :param max_sleep: the longest the scheduler sleeps between checks
+        :param retry_interval: seconds before due rules are tried again when their clusters
+        could not be read, they are retried until they are past their catch up window
+        """
+        self._log = logging.getLogger(__name__)
+        self._commands = commands
+        self._map = commands._map
+        self._rules = rules
+        self._status_file = status_file
+        self._parallel = parallel
+        self._refresh_interval = refresh_interval
+        self._max_sleep = max_sleep
+        self._retry_interval = retry_interval
+        self._retry_at: Optional[datetime] = None
+        self._now = now
+        self._stop = threading.Event()
+        self._sleep = sleep if sleep else self._stop.wait
+        self._started = now()
+        self._last_refresh = time.monotonic()
+        self._status: Dict[str, Dict] = {r.name: {"cron": str(r.cron), "action": r.action} for r in rules}
+
+        since = self._read_last_run() or self._started
+        self._next_due: Dict[str, datetime] = {}
+        for rule in rules:
+            self._next_due[rule.name] = rule.cron.next_after(since)
+            self._status[rule.name]["next_due"] = self._next_due[rule.name]
+
+    def _read_last_run(self) -> Optional[datetime]:
+        #
+        # Every rule due before the previous scheduler last wrote its status was
+        # dealt with by it, so rules are due again from that time.
+        #
+        if not self._status_file or not os.path.exists(self._status_file):
+            return None
+        try:
+            with open(self._status_file, encoding="utf-8") as f:
+                doc = jsoncodec.load(f)
+            for name, s in doc.get("rules", {}).items():
+                if name in self._status:
+                    self._status[name].update({k: v for k, v in s.items() if k.startswith("last_")})
+            return datetime.fromisoformat(doc["updated"])
+        except (KeyError, ValueError, TypeError, AttributeError, OSError) as e:
+            self._log.warning(f"ignoring status file {self._status_file}: {e}")
+            return None
+
+    def next_due(self) -> Dict[str, datetime]:
+        return dict(self._next_due)
+
+    @property
+    def status(self) -> Dict:
+        return {"started": self._started, "updated": self._now(),
+                "rules": {name: dict(s) for name, s in self._status.items()}}
+
+    def write_status(self):
+        if not self._status_file:
+            return
+        tmp = f"{self._status_file}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            jsoncodec.dump(self.status, f, indent=2)
+        os.replace(tmp, self._status_file)
+
+    def _fire(self, rule: ScheduleRule, due: datetime):
+        self._log.info(f"rule '{rule.name}' due at {due:%Y-%m-%d %H:%M}: {rule.action}")
+        status = self._status[rule.name]
+        try:
+            command = self._commands.pause_cmd if rule.op is BulkOp.PAUSE else self._commands.resume_cmd
+            summary = command([], self._parallel, selector=rule.selector)
+            status["last_result"] = summary
+            status.pop("last_error", None)
+        except (Exception, SystemExit) as e:
+            self._log.error(f"rule '{rule.name}' failed: {e}")
+            status["last_error"] = str(e)
+        status["last_fired"] = due
+
+    def tick(self) -> List[str]:
+        """
+        Fire every rule that is due, concurrently.
+
+        :return: the names of the rules fired
+        """
+        now = self._now()
+        if self._retry_at is not None and now < self._retry_at:
+            return []
+        due = []
+        for rule in self._rules:
+            when = self._next_due[rule.name]
+            if when > now:
+                continue
+            # missed occurrences are collapsed into the latest one
+            following = rule.cron.next_after(when)
+            while following <= now:
+                when, following = following, rule.cron.next_after(following)
+            late = (now - when).total_seconds()
+            if late > max(self._max_sleep, rule.catch_up):
+                self._log.warning(f"rule '{rule.name}' missed {when:%Y-%m-%d %H:%M}, "
+                                  f"{late:.0f}s late is past its catch up window")
+                self._status[rule.name]["last_missed"] = when
+            else:
+                due.append((rule, when))
+                continue
+            self._next_due[rule.name] = following
+            self._status[rule.name]["next_due"] = following
+
+        if due:
+            try:
+                self._map.clusters  # crawl once here rather than in each rule's thread
+                # rules select and skip clusters by state, so list the projects they cover again
+                # rather than trusting a snapshot or a refresh that may be many minutes old
+                scope = [pid for rule, _ in due for pid in rule.selector.project_ids(self._map)]
+                self._map.refresh_project_clusters(scope, workers=self._parallel)
+            except Exception as e:
+                # the rules stay due and are tried again, rather than being lost
+                self._log.error(f"cannot read the clusters for {', '.join(rule.name for rule, _ in due)}, "
+                                f"retrying in {self._retry_interval:.0f}s: {e}")
+                for rule, _ in due:
+                    self._status[rule.name]["last_error"] = f"cannot read the clusters: {e}"
+                self._retry_at = now + timedelta(seconds=self._retry_interval)
+                self.write_status()
+                return []
+            self._retry_at = None
+            for rule, when in due:
+                self._next_due[rule.name] = rule.cron.next_after(now)
+                self._status[rule.name]["next_due"] = self._next_due[rule.name]
+            with ThreadPoolExecutor(max_workers=len(due), thread_name_prefix="schedule") as executor:
+                list(executor.map(lambda rd: self._fire(*rd), due))
+            self._map.flush_snapshot()
+        if due or any("last_missed" in s for s in self._status.values()):
+            self.write_status()
+        return [rule.name for rule, _ in due]
+
+    def _refresh_map(self):
+        if time.monotonic() - self._last_refresh >= self._refresh_interval:
+            self._last_refresh = time.monotonic()
+            self._map.refresh(background=True)
+
+    def stop(self):
+        self._stop.set()
+
+    def run(self, max_ticks: int = None):
+        """
+        Fire rules as they come due until stop() is called
+        """
+        try:
+            self._map.clusters  # warm the map before the first rule is due
+        except Exception as e:
+            self._log.warning(f"cannot read the clusters yet, trying again when a rule is due: {e}")
+        self.write_status()
+        ticks = 0
+        try:
+            while not self._stop.is_set():
+                self.tick()
+                ticks += 1
+                if max_ticks is not None and ticks >= max_ticks:
+                    break
+                self._refresh_map()
+                wait = min(self._next_due.values(), default=None)
+                if wait is not None and self._retry_at is not None:
+                    wait = max(wait, self._retry_at)
+                seconds = self._max_sleep
+                if wait is not None:
+                    seconds = min(seconds, max(0.0, (wait - self._now()).total_seconds()))
+                self._sleep(seconds)
+        finally:
+            self.write_status()
@@ -0,0 +1,138 @@
+"""
+Cluster selectors and fleet plans
+~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+Choose the clusters for a pause or resume by what they are rather than by
+naming each one, e.g.
+
+    atlascli pause --project dev-project --instance-size M10 M20 --state running -c "dev-*" --dry-run
+
+A ClusterSelector is evaluated against an AtlasMap, using its query indexes
+for the project, instance size and state, and name globs on what remains.
+The instance size and state only narrow a selection, so a selector also
+needs --all, --project or a name glob before it selects anything. Name
+globs match cluster names only, use --project to choose the project.
+A FleetPlan records which of the selected clusters would change and which
+are already in the wanted state, and how many API calls carrying it out
+will take.
+"""
+from fnmatch import fnmatchcase
+from typing import List
+
+from colorama import Fore
+
+from atlascli.atlascluster import AtlasCluster
+from atlascli.bulk import BulkOp
+
+GLOB_CHARS = "*?["
+
+
+def is_glob(s: str) -> bool:
+    return any(c in s for c in GLOB_CHARS)
+
+
+class ClusterSelector:
+
+    RUNNING = "running"
+    PAUSED = "paused"
+
+    def __init__(self, projects: List[str] = None, select_all: bool = False, names: List[str] = None,
+                 instance_sizes: List[str] = None, states: List[str] = None):
+        """
+        :param projects: project ids or names
+        :param select_all: select every cluster the other selectors allow
+        :param names: cluster name globs, e.g. dev-*
+        :param instance_sizes: exact instance size names, e.g. M40 selects neither R40 nor M40_NVME
+        :param states: 'running', 'paused' or Atlas stateNames such as IDLE
+        """
+        qualified = [glob for glob in names or [] if ":" in glob]
+        if qualified:
+            raise ValueError(f"name globs match cluster names only, use --project instead of "
+                             f"{', '.join(repr(glob) for glob in qualified)}")
+        self._projects = list(projects or [])
+        self._all = select_all
+        self._names = list(names or [])
+        self._instance_sizes = list(instance_sizes or [])
+        self._states = [s.lower() if s.lower() in (self.RUNNING, self.PAUSED) else s.upper() for s in states or []]
+
+    def with_names(self, names: List[str]) -> "ClusterSelector":
+        """
+        A copy of this selector that also requires one of these name globs
+        """
+        return ClusterSelector(self._projects, self._all, self._names + list(names),
+                               self._instance_sizes, self._states)
+
+    def is_empty(self) -> bool:
+        """
+        True if the selector would select nothing. Instance sizes and states only filter,
+        --all, a project or a name glob is needed as well
+        """
+        return not (self._all or self._projects or self._names)
+
+    def conditions(self) -> List[str]:
+        conditions = []
+        if self._projects:
+            conditions.append(f"project={','.join(self._projects)}")
+        if self._instance_sizes:
+            conditions.append(f"size={','.join(self._instance_sizes)}")
+        paused = {s == self.PAUSED for s in self._states if s in (self.RUNNING, self.PAUSED)}
+        if len(paused) == 1:
+            conditions.append(f"paused={paused.pop()}")
+        state_names = [s for s in self._states if s not in (self.RUNNING, self.PAUSED)]
+        if state_names:
+            conditions.append(f"state={','.join(state_names)}")
+        return conditions
+
+    def project_ids(self, atlas_map) -> List[str]:
+        """
+        The ids of the projects this selector can pick clusters from, every
+        project unless it names some
+        """
+        wanted = set(self._projects)
+        return [project_id for project_id in atlas_map.get_project_ids()
+                if not wanted or project_id in wanted or atlas_map.get_project_name(project_id) in wanted]
+
+    def select(self, atlas_map) -> List[AtlasCluster]:
+        if self.is_empty():
+            return []
+        clusters = atlas_map.query(self.conditions())
+        if self._names:
+            clusters = [c for c in clusters if any(fnmatchcase(c.name, glob) for glob in self._names)]
+        return clusters
+
+    def __repr__(self):
+        return f"ClusterSelector(projects={self._projects}, all={self._all}, names={self._names}, " \
+               f"instance_sizes={self._instance_sizes}, states={self._states})"
+
+
+class FleetPlan:
+
+    def __init__(self, op: BulkOp, clusters: List[AtlasCluster]):
+        """
+        :param op: BulkOp.PAUSE or BulkOp.RESUME
+        """
+        if op not in (BulkOp.PAUSE, BulkOp.RESUME):
+            raise ValueError(f"a fleet plan can only pause or resume, not {op}")
+        pause = op is BulkOp.PAUSE
+        self.op = op
+        ordered = sorted(clusters, key=lambda c: (c.project_id, c.name))
+        self.changes = [c for c in ordered if c.is_paused() != pause]
+        self.unchanged = [c for c in ordered if c.is_paused() == pause]
+
+    @property
+    def api_calls(self) -> int:
+        """
+        The requests carrying out the plan will make, one PATCH per cluster
+        """
+        return len(self.changes)
+
+    def pprint(self, atlas_map=None):
+        verb = "pause" if self.op is BulkOp.PAUSE else "resume"
+        state = "paused" if self.op is BulkOp.PAUSE else "running"
+        for cluster in self.changes:
+            project = atlas_map.get_project_name(cluster.project_id) if atlas_map else None
+            print(f"  {verb:<8}{cluster.summary()}" + (f" ({project})" if project else ""))
+        for cluster in self.unchanged:
+            print(f"  {'skip':<8}{cluster.pretty_id_name()} is already {state}")
+        print(f"{Fore.LIGHTWHITE_EX}{len(self.changes)}{Fore.RESET} cluster(s) to {verb}, "
+              f"{len(self.unchanged)} already {state}, {self.api_calls} API call(s)")
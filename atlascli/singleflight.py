@@ -0,0 +1,84 @@
+"""
+Single flight request coalescing
+~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+When several threads ask for the same thing at the same time only the
+first one does the work, the others wait for it and share its result or
+its exception.
+"""
+import copy
+import threading
+from typing import Any, Callable, Dict, Hashable, Tuple
+
+
+class _Call:
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+        self.waiters = 0
+
+
+class SingleFlight:
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls: Dict[Hashable, _Call] = {}
+        self._counters = {"calls": 0, "executed": 0, "collapsed": 0, "errors": 0}
+
+    def do(self, key: Hashable, func: Callable, *args, **kwargs) -> Tuple[Any, bool]:
+        """
+        Call func(*args, **kwargs) unless a call for 'key' is already in flight,
+        in which case wait for it.
+
+        :return: (result, shared). A shared result is a deep copy, so waiters
+        never see each other's changes to it.
+        """
+        with self._lock:
+            self._counters["calls"] += 1
+            call = self._calls.get(key)
+            if call:
+                call.waiters += 1
+                self._counters["collapsed"] += 1
+                leader = False
+            else:
+                call = _Call()
+                self._calls[key] = call
+                self._counters["executed"] += 1
+                leader = True
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return copy.deepcopy(call.result), True
+
+        result = None
+        try:
+            result = func(*args, **kwargs)
+        except BaseException as e:
+            call.error = e
+            with self._lock:
+                self._counters["errors"] += 1
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+                waiters = call.waiters
+            if waiters and call.error is None:
+                # copy before the leader can modify its own result
+                call.result = copy.deepcopy(result)
+            call.done.set()
+        return result, False
+
+    def in_flight(self) -> int:
+        with self._lock:
+            return len(self._calls)
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return dict(self._counters)
+
+    def __repr__(self):
+        return f"SingleFlight(in_flight={self.in_flight()})"
@@ -0,0 +1,205 @@
+"""
+Wait for clusters to settle
+~~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+After a pause, resume, create or delete Atlas reports the cluster as
+REPAIRING, CREATING or DELETING until the change is complete. A
+ClusterWaiter tracks any number of clusters until each reaches the state
+wanted for it. Each round lists the clusters of every project with a pending
+cluster once, rather than getting each cluster, and the interval between
+rounds grows while nothing changes and drops back as soon as something does.
+
+Right after a PATCH Atlas can still report the cluster IDLE with the new
+'paused' value before the change has started. A target made for a cluster
+that was just changed is therefore only reached once the cluster has been
+seen in some other state, or once settle_delay seconds have passed without
+that happening.
+"""
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+from requests.exceptions import RequestException
+
+from atlascli.atlasapi import AtlasAPI
+from atlascli.atlascluster import AtlasCluster
+
+
+class WaitTarget:
+
+    def __init__(self, project_id: str, name: str, state: str = "IDLE", paused: bool = None, deleted: bool = False,
+                 changing: bool = False):
+        """
+        :param state: the stateName to wait for
+        :param paused: also wait for 'paused' to have this value, ignored if None
+        :param deleted: wait for the cluster to disappear instead
+        :param changing: the cluster was just changed, so looking reached before the
+        change has been seen to start does not count
+        """
+        self.project_id = project_id
+        self.name = name
+        self.state = state
+        self.paused = paused
+        self.deleted = deleted
+        self.changing = changing
+
+    @property
+    def key(self) -> Tuple[str, str]:
+        return self.project_id, self.name
+
+    @classmethod
+    def paused_cluster(cls, cluster, changing: bool = False) -> "WaitTarget":
+        return cls(cluster.project_id, cluster.name, paused=True, changing=changing)
+
+    @classmethod
+    def resumed_cluster(cls, cluster, changing: bool = False) -> "WaitTarget":
+        return cls(cluster.project_id, cluster.name, paused=False, changing=changing)
+
+    @classmethod
+    def created_cluster(cls, cluster) -> "WaitTarget":
+        return cls(cluster.project_id, cluster.name, changing=True)
+
+    @classmethod
+    def deleted_cluster(cls, cluster) -> "WaitTarget":
+        return cls(cluster.project_id, cluster.name, deleted=True)
+
+    def reached(self, cluster: Optional[AtlasCluster]) -> bool:
+        """
+        :param cluster: the cluster as Atlas last listed it, None if it was not listed
+        """
+        if self.deleted:
+            return cluster is None
+        if cluster is None:
+            return False
+        return cluster.state == self.state and (self.paused is None or cluster.is_paused() == self.paused)
+
+    def describe(self) -> str:
+        if self.deleted:
+            return "deleted"
+        if self.paused is None:
+            return self.state
+        return f"{self.state} and {'paused' if self.paused else 'running'}"
+
+    def __repr__(self):
+        return f"WaitTarget({self.project_id}:{self.name}, {self.describe()})"
+
+
+class WaitResult:
+
+    def __init__(self, reached: Dict[Tuple[str, str], WaitTarget], pending: Dict[Tuple[str, str], WaitTarget],
+                 elapsed: float, rounds: int):
+        self.reached = reached
+        self.pending = pending
+        self.elapsed = elapsed
+        self.rounds = rounds
+
+    @property
+    def timed_out(self) -> bool:
+        return len(self.pending) > 0
+
+    def __repr__(self):
+        return f"WaitResult(reached={len(self.reached)}, pending={len(self.pending)}, " \
+               f"elapsed={self.elapsed:.1f}, rounds={self.rounds})"
+
+
+class ClusterWaiter:
+
+    def __init__(self, api: AtlasAPI, atlas_map=None, interval: float = 5.0, max_interval: float = 60.0,
+                 backoff: float = 1.5, workers: int = 4, settle_delay: float = 30.0,
+                 clock: Callable[[], float] = time.monotonic, sleep: Callable[[float], None] = time.sleep):
+        """
+        :param api: an authenticated AtlasAPI
+        :param atlas_map: an AtlasMap to update with each cluster as it is polled
+        :param interval: seconds between rounds while clusters are changing
+        :param max_interval: the longest interval between rounds
+        :param backoff: the interval is multiplied by this after each round where nothing changed
+        :param workers: number of projects listed concurrently in a round
+        :param settle_delay: seconds after which a 'changing' target that looks reached
+        counts as reached even though it was never seen changing
+        """
+        if interval <= 0 or max_interval < interval or backoff < 1:
+            raise ValueError("need 0 < interval <= max_interval and backoff >= 1")
+        self._log = logging.getLogger(__name__)
+        self._api = api
+        self._map = atlas_map
+        self._interval = interval
+        self._max_interval = max_interval
+        self._backoff = backoff
+        self._workers = max(1, workers)
+        self._settle_delay = settle_delay
+        self._clock = clock
+        self._sleep = sleep
+
+    def _poll(self, project_ids: List[str]) -> Dict[str, Optional[Dict[str, AtlasCluster]]]:
+        #
+        # One listing per project, a project whose listing failed maps to None
+        #
+        def list_project(project_id):
+            try:
+                return {c.name: c for c in self._api.get_clusters(project_id)}
+            except RequestException as e:
+                self._log.warning(f"could not list the clusters in project {project_id}: {e}")
+                return None
+
+        with ThreadPoolExecutor(max_workers=min(self._workers, len(project_ids)),
+                                thread_name_prefix="waiter") as executor:
+            return dict(zip(project_ids, executor.map(list_project, project_ids)))
+
+    def wait(self, targets: Iterable[WaitTarget], timeout: float = None,
+             on_reached: Callable[[WaitTarget, Optional[AtlasCluster]], None] = None) -> WaitResult:
+        """
+        Poll until every target is reached or the timeout expires.
+
+        :param timeout: seconds to wait, forever if None
+        :param on_reached: called with each target and its cluster as it is reached
+        """
+        pending = {t.key: t for t in targets}
+        reached = {}
+        last_seen: Dict[Tuple[str, str], Tuple] = {}
+        started = set()  # keys of 'changing' targets seen in a state other than the one wanted
+        start = self._clock()
+        interval = self._interval
+        rounds = 0
+
+        while pending:
+            rounds += 1
+            changed = False
+            listings = self._poll(sorted({t.project_id for t in pending.values()}))
+            for key, target in list(pending.items()):
+                listing = listings[target.project_id]
+                if listing is None:
+                    continue
+                cluster = listing.get(target.name)
+                seen = (cluster.state, cluster.is_paused()) if cluster else None
+                if last_seen.get(key, seen) != seen:
+                    changed = True
+                last_seen[key] = seen
+                if self._map is not None:
+                    if cluster is not None:
+                        self._map.apply_cluster(cluster)
+                    elif target.deleted:
+                        self._map.remove_cluster(*key)
+                at_target = target.reached(cluster)
+                if not at_target:
+                    started.add(key)
+                elif target.changing and key not in started and self._clock() - start < self._settle_delay:
+                    continue  # Atlas may not have started the change yet
+                if at_target:
+                    changed = True
+                    reached[key] = pending.pop(key)
+                    if on_reached:
+                        on_reached(target, cluster)
+            if not pending:
+                break
+
+            elapsed = self._clock() - start
+            if timeout is not None and elapsed >= timeout:
+                break
+            interval = self._interval if changed else min(self._max_interval, interval * self._backoff)
+            if timeout is not None:
+                interval = min(interval, timeout - elapsed)
+            self._log.debug(f"{len(pending)} clusters pending, next poll in {interval:.1f}s")
+            self._sleep(interval)
+
+        return WaitResult(reached, pending, self._clock() - start, rounds)
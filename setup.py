@@ -23,6 +23,7 @@ VERSION = "0.3.0a"
 # What packages are optional?
 EXTRAS = {
     # 'fancy feature': ['django'],
+    'fast': ['orjson'],
 }
 
 # The rest you shouldn't have to touch too much :)
@@ -53,6 +54,7 @@ setup(
     url=URL,
     install_requires=['requests',
                       'python-dateutil'],
+    extras_require=EXTRAS,
     setup_requires=['requests',
                     'python-dateutil'],
     packages=find_packages(),
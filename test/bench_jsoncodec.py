@@ -0,0 +1,54 @@
+"""
+Compare the JSON backends on a page of cluster documents.
+
+    python -m test.bench_jsoncodec [clusters per page]
+"""
+import copy
+import json
+import os
+import sys
+import timeit
+from datetime import datetime, timezone
+
+from atlascli import jsoncodec
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+
+def make_page(n: int):
+    with open(os.path.join(HERE, "stripped_demodata.json")) as f:
+        cluster = json.load(f)
+    results = []
+    for i in range(n):
+        c = copy.deepcopy(cluster)
+        c["name"] = f"cluster{i}"
+        c["created"] = datetime(2020, 1, 1, tzinfo=timezone.utc)
+        results.append(c)
+    return {"results": results, "totalCount": n, "links": []}
+
+
+def bench(label, func, number):
+    seconds = min(timeit.repeat(func, number=number, repeat=5)) / number
+    print(f"{label:<28} {seconds * 1000:8.3f} ms")
+    return seconds
+
+
+def main(n: int = 500):
+    page = make_page(n)
+    encoded = json.dumps(page, default=jsoncodec.json_datetime_encoder).encode("utf-8")
+    number = 20
+    print(f"page of {n} clusters, {len(encoded) / 1024:.0f} KiB")
+
+    stdlib_loads = bench("json.loads", lambda: json.loads(encoded), number)
+    stdlib_dumps = bench("json.dumps(indent=2)",
+                         lambda: json.dumps(page, indent=2, default=jsoncodec.json_datetime_encoder), number)
+    if jsoncodec.orjson is None:
+        print("orjson is not installed, 'pip install atlascli[fast]' to compare")
+        return
+    fast_loads = bench("orjson loads", lambda: jsoncodec.orjson.loads(encoded), number)
+    fast_dumps = bench("orjson dumps(indent=2)", lambda: jsoncodec._orjson_dumps(page, indent=2), number)
+    print(f"loads speedup {stdlib_loads / fast_loads:.1f}x, dumps speedup {stdlib_dumps / fast_dumps:.1f}x")
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 500)
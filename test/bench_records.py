@@ -0,0 +1,51 @@
+"""
+Compare the memory held by full clusters and compact records.
+
+    python -m test.bench_records [clusters]
+"""
+import copy
+import json
+import os
+import sys
+import tracemalloc
+
+from atlascli.atlascluster import AtlasCluster
+from atlascli.records import ClusterRecord
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+
+def make_docs(n: int):
+    with open(os.path.join(HERE, "stripped_demodata.json")) as f:
+        cluster = json.load(f)
+    cluster.pop("created", None)
+    docs = []
+    for i in range(n):
+        c = copy.deepcopy(cluster)
+        c["name"] = f"cluster{i}"
+        docs.append(c)
+    return docs
+
+
+def measure(label, build):
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    kept = build()
+    after = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    size = after - before
+    print(f"{label:<24} {size / 1024 / 1024:8.2f} MiB {size / len(kept):8.0f} bytes per cluster")
+    return size
+
+
+def main(n: int = 20000):
+    with open(os.path.join(HERE, "stripped_demodata.json")) as f:
+        pid = json.load(f).get("groupId", "5a141a774e65811a132a8010")
+    print(f"{n} clusters")
+    full = measure("AtlasCluster", lambda: [AtlasCluster(pid, d["name"], d) for d in make_docs(n)])
+    compact = measure("ClusterRecord", lambda: [ClusterRecord.from_dict(pid, d) for d in make_docs(n)])
+    print(f"records use {compact / full:.0%} of the memory of full clusters")
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 20000)
@@ -0,0 +1,151 @@
+"""
+An in memory Atlas organization for tests that cannot reach cloud.mongodb.com.
+
+FakeAtlasAPI only replaces AtlasAPI._request(), so URL building, pagination,
+caching and error handling are the real AtlasAPI code.
+"""
+import copy
+import threading
+from collections import Counter
+from urllib.parse import urlparse, parse_qs
+
+import requests
+
+from atlascli import jsoncodec
+from atlascli.atlasapi import AtlasAPI
+from atlascli.digestauth import PreemptiveDigestAuth
+from atlascli.retry import RetryPolicy
+
+ORG_ID = "599eeced9f78f769464d175c"
+
+
+def project_id(n: int) -> str:
+    return f"{n:024x}"
+
+
+def make_cluster(name: str, pid: str, size: str = "M10", paused: bool = False, state: str = "IDLE",
+                 provider: str = "AWS", region: str = "US_EAST_1", disk: float = 10.0):
+    return {"name": name,
+            "id": f"c{abs(hash((pid, name))):023x}"[:24],
+            "groupId": pid,
+            "paused": paused,
+            "stateName": state,
+            "diskSizeGB": disk,
+            "providerSettings": {"providerName": provider,
+                                 "instanceSizeName": size,
+                                 "regionName": region},
+            "mongoURI": "mongodb://host1,host2,host3",
+            "links": []}
+
+
+class FakeAtlasAPI(AtlasAPI):
+
+    def __init__(self, projects=None, clusters=None, fail_projects=(), **kwargs):
+        """
+        :param projects: list of project dicts
+        :param clusters: dict of project id -> list of cluster dicts
+        :param fail_projects: project ids whose cluster listing fails with a 500
+        """
+        kwargs.setdefault("coalesce", False)
+        kwargs.setdefault("retry_policy", RetryPolicy(backoff_factor=0))
+        super().__init__(**kwargs)
+        self._auth = PreemptiveDigestAuth("fakepublic", "fake-private-key")
+        self._lock = threading.Lock()
+        self.org = {"id": ORG_ID, "name": "Fake Organization", "links": []}
+        self.projects = projects if projects is not None else []
+        self.cluster_docs = clusters if clusters is not None else {}
+        self.fail_projects = set(fail_projects)
+        self.requests = Counter()
+
+    @classmethod
+    def with_inventory(cls, project_count: int, clusters_per_project: int, **kwargs):
+        projects = [{"id": project_id(i), "name": f"project{i}", "orgId": ORG_ID, "clusterCount": clusters_per_project,
+                     "created": "2020-01-01T00:00:00Z", "links": []}
+                    for i in range(project_count)]
+        clusters = {p["id"]: [make_cluster(f"cluster{j}", p["id"]) for j in range(clusters_per_project)]
+                    for p in projects}
+        return cls(projects, clusters, **kwargs)
+
+    def _response(self, status, doc=None):
+        r = requests.Response()
+        r.status_code = status
+        r._content = jsoncodec.dumps(doc if doc is not None else {}).encode("utf-8")
+        return r
+
+    def _page(self, url, items):
+        query = parse_qs(urlparse(url).query)
+        page_num = int(query.get("pageNum", ["1"])[0])
+        per_page = int(query.get("itemsPerPage", ["100"])[0])
+        start = (page_num - 1) * per_page
+        links = [{"rel": "self", "href": url}]
+        if start + per_page < len(items):
+            base = url.split("?")[0]
+            links.append({"rel": "next", "href": f"{base}?itemsPerPage={per_page}&pageNum={page_num + 1}"})
+        return {"results": copy.deepcopy(items[start:start + per_page]), "links": links, "totalCount": len(items)}
+
+    def _find_project(self, pid):
+        for p in self.projects:
+            if p["id"] == pid:
+                return p
+        return None
+
+    def _find_cluster(self, pid, name):
+        for c in self.cluster_docs.get(pid, []):
+            if c["name"] == name:
+                return c
+        return None
+
+    def _request(self, method, url, **kwargs):
+        path = urlparse(url).path.split(AtlasAPI.API_URL, 1)[-1]
+        parts = [p for p in path.split("/") if p]
+        with self._lock:
+            self.requests[(method, "/".join("{id}" if len(p) == 24 else p for p in parts))] += 1
+            return self._route(method, url, parts, kwargs.get("json"))
+
+    def _route(self, method, url, parts, body):
+        not_found = self._response(404, {"detail": f"{'/'.join(parts)} not found"})
+        if parts == ["orgs"]:
+            return self._response(200, self._page(url, [self.org]))
+        if parts == ["groups"]:
+            return self._response(200, self._page(url, self.projects))
+        if parts == ["clusters"]:
+            results = [{"groupId": p["id"], "groupName": p["name"], "orgId": ORG_ID,
+                        "clusters": [{"name": c["name"], "clusterId": c["id"]}
+                                     for c in self.cluster_docs.get(p["id"], [])]}
+                       for p in self.projects]
+            return self._response(200, self._page(url, results))
+        if len(parts) < 2 or parts[0] != "groups" or self._find_project(parts[1]) is None:
+            return not_found
+        pid = parts[1]
+        if len(parts) == 2:
+            return self._response(200, copy.deepcopy(self._find_project(pid)))
+        if parts[2] != "clusters":
+            return not_found
+        if len(parts) == 3:
+            if method == "POST":
+                cluster = make_cluster(body["name"], pid, state="CREATING")
+                cluster.update(body)
+                self.cluster_docs.setdefault(pid, []).append(cluster)
+                return self._response(201, copy.deepcopy(cluster))
+            if pid in self.fail_projects:
+                return self._response(500, {"detail": "internal error"})
+            return self._response(200, self._page(url, self.cluster_docs.get(pid, [])))
+        cluster = self._find_cluster(pid, parts[3])
+        if cluster is None:
+            return not_found
+        if method == "PATCH":
+            settings = dict(cluster["providerSettings"], **body.get("providerSettings", {}))
+            cluster.update(body)
+            cluster["providerSettings"] = settings
+            if "paused" in body:
+                cluster["stateName"] = "REPAIRING"
+            elif body:
+                cluster["stateName"] = "UPDATING"
+            return self._response(200, copy.deepcopy(cluster))
+        if method == "DELETE":
+            cluster["stateName"] = "DELETING"
+            return self._response(202, {})
+        return self._response(200, copy.deepcopy(cluster))
+
+    def request_count(self, method=None):
+        return sum(n for (m, _), n in self.requests.items() if method is None or m == method)
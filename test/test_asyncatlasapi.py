@@ -0,0 +1,69 @@
+import asyncio
+import unittest
+
+from atlascli.asyncatlasapi import AsyncAtlasAPI
+from atlascli.atlasapi import AtlasAPI
+from atlascli.atlascluster import AtlasCluster
+from atlascli.atlasproject import AtlasProject
+
+PROJECT_ID = "5a141a774e65811a132a8010"
+
+
+class PagedAPI(AtlasAPI):
+    """
+    An AtlasAPI that serves canned pages instead of talking to Atlas
+    """
+
+    def __init__(self, pages):
+        super().__init__()
+        self._pages = pages
+        self._auth = object()
+
+    def get(self, resource, headers=None, page_num=1, items_per_page=100):
+        return self._pages[resource]
+
+
+def page(results, next_href=None):
+    links = [{"rel": "self", "href": "self"}]
+    if next_href:
+        links.append({"rel": "next", "href": next_href})
+    return {"results": results, "links": links, "totalCount": 3}
+
+
+class TestAsyncAtlasAPI(unittest.TestCase):
+
+    def setUp(self):
+        base = AtlasAPI.ATLAS_BASE_URL
+        self._api = PagedAPI({
+            f"{base}/groups": page([{"id": "1", "name": "a"}, {"id": "2", "name": "b"}], "page2"),
+            "page2": page([{"id": "3", "name": "c"}]),
+            f"{base}/groups/{PROJECT_ID}/clusters": page([{"name": "MOT", "paused": False}]),
+        })
+
+    def test_get_projects(self):
+        async def crawl():
+            async with AsyncAtlasAPI(self._api, max_workers=2) as api:
+                return [p async for p in api.get_projects()]
+
+        projects = asyncio.run(crawl())
+        self.assertEqual([p.id for p in projects], ["1", "2", "3"])
+        self.assertTrue(all(isinstance(p, AtlasProject) for p in projects))
+
+    def test_get_clusters_concurrently(self):
+        async def crawl(api):
+            async def clusters():
+                return [c async for c in api.get_clusters(PROJECT_ID)]
+            return await asyncio.gather(clusters(), clusters(), clusters())
+
+        api = AsyncAtlasAPI(self._api, max_workers=3)
+        results = asyncio.run(crawl(api))
+        api.close()
+        for clusters in results:
+            self.assertEqual(len(clusters), 1)
+            self.assertIsInstance(clusters[0], AtlasCluster)
+            self.assertEqual(clusters[0].project_id, PROJECT_ID)
+            self.assertEqual(clusters[0].name, "MOT")
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,55 @@
+import unittest
+
+from atlascli.atlasmap import AtlasMap
+from atlascli.errors import AtlasGetError
+from test.fakeatlas import FakeAtlasAPI, make_cluster, project_id
+
+
+class TestAtlasMapCrawl(unittest.TestCase):
+
+    def test_concurrent_crawl(self):
+        api = FakeAtlasAPI.with_inventory(project_count=40, clusters_per_project=2, page_size=7)
+        atlas_map = AtlasMap(api=api, crawl_workers=8)
+        atlas_map.populate_cluster_map()
+        self.assertEqual(len(atlas_map.projects), 40)
+        self.assertEqual(len(atlas_map.clusters), 80)
+        self.assertEqual(set(atlas_map.project_cluster_map.keys()), set(atlas_map.get_project_ids()))
+        self.assertEqual(atlas_map.crawl_errors, {})
+
+    def test_project_failure(self):
+        api = FakeAtlasAPI.with_inventory(project_count=6, clusters_per_project=2)
+        atlas_map = AtlasMap(api=api, crawl_workers=3)
+        atlas_map.populate_cluster_map()
+        api.fail_projects.add(project_id(2))
+        api.cluster_docs[project_id(2)].append(make_cluster("late", project_id(2)))
+        api.cluster_docs[project_id(3)].append(make_cluster("new", project_id(3)))
+
+        atlas_map.populate_cluster_map()
+        self.assertEqual(list(atlas_map.crawl_errors.keys()), [project_id(2)])
+        self.assertIsInstance(atlas_map.crawl_errors[project_id(2)], AtlasGetError)
+        # the failed project keeps what it had, the others are refreshed
+        self.assertEqual(len(list(atlas_map.get_clusters(project_id(2)))), 2)
+        self.assertTrue(atlas_map.is_cluster_name("new"))
+        self.assertFalse(atlas_map.is_cluster_name("late"))
+        self.assertEqual(len(atlas_map.projects), 6)
+
+    def test_org_clusters_strategy(self):
+        api = FakeAtlasAPI.with_inventory(project_count=20, clusters_per_project=0)
+        for n in (3, 11):
+            api.cluster_docs[project_id(n)] = [make_cluster("a", project_id(n)), make_cluster("b", project_id(n))]
+        atlas_map = AtlasMap(api=api, crawl_workers=4, strategy=AtlasMap.ORG_CLUSTERS_STRATEGY)
+        atlas_map.populate_cluster_map()
+        self.assertEqual(len(atlas_map.projects), 20)
+        self.assertEqual(sorted(atlas_map.get_cluster_project_ids("a")), [project_id(3), project_id(11)])
+        self.assertEqual(atlas_map.project_cluster_map[project_id(0)], {})
+        cluster_listings = api.requests[("GET", "groups/{id}/clusters")]
+        self.assertEqual(cluster_listings, 2)
+        self.assertEqual(api.requests[("GET", "clusters")], 1)
+
+    def test_bad_strategy(self):
+        with self.assertRaises(ValueError):
+            AtlasMap(api=FakeAtlasAPI(), strategy="guess")
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,56 @@
+import unittest
+
+from atlascli.atlasmap import AtlasMap
+from test.fakeatlas import FakeAtlasAPI, make_cluster, project_id
+
+
+class TestAtlasMapIndex(unittest.TestCase):
+
+    def setUp(self):
+        self._api = FakeAtlasAPI.with_inventory(project_count=5, clusters_per_project=3)
+        # a cluster name used in two projects
+        self._api.cluster_docs[project_id(4)].append(make_cluster("shared", project_id(4)))
+        self._api.cluster_docs[project_id(2)].append(make_cluster("shared", project_id(2)))
+        self._map = AtlasMap(api=self._api)
+
+    def test_projects(self):
+        self.assertTrue(self._map.is_project_id(project_id(3)))
+        self.assertFalse(self._map.is_project_id(project_id(99)))
+        self.assertEqual(self._map.get_project_id("project3"), project_id(3))
+        self.assertIsNone(self._map.get_project_id("nope"))
+        self.assertEqual(self._map.get_project_name(project_id(1)), "project1")
+        self.assertIsNone(self._map.get_project_name(project_id(99)))
+        self.assertEqual(len(self._map.get_project_ids()), 5)
+
+    def test_clusters(self):
+        self.assertTrue(self._map.is_cluster_name("cluster2"))
+        self.assertFalse(self._map.is_cluster_name("nope"))
+        self.assertEqual(sorted(self._map.get_cluster_project_ids("shared")), [project_id(2), project_id(4)])
+        self.assertEqual(len(self._map.get_cluster("cluster0")), 5)
+        self.assertEqual(self._map.get_cluster("shared", project_id(4))[0].project_id, project_id(4))
+        self.assertEqual(self._map.get_cluster("shared", project_id(0)), [])
+        self.assertEqual(self._map.get_one_cluster(project_id(2), "shared").name, "shared")
+        with self.assertRaises(ValueError):
+            self._map.get_one_cluster(project_id(0), "shared")
+        self.assertEqual(len(list(self._map.get_clusters(project_id(2)))), 4)
+        self.assertEqual(len(self._map.clusters), 17)
+        self.assertIsNone(self._map.is_unique_cluster("shared"))
+
+    def test_lookups_do_not_refetch(self):
+        self._map.populate_cluster_map()
+        count = self._api.request_count()
+        for _ in range(100):
+            self._map.is_project_id(project_id(3))
+            self._map.get_cluster_project_ids("cluster1")
+            self._map.get_cluster("cluster1", project_id(3))
+        self.assertEqual(self._api.request_count(), count)
+
+    def test_refresh(self):
+        self.assertFalse(self._map.is_cluster_name("newcluster"))
+        self._api.cluster_docs[project_id(0)].append(make_cluster("newcluster", project_id(0)))
+        self._map.populate_cluster_map()
+        self.assertEqual(self._map.get_cluster_project_ids("newcluster"), [project_id(0)])
+
+
+if __name__ == '__main__':
+    unittest.main()
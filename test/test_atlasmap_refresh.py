@@ -0,0 +1,88 @@
+import unittest
+
+from atlascli.atlasmap import AtlasMap
+from atlascli.atlascluster import AtlasCluster
+from test.fakeatlas import FakeAtlasAPI, make_cluster, project_id
+
+
+class TestAtlasMapRefresh(unittest.TestCase):
+
+    def setUp(self):
+        self._api = FakeAtlasAPI.with_inventory(project_count=4, clusters_per_project=2)
+        self._map = AtlasMap(api=self._api)
+        self._map.populate_cluster_map()
+        self._api.requests.clear()
+
+    def _assert_consistent(self):
+        clusters = self._map.clusters
+        from_projects = [c for d in self._map.project_cluster_map.values() for c in d.values()]
+        self.assertCountEqual([id(c) for c in clusters], [id(c) for c in from_projects])
+        for cluster in clusters:
+            self.assertIn(cluster, self._map.get_cluster(cluster.name))
+
+    def test_pause_is_written_through(self):
+        cluster = self._map.get_one_cluster(project_id(1), "cluster0")
+        self.assertFalse(cluster.is_paused())
+        self._map.pause_cluster(cluster)
+        updated = self._map.get_one_cluster(project_id(1), "cluster0")
+        self.assertTrue(updated.is_paused())
+        self.assertEqual(len(self._map.clusters), 8)
+        self.assertEqual(self._api.request_count("GET"), 0)
+        self._assert_consistent()
+
+    def test_create_and_delete(self):
+        created = self._map.create_cluster(project_id(2), "new", {"providerSettings": {"instanceSizeName": "M10"}})
+        self.assertEqual(created.state, "CREATING")
+        self.assertEqual(self._map.get_cluster_project_ids("new"), [project_id(2)])
+        self.assertEqual(len(self._map.clusters), 9)
+        self._assert_consistent()
+
+        deleted = self._map.delete_cluster(created)
+        self.assertEqual(deleted.state, "DELETING")
+        self.assertEqual(self._map.get_one_cluster(project_id(2), "new").state, "DELETING")
+
+        self._api.cluster_docs[project_id(2)] = [c for c in self._api.cluster_docs[project_id(2)] if c["name"] != "new"]
+        self.assertIsNone(self._map.refresh_cluster(project_id(2), "new"))
+        self.assertFalse(self._map.is_cluster_name("new"))
+        self.assertEqual(len(self._map.clusters), 8)
+        self.assertEqual(self._api.request_count("GET"), 1)
+        self._assert_consistent()
+
+    def test_refresh_project(self):
+        self._api.cluster_docs[project_id(3)] = [make_cluster("cluster0", project_id(3), paused=True),
+                                                 make_cluster("extra", project_id(3))]
+        self._map.refresh_project(project_id(3))
+        self.assertEqual(sorted(c.name for c in self._map.get_clusters(project_id(3))), ["cluster0", "extra"])
+        self.assertTrue(self._map.get_one_cluster(project_id(3), "cluster0").is_paused())
+        self.assertEqual(len(self._map.get_cluster("cluster1")), 3)
+        self.assertEqual(self._api.request_count(), 2)
+        self._assert_consistent()
+
+    def test_refresh_project_clusters(self):
+        self._api.cluster_docs[project_id(1)][0]["paused"] = True
+        self._map.refresh_project_clusters([project_id(1), project_id(2), project_id(1)], max_age=60)
+        self.assertTrue(self._map.get_one_cluster(project_id(1), "cluster0").is_paused())
+        self.assertEqual(self._api.request_count(), 2)
+        self._map.refresh_project_clusters([project_id(1)], max_age=60)
+        self.assertEqual(self._api.request_count(), 2)
+        self._map.refresh_project_clusters([project_id(1)])
+        self.assertEqual(self._api.request_count(), 3)
+        self._assert_consistent()
+
+    def test_refresh_missing_project(self):
+        self._api.projects = [p for p in self._api.projects if p["id"] != project_id(0)]
+        self.assertIsNone(self._map.refresh_project(project_id(0)))
+        self.assertFalse(self._map.is_project_id(project_id(0)))
+        self.assertNotIn(project_id(0), self._map.project_cluster_map)
+        self.assertEqual(len(self._map.clusters), 6)
+        self._assert_consistent()
+
+    def test_apply_cluster_keeps_readers_stable(self):
+        before = self._map.clusters
+        self._map.apply_cluster(AtlasCluster(project_id(0), "other", make_cluster("other", project_id(0))))
+        self.assertEqual(len(before), 8)
+        self.assertEqual(len(self._map.clusters), 9)
+
+
+if __name__ == '__main__':
+    unittest.main()
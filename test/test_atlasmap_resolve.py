@@ -0,0 +1,80 @@
+import unittest
+
+from atlascli.atlasmap import AtlasMap
+from atlascli.commands import Commands
+from atlascli.errors import AtlasError
+from test.fakeatlas import FakeAtlasAPI, project_id
+
+
+class TestAtlasMapResolve(unittest.TestCase):
+
+    def setUp(self):
+        self._api = FakeAtlasAPI.with_inventory(project_count=50, clusters_per_project=3)
+        self._map = AtlasMap(api=self._api)
+
+    def test_qualified_id_does_not_crawl(self):
+        cluster_id = Commands(self._map).preflight_cluster_arg(f"{project_id(7)}:cluster2")
+        self.assertEqual(cluster_id.project_id, project_id(7))
+        self.assertEqual(self._api.request_count(), 2)
+
+        cluster = self._map.get_one_cluster(project_id(7), "cluster2")
+        self._map.pause_cluster(cluster)
+        self.assertTrue(self._map.get_one_cluster(project_id(7), "cluster2").is_paused())
+        self.assertEqual(self._api.request_count(), 3)
+
+    def test_unknown_project_and_cluster(self):
+        commands = Commands(self._map)
+        with self.assertRaises(SystemExit):
+            commands.preflight_cluster_arg(f"{'f' * 24}:cluster0")
+        with self.assertRaises(SystemExit):
+            commands.preflight_cluster_arg(f"{project_id(3)}:missing")
+        self.assertEqual(self._api.request_count(), 3)
+        self.assertFalse(self._map.is_project_id("f" * 24))
+
+    def test_forbidden_or_malformed_project_exits_cleanly(self):
+        original = self._api._route
+
+        def route(method, url, parts, body):
+            if parts[:2] == ["groups", project_id(5)]:
+                return self._api._response(403, {"detail": "forbidden"})
+            if parts[:2] == ["groups", project_id(6)] and len(parts) > 3:
+                return self._api._response(401, {"detail": "unauthorized"})
+            return original(method, url, parts, body)
+        self._api._route = route
+
+        commands = Commands(self._map)
+        with self.assertRaises(SystemExit) as e:
+            commands.preflight_cluster_arg(f"{project_id(5)}:cluster0")
+        self.assertIn("is not a project ID", str(e.exception))
+        with self.assertRaises(SystemExit) as e:
+            commands.preflight_cluster_arg(f"{project_id(6)}:cluster0")
+        self.assertIn("is not a cluster name", str(e.exception))
+
+    def test_outage_is_not_reported_as_unknown_project(self):
+        original = self._api._route
+
+        def route(method, url, parts, body):
+            if parts[:2] == ["groups", project_id(5)]:
+                return self._api._response(503, {"detail": "unavailable"})
+            return original(method, url, parts, body)
+        self._api._route = route
+
+        with self.assertRaises(AtlasError):
+            Commands(self._map).preflight_cluster_arg(f"{project_id(5)}:cluster0")
+
+    def test_bare_name_crawls(self):
+        self._api.cluster_docs[project_id(4)][0]["name"] = "unique"
+        cluster_id = Commands(self._map).preflight_cluster_arg("unique")
+        self.assertEqual(cluster_id.project_id, project_id(4))
+        self.assertEqual(len(self._map.clusters), 150)
+
+    def test_crawl_replaces_resolved(self):
+        self._map.resolve_cluster(project_id(1), "cluster0")
+        self._map.populate_cluster_map()
+        self._api.requests.clear()
+        self.assertIsNotNone(self._map.resolve_cluster(project_id(1), "cluster0"))
+        self.assertEqual(self._api.request_count(), 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
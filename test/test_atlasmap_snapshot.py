@@ -0,0 +1,137 @@
+import io
+import os
+import shutil
+import tempfile
+import unittest
+from contextlib import redirect_stdout
+
+from atlascli import jsoncodec
+from atlascli.atlaskey import AtlasKey
+from atlascli.atlasmap import AtlasMap
+from atlascli.commands import Commands
+from test.fakeatlas import FakeAtlasAPI, make_cluster, project_id
+
+
+class TestAtlasMapSnapshot(unittest.TestCase):
+
+    def setUp(self):
+        self._dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self._dir)
+
+    def _age_snapshot(self, atlas_map: AtlasMap, seconds: float):
+        path = atlas_map.snapshot_path()
+        with open(path, encoding="utf-8") as f:
+            doc = jsoncodec.load(f)
+        doc["saved_at"] -= seconds
+        with open(path, "w", encoding="utf-8") as f:
+            jsoncodec.dump(doc, f)
+
+    def test_crawl_saves_snapshot(self):
+        api = FakeAtlasAPI.with_inventory(project_count=5, clusters_per_project=2)
+        atlas_map = AtlasMap(api=api, snapshot_dir=self._dir)
+        atlas_map.populate_cluster_map()
+        self.assertTrue(os.path.isfile(atlas_map.snapshot_path()))
+        self.assertNotIn("fake-private-key", atlas_map.snapshot_path())
+        self.assertIsNone(atlas_map.snapshot_age)
+
+    def test_fresh_snapshot_makes_no_calls(self):
+        AtlasMap(api=FakeAtlasAPI.with_inventory(3, 2), snapshot_dir=self._dir).populate_cluster_map()
+
+        api = FakeAtlasAPI.with_inventory(3, 2)
+        atlas_map = AtlasMap(api=api, snapshot_dir=self._dir)
+        self.assertEqual(len(atlas_map.clusters), 6)
+        self.assertEqual(atlas_map.get_cluster("cluster1", project_id(2))[0].project_id, project_id(2))
+        self.assertEqual(api.request_count(), 0)
+        self.assertIsNotNone(atlas_map.snapshot_age)
+
+    def test_stale_snapshot_refreshes_in_background(self):
+        first = AtlasMap(api=FakeAtlasAPI.with_inventory(3, 1), snapshot_dir=self._dir)
+        first.populate_cluster_map()
+        self._age_snapshot(first, 7200)
+
+        api = FakeAtlasAPI.with_inventory(3, 1)
+        api.cluster_docs[project_id(0)].append(make_cluster("added", project_id(0)))
+        atlas_map = AtlasMap(api=api, snapshot_dir=self._dir, snapshot_ttl=60)
+        self.assertEqual(len(atlas_map.clusters), 3)  # served from the stale snapshot
+        self.assertTrue(atlas_map._refresh_thread.daemon)  # a short command does not wait for it at exit
+        self.assertTrue(atlas_map.wait_for_refresh(timeout=10))
+        self.assertTrue(atlas_map.is_cluster_name("added"))
+
+        later = AtlasMap(api=FakeAtlasAPI.with_inventory(0, 0), snapshot_dir=self._dir)
+        self.assertTrue(later.is_cluster_name("added"))
+
+    def test_pause_reads_clusters_changed_since_the_snapshot(self):
+        api = FakeAtlasAPI.with_inventory(2, 0)
+        api.cluster_docs[project_id(0)] = [make_cluster("dev", project_id(0), paused=True)]
+        AtlasMap(api=api, snapshot_dir=self._dir).populate_cluster_map()
+        api.cluster_docs[project_id(0)][0]["paused"] = False  # resumed by someone else
+
+        atlas_map = AtlasMap(api=api, snapshot_dir=self._dir)
+        self.assertTrue(atlas_map.get_one_cluster(project_id(0), "dev").is_paused())
+        api.requests.clear()
+        with redirect_stdout(io.StringIO()):
+            summary = Commands(atlas_map).pause_cmd(["dev"])
+        self.assertEqual(summary, {"paused": 1, "skipped": 0, "failed": 0})
+        self.assertEqual(api.request_count("PATCH"), 1)
+        self.assertEqual(api.requests[("GET", "groups/{id}/clusters")], 1)
+
+    def test_mutations_save_once_when_flushed(self):
+        api = FakeAtlasAPI.with_inventory(2, 5)
+        atlas_map = AtlasMap(api=api, snapshot_dir=self._dir)
+        atlas_map.populate_cluster_map()
+        saved = []
+        save_snapshot = atlas_map.save_snapshot
+        atlas_map.save_snapshot = lambda: saved.append(1) or save_snapshot()
+        for cluster in atlas_map.get_clusters(project_id(0)):
+            atlas_map.pause_cluster(cluster)
+        self.assertEqual(saved, [])
+        atlas_map.flush_snapshot()
+        atlas_map.flush_snapshot()
+        self.assertEqual(saved, [1])
+
+        later = AtlasMap(api=FakeAtlasAPI.with_inventory(0, 0), snapshot_dir=self._dir)
+        self.assertTrue(all(c.is_paused() for c in later.get_clusters(project_id(0))))
+
+    def test_non_ascii_names_are_written_as_utf8(self):
+        api = FakeAtlasAPI.with_inventory(2, 1)
+        api.projects[0]["name"] = "Équipe données"
+        atlas_map = AtlasMap(api=api, snapshot_dir=self._dir)
+        atlas_map.populate_cluster_map()
+        with open(atlas_map.snapshot_path(), "rb") as f:
+            self.assertIn("Équipe données".encode("utf-8"), f.read())
+        later = AtlasMap(api=FakeAtlasAPI.with_inventory(0, 0), snapshot_dir=self._dir)
+        self.assertEqual(later.get_project_name(project_id(0)), "Équipe données")
+
+    def test_refresh_ignores_snapshot(self):
+        AtlasMap(api=FakeAtlasAPI.with_inventory(2, 1), snapshot_dir=self._dir).populate_cluster_map()
+        api = FakeAtlasAPI.with_inventory(4, 1)
+        atlas_map = AtlasMap(api=api, snapshot_dir=self._dir, refresh=True)
+        self.assertEqual(len(atlas_map.clusters), 4)
+        self.assertGreater(api.request_count(), 0)
+
+    def test_other_key_ignores_snapshot(self):
+        AtlasMap(api=FakeAtlasAPI.with_inventory(2, 1), snapshot_dir=self._dir).populate_cluster_map()
+        api = FakeAtlasAPI.with_inventory(4, 1)
+        atlas_map = AtlasMap(api=api, snapshot_dir=self._dir)
+        path = atlas_map.snapshot_path()
+        api.authenticate(AtlasKey("otherpublic", "other-private-key"))
+        self.assertNotEqual(path, atlas_map.snapshot_path())
+        self.assertIsNone(atlas_map.load_snapshot())
+        # only the public key is fingerprinted
+        fingerprint = api.key_fingerprint()
+        api.authenticate(AtlasKey("otherpublic", "rotated-private-key"))
+        self.assertEqual(api.key_fingerprint(), fingerprint)
+
+    def test_corrupt_snapshot_is_ignored(self):
+        api = FakeAtlasAPI.with_inventory(2, 1)
+        atlas_map = AtlasMap(api=api, snapshot_dir=self._dir)
+        with open(atlas_map.snapshot_path(), "w", encoding="utf-8") as f:
+            f.write("{not json")
+        self.assertEqual(len(atlas_map.clusters), 2)
+        self.assertGreater(api.request_count(), 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,31 @@
+import unittest
+from datetime import datetime, timezone
+
+from atlascli.atlasproject import AtlasProject
+from atlascli.atlasresource import parse_timestamp
+
+
+class TestAtlasResource(unittest.TestCase):
+
+    def test_parse_timestamp(self):
+        utc = datetime(2017, 11, 21, 12, 21, 11, tzinfo=timezone.utc)
+        self.assertEqual(parse_timestamp("2017-11-21T12:21:11Z"), utc)
+        self.assertEqual(parse_timestamp("2017-11-21T12:21:11+00:00"), utc)
+        self.assertEqual(parse_timestamp("2017-11-21T12:21:11.123Z").microsecond, 123000)
+        self.assertEqual(parse_timestamp("Tue, 21 Nov 2017 12:21:11 GMT"), utc)  # dateutil fallback
+        self.assertIs(parse_timestamp(utc), utc)
+
+    def test_created_is_lazy(self):
+        doc = {"id": "5a141a774e65811a132a8010", "name": "p", "created": "2017-11-21T12:21:11Z"}
+        project = AtlasProject(doc)
+        self.assertEqual(doc["created"], "2017-11-21T12:21:11Z")
+        self.assertEqual(project.created.year, 2017)
+        self.assertIs(project.created, project.created)
+        self.assertIs(project.resource, doc)
+        project["created"] = "2018-01-01T00:00:00Z"
+        self.assertEqual(project.created.year, 2018)
+        self.assertIsNone(AtlasProject({"id": "x", "name": "y"}).created)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,116 @@
+import threading
+import time
+import unittest
+
+from atlascli.atlascluster import AtlasCluster
+from atlascli.bulk import BulkExecutor, BulkOp
+from atlascli.clusterid import ClusterID
+from atlascli.errors import AtlasPatchError
+
+P1 = "5a141a774e65811a132a8010"
+P2 = "5f5fb85be8f4302a2bc457f1"
+
+
+class FakeAPI:
+
+    def __init__(self, fail=()):
+        self._fail = set(fail)
+        self._lock = threading.Lock()
+        self.in_flight = {}
+        self.max_in_flight = {}
+        self.calls = []
+
+    def _patch(self, c, doc):
+        with self._lock:
+            self.calls.append((c.project_id, c.name, doc))
+            n = self.in_flight.get(c.project_id, 0) + 1
+            self.in_flight[c.project_id] = n
+            self.max_in_flight[c.project_id] = max(n, self.max_in_flight.get(c.project_id, 0))
+        time.sleep(0.02)
+        with self._lock:
+            self.in_flight[c.project_id] -= 1
+        if c.name in self._fail:
+            raise AtlasPatchError(f"cannot patch {c.name}")
+        return AtlasCluster(c.project_id, c.name, dict(doc, name=c.name))
+
+    def pause_cluster(self, c):
+        return self._patch(c, {"paused": True})
+
+    def resume_cluster(self, c):
+        return self._patch(c, {"paused": False})
+
+    def modify_cluster(self, c, modifications):
+        return self._patch(c, modifications)
+
+    def delete_cluster(self, c):
+        return self._patch(c, {"deleted": True})
+
+    def create_cluster(self, project_id, name, config):
+        return self._patch(ClusterID(project_id, name), config)
+
+
+class TestBulkExecutor(unittest.TestCase):
+
+    def test_run(self):
+        api = FakeAPI(fail=["c3"])
+        items = [(BulkOp.PAUSE, ClusterID(P1, f"c{i}")) for i in range(6)]
+        items.append(("resume", ClusterID(P2, "r1")))
+        items.append((BulkOp.MODIFY, ClusterID(P2, "m1"), {"diskSizeGB": 40}))
+        items.append((BulkOp.CREATE, ClusterID(P2, "n1"), {"diskSizeGB": 10}))
+        seen = []
+        results = BulkExecutor(api, workers=8, per_project=2).run(items, on_result=seen.append)
+
+        self.assertEqual([r.index for r in results], list(range(len(items))))
+        self.assertEqual(len(seen), len(items))
+        self.assertEqual(BulkExecutor.summary(results), {"total": 9, "succeeded": 8, "failed": 1})
+        self.assertIsInstance(results[3].error, AtlasPatchError)
+        self.assertTrue(results[0].value["paused"])
+        self.assertFalse(results[6].value["paused"])
+        self.assertEqual(results[7].value["diskSizeGB"], 40)
+        self.assertEqual(results[8].name, "n1")
+        self.assertTrue(all(r.latency > 0 for r in results))
+        self.assertLessEqual(api.max_in_flight[P1], 2)
+
+    def test_busy_project_does_not_hold_workers(self):
+        api = FakeAPI()
+        other_started = threading.Event()
+        patch = api._patch
+
+        def blocking_patch(c, doc):
+            if c.project_id == P1:
+                other_started.wait(timeout=5)
+            else:
+                other_started.set()
+            return patch(c, doc)
+        api._patch = blocking_patch
+
+        # P1's items only finish once P2's has started, which needs a worker not
+        # tied up by P1 while both of P1's slots are taken
+        items = [(BulkOp.PAUSE, ClusterID(P1, f"c{i}")) for i in range(20)]
+        items.append((BulkOp.PAUSE, ClusterID(P2, "other")))
+        seen = []
+        start = time.monotonic()
+        BulkExecutor(api, workers=8, per_project=2).run(items, on_result=seen.append)
+        self.assertLess(time.monotonic() - start, 4)
+        self.assertIn("other", [r.name for r in seen[:3]])
+        self.assertLessEqual(api.max_in_flight[P1], 2)
+
+    def test_bad_args(self):
+        with self.assertRaises(ValueError):
+            BulkExecutor(FakeAPI(), workers=0)
+        with self.assertRaises(ValueError):
+            BulkExecutor(FakeAPI()).run([("explode", ClusterID(P1, "c1"))])
+
+    def test_bad_item_after_good_ones(self):
+        api = FakeAPI()
+        items = [(BulkOp.PAUSE, ClusterID(P1, "c0")), (BulkOp.RESUME, ClusterID(P1, "c1")),
+                 ("bogus", ClusterID(P1, "c2"))]
+        with self.assertRaises(ValueError):
+            BulkExecutor(api).run(items)
+        with self.assertRaises(ValueError):
+            BulkExecutor(api).run([(BulkOp.PAUSE, ClusterID(P1, "c0")), (BulkOp.PAUSE,)])
+        self.assertEqual(api.calls, [])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,87 @@
+import unittest
+
+from atlascli.atlascluster import AtlasCluster
+from atlascli.atlasmap import AtlasMap
+from atlascli.clusterquery import ClusterIndex, Condition, instance_size_rank, parse_condition, parse_query
+from test.fakeatlas import FakeAtlasAPI, make_cluster, project_id
+
+
+def cluster(name, pid=project_id(0), **kwargs):
+    return AtlasCluster(pid, name, make_cluster(name, pid, **kwargs))
+
+
+class TestClusterQuery(unittest.TestCase):
+
+    def test_parse(self):
+        self.assertEqual(parse_condition("size>=M40"), Condition("size", ">=", [40]))
+        self.assertEqual(parse_condition("stateName=idle"), Condition("state", "=", ["IDLE"]))
+        self.assertEqual(parse_condition("region = US_EAST_1,eu_west_1"),
+                         Condition("region", "=", ["US_EAST_1", "EU_WEST_1"]))
+        self.assertEqual(parse_condition("paused=false"), Condition("paused", "=", [False]))
+        self.assertEqual(len(parse_query(["state=IDLE and size>M10 provider=AWS"])), 3)
+        for bad in ("size", "colour=red", "region>US", "disk>=big", "paused=maybe"):
+            with self.assertRaises(ValueError):
+                parse_condition(bad)
+
+    def test_instance_size_rank(self):
+        self.assertLess(instance_size_rank("M40"), instance_size_rank("M200"))
+        self.assertEqual(instance_size_rank("R40"), 40)
+        self.assertEqual(instance_size_rank("M40_NVME"), 40)
+
+    def test_index(self):
+        index = ClusterIndex([cluster("a", size="M10"),
+                              cluster("b", size="M40", region="EU_WEST_1"),
+                              cluster("c", size="M200", paused=True),
+                              cluster("d", size="M40", provider="GCP", disk=100.0)])
+        names = lambda *conds: sorted(name for _, name in index.select([parse_condition(c) for c in conds]))
+        self.assertEqual(names("size>=M40"), ["b", "c", "d"])
+        self.assertEqual(names("size>=M40", "paused=false"), ["b", "d"])
+        self.assertEqual(names("size<M200", "provider!=GCP"), ["a", "b"])
+        self.assertEqual(names("disk>10"), ["d"])
+        self.assertEqual(names("region=US_EAST_1", "size>M40"), ["c"])
+        self.assertEqual(names(), ["a", "b", "c", "d"])
+
+        index.add(cluster("a", size="M300"))
+        self.assertEqual(names("size>M200"), ["a"])
+        index.remove(project_id(0), "c")
+        self.assertEqual(names("size>=M200"), ["a"])
+        self.assertEqual(names("paused=true"), [])
+        self.assertEqual(len(index), 3)
+
+    def test_size_classes(self):
+        index = ClusterIndex([cluster("m40", size="M40"),
+                              cluster("r40", size="R40"),
+                              cluster("nvme", size="M40_NVME"),
+                              cluster("m60", size="M60")])
+        names = lambda *conds: sorted(name for _, name in index.select([parse_condition(c) for c in conds]))
+        self.assertEqual(names("size=M40"), ["m40"])
+        self.assertEqual(names("size=r40"), ["r40"])
+        self.assertEqual(names("size=M40_NVME,M60"), ["m60", "nvme"])
+        self.assertEqual(names("size!=M40"), ["m60", "nvme", "r40"])
+        self.assertEqual(names("size>=M40"), ["m40", "m60", "nvme", "r40"])
+        self.assertEqual(names("size<M60"), ["m40", "nvme", "r40"])
+        index.remove(project_id(0), "m40")
+        self.assertEqual(names("size<=M40"), ["nvme", "r40"])
+        self.assertEqual(names("size=M40"), [])
+        self.assertTrue(parse_condition("size=M40").matches("M40"))
+        self.assertFalse(parse_condition("size=M40").matches("R40"))
+        self.assertTrue(parse_condition("size>M30").matches("R40"))
+
+    def test_map_query(self):
+        api = FakeAtlasAPI.with_inventory(project_count=3, clusters_per_project=0)
+        api.cluster_docs[project_id(0)] = [make_cluster("small", project_id(0)),
+                                           make_cluster("big", project_id(0), size="M60")]
+        api.cluster_docs[project_id(2)] = [make_cluster("big", project_id(2), size="M80", paused=True)]
+        atlas_map = AtlasMap(api=api)
+
+        self.assertEqual([c.project_id for c in atlas_map.query(["size>=M40"])], [project_id(0), project_id(2)])
+        self.assertEqual([c.name for c in atlas_map.query(["project=project0"])], ["big", "small"])
+
+        atlas_map.pause_cluster(atlas_map.get_one_cluster(project_id(0), "big"))
+        self.assertEqual(len(atlas_map.query(["paused=true"])), 2)
+        atlas_map.remove_cluster(project_id(2), "big")
+        self.assertEqual([c.project_id for c in atlas_map.query(["paused=true"])], [project_id(0)])
+
+
+if __name__ == '__main__':
+    unittest.main()
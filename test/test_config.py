@@ -23,5 +23,15 @@ class TestConfig(unittest.TestCase):
 
         #print(cfg)
 
+    def test_get_orgs(self):
+        cfg = Config(filename="atlascli.cfg.orgs.test")
+        try:
+            cfg.save_keys("public_xxx", "private_xxx", org="first")
+            cfg.save_keys("public_yyy", "private_yyy", org="second")
+            cfg.set_default_org("first")
+            self.assertEqual(Config(filename="atlascli.cfg.orgs.test").get_orgs(), ["first", "second"])
+        finally:
+            os.unlink("atlascli.cfg.orgs.test")
+
 if __name__ == '__main__':
     unittest.main()
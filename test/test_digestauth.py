@@ -0,0 +1,63 @@
+import threading
+import unittest
+
+import requests
+
+from atlascli.digestauth import PreemptiveDigestAuth
+
+URL = "https://cloud.mongodb.com/api/atlas/v1.0/groups"
+
+
+def prepare(url=URL):
+    return requests.Request("GET", url).prepare()
+
+
+def challenge(auth, nonce):
+    # What handle_401() does with a WWW-Authenticate header
+    auth.init_per_thread_state()
+    auth._thread_local.chal = {"realm": "MMS Public API", "nonce": nonce, "qop": "auth", "algorithm": "MD5"}
+    return auth.build_digest_header("GET", URL)
+
+
+class TestPreemptiveDigestAuth(unittest.TestCase):
+
+    def test_no_challenge(self):
+        auth = PreemptiveDigestAuth("user", "password")
+        r = auth(prepare())
+        self.assertNotIn("Authorization", r.headers)
+
+    def test_preemptive_across_threads(self):
+        auth = PreemptiveDigestAuth("user", "password")
+        header = challenge(auth, "abc")
+        self.assertIn("nc=00000001", header)
+        self.assertEqual(auth.challenges, 1)
+
+        headers = []
+
+        def sign():
+            headers.append(auth(prepare()).headers["Authorization"])
+
+        threads = [threading.Thread(target=sign) for _ in range(8)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+
+        self.assertTrue(all('nonce="abc"' in h for h in headers))
+        counts = sorted(h.split("nc=")[1].split(",")[0] for h in headers)
+        self.assertEqual(counts, [f"{i:08x}" for i in range(2, 10)])
+        self.assertEqual(auth.challenges, 1)
+
+    def test_stale_nonce(self):
+        auth = PreemptiveDigestAuth("user", "password")
+        challenge(auth, "abc")
+        auth(prepare())
+        header = challenge(auth, "def")
+        self.assertIn("nc=00000001", header)
+        self.assertEqual(auth.nonce, "def")
+        self.assertEqual(auth.challenges, 2)
+        self.assertIn('nonce="def"', auth(prepare()).headers["Authorization"])
+
+
+if __name__ == '__main__':
+    unittest.main()
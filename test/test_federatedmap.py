@@ -0,0 +1,129 @@
+import io
+import os
+import tempfile
+import unittest
+from contextlib import redirect_stdout
+
+from atlascli.commands import Commands
+from atlascli.config import Config
+from atlascli.federatedmap import FederatedAtlasMap
+from atlascli.retry import RetryPolicy
+from test.fakeatlas import FakeAtlasAPI, project_id
+
+
+class UnavailableAtlasAPI(FakeAtlasAPI):
+
+    def __init__(self, *args, down=False, **kwargs):
+        kwargs.setdefault("retry_policy", RetryPolicy(max_retries=0))
+        super().__init__(*args, **kwargs)
+        self.down = down
+
+    def _request(self, method, url, **kwargs):
+        if self.down:
+            return self._response(503, {"detail": "unavailable"})
+        return super()._request(method, url, **kwargs)
+
+
+class OtherOrgAtlasAPI(FakeAtlasAPI):
+    """
+    Atlas refuses a key access to another organization's projects
+    """
+
+    def _route(self, method, url, parts, body):
+        if len(parts) >= 2 and parts[0] == "groups" and self._find_project(parts[1]) is None:
+            return self._response(403, {"detail": "forbidden"})
+        return super()._route(method, url, parts, body)
+
+
+class TestFederatedAtlasMap(unittest.TestCase):
+
+    def setUp(self):
+        fd, self._filename = tempfile.mkstemp(suffix=".cfg")
+        os.close(fd)
+        self._config = Config(filename=self._filename)
+        self._apis = {}
+        for n, name in enumerate(["alpha", "beta", "gamma"]):
+            self._config.save_keys(f"public-{name}", f"private-{name}", org=name)
+            api = FakeAtlasAPI.with_inventory(project_count=2, clusters_per_project=2)
+            api.org = dict(api.org, id=f"{n + 1:024x}", name=name)
+            self._apis[name] = api
+
+    def tearDown(self):
+        os.unlink(self._filename)
+
+    def _federated_map(self, **kwargs):
+        return FederatedAtlasMap.from_config(self._config, api_factory=lambda name: self._apis[name], **kwargs)
+
+    def test_connects_each_org_with_its_keys(self):
+        federated = self._federated_map()
+        self.assertEqual(sorted(federated.names), ["alpha", "beta", "gamma"])
+        self.assertEqual(self._apis["beta"]._auth.username, "public-beta")
+        federated.populate()
+        self.assertEqual(len(list(federated.clusters())), 12)
+        self.assertEqual(federated.errors, {})
+
+    def test_failed_org_does_not_block_others(self):
+        self._apis["beta"] = UnavailableAtlasAPI(down=True)
+        gamma = self._apis["gamma"] = UnavailableAtlasAPI.with_inventory(project_count=2, clusters_per_project=2)
+        federated = self._federated_map()
+        self.assertEqual(sorted(federated.names), ["alpha", "gamma"])
+        gamma.down = True
+        federated.populate()
+        self.assertEqual(sorted(federated.errors.keys()), ["beta", "gamma"])
+        self.assertEqual(len(federated.maps["alpha"].clusters), 4)
+
+    def test_lookups(self):
+        federated = self._federated_map()
+        found = federated.get_clusters(f"beta:{project_id(1)}:cluster0")
+        self.assertEqual([(name, c.project_id) for name, c in found], [("beta", project_id(1))])
+        self.assertEqual(self._apis["alpha"].request_count(), 1)  # only the organization
+
+        found = federated.get_clusters(f"{2:024x}:{project_id(0)}:cluster1")
+        self.assertEqual([name for name, _ in found], ["beta"])
+
+        self.assertEqual(len(federated.get_clusters("cluster1")), 6)
+        self.assertEqual(len(federated.get_clusters(f"{project_id(1)}:cluster1")), 3)
+        with self.assertRaises(ValueError):
+            federated.get_clusters("delta:x:y")
+
+    def test_find_project_in_one_org(self):
+        for name, api in list(self._apis.items()):
+            self._apis[name] = OtherOrgAtlasAPI(api.projects, api.cluster_docs)
+            self._apis[name].org = api.org
+        gamma = self._apis["gamma"]
+        gamma.projects = [dict(p, id=project_id(10 + n)) for n, p in enumerate(gamma.projects)]
+        gamma.cluster_docs = {project_id(10 + n): docs for n, docs in enumerate(gamma.cluster_docs.values())}
+        federated = self._federated_map()
+
+        self.assertEqual([name for name, _ in federated.find_project(project_id(11))], ["gamma"])
+        self.assertEqual([name for name, _ in federated.find_project(project_id(0))], ["alpha", "beta"])
+        self.assertEqual(federated.find_project(project_id(20)), [])
+        self.assertEqual(federated.errors, {})
+
+        out = io.StringIO()
+        with redirect_stdout(out):
+            Commands.federated_list_cmd(federated, False, [project_id(11)], None)
+        self.assertIn("[gamma]", out.getvalue())
+        self.assertNotIn("[alpha]", out.getvalue())
+
+    def test_failed_org_is_reported_not_missing(self):
+        beta = self._apis["beta"] = UnavailableAtlasAPI.with_inventory(project_count=2, clusters_per_project=2)
+        federated = self._federated_map()
+        beta.down = True
+        self.assertEqual([name for name, _ in federated.get_clusters("cluster1")], ["alpha", "alpha", "gamma", "gamma"])
+        self.assertEqual(list(federated.errors), ["beta"])
+
+        out = io.StringIO()
+        with redirect_stdout(out):
+            Commands.federated_list_cmd(federated, False, None, ["nosuch"])
+        self.assertIn("that could be read", out.getvalue())
+        self.assertIn("[beta] could not be read", out.getvalue())
+
+    def test_parse_id(self):
+        self.assertEqual(FederatedAtlasMap.parse_id("a:b:c"), ("a", "b", "c"))
+        self.assertEqual(FederatedAtlasMap.parse_id("b:c"), (None, "b", "c"))
+        self.assertEqual(FederatedAtlasMap.parse_id("c"), (None, None, "c"))
+
+
+if __name__ == '__main__':
+    unittest.main()
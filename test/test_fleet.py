@@ -0,0 +1,181 @@
+import io
+import os
+import tempfile
+import unittest
+from contextlib import redirect_stdout
+
+from atlascli import jsoncodec
+from atlascli.atlasmap import AtlasMap
+from atlascli.bulk import BulkOp
+from atlascli.commands import Commands
+from atlascli.fleet import ClusterSpec, FleetApplier, FleetSpec, merge_config, plan_fleet
+from atlascli.waiter import ClusterWaiter
+from test.fakeatlas import FakeAtlasAPI, make_cluster, project_id
+
+
+class SettlingClock:
+    """
+    Every cluster that is changing finishes whenever the waiter sleeps
+    """
+
+    def __init__(self, api):
+        self.now = 0.0
+        self._api = api
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.now += seconds
+        for pid, docs in self._api.cluster_docs.items():
+            self._api.cluster_docs[pid] = [d for d in docs if d["stateName"] != "DELETING"]
+            for doc in self._api.cluster_docs[pid]:
+                doc["stateName"] = "IDLE"
+
+
+class TestFleet(unittest.TestCase):
+
+    def setUp(self):
+        self._api = FakeAtlasAPI.with_inventory(project_count=2, clusters_per_project=0)
+        self._api.cluster_docs[project_id(0)] = [make_cluster("web", project_id(0)),
+                                                 make_cluster("batch", project_id(0), paused=True),
+                                                 make_cluster("idle", project_id(0), paused=True),
+                                                 make_cluster("old", project_id(0))]
+        self._api.cluster_docs[project_id(1)] = [make_cluster("keep", project_id(1)),
+                                                 make_cluster("stray", project_id(1))]
+        self._map = AtlasMap(api=self._api)
+        self._fleet = {
+            "projects": {
+                project_id(0): {"clusters": {
+                    "web": {"instanceSize": "M30", "diskSizeGB": 40},   # one merged PATCH
+                    "batch": {"instanceSize": "M20"},                   # resume, modify, pause
+                    "idle": {"paused": True, "diskSizeGB": 10},         # no-op
+                    "old": {"delete": True},
+                    "new": {"instanceSize": "M10", "paused": True,
+                            "config": {"providerSettings": {"regionName": "EU_WEST_1"}}}}},
+                "project1": {"prune": True, "clusters": {"keep": {"paused": True}}}
+            }
+        }
+        self._api.requests.clear()
+
+    def applier(self):
+        clock = SettlingClock(self._api)
+        waiter = ClusterWaiter(self._api, self._map, interval=1, clock=clock, sleep=clock.sleep)
+        return FleetApplier(self._map, waiter=waiter, clock=clock)
+
+    def test_plan(self):
+        plan = plan_fleet(FleetSpec.from_dict(self._fleet, self._map), self._map)
+        steps = {c.name: [s.op for s in c.steps] for c in plan.changes}
+        self.assertEqual(steps, {"web": [BulkOp.MODIFY],
+                                 "batch": [BulkOp.RESUME, BulkOp.MODIFY, BulkOp.PAUSE],
+                                 "old": [BulkOp.DELETE],
+                                 "new": [BulkOp.CREATE, BulkOp.PAUSE],
+                                 "keep": [BulkOp.PAUSE],
+                                 "stray": [BulkOp.DELETE]})
+        self.assertEqual(plan.unchanged, [(project_id(0), "idle")])
+        self.assertEqual(plan.api_calls, 9)
+        self.assertEqual(sorted(plan.deletes), [(project_id(0), "old"), (project_id(1), "stray")])
+        web = next(c for c in plan.changes if c.name == "web")
+        self.assertEqual(web.steps[0].data, {"providerSettings": {"providerName": "AWS", "instanceSizeName": "M30"},
+                                             "diskSizeGB": 40.0})
+        new = next(c for c in plan.changes if c.name == "new")
+        self.assertEqual(new.steps[0].data["providerSettings"]["regionName"], "EU_WEST_1")
+        self.assertEqual(self._api.request_count("PATCH"), 0)
+
+    def test_apply(self):
+        plan = plan_fleet(FleetSpec.from_dict(self._fleet, self._map), self._map)
+        result = self.applier().apply(plan, wait=True)
+        self.assertTrue(result.ok)
+        self.assertEqual(result.summary(), {"created": 1, "modified": 2, "paused": 3, "resumed": 1,
+                                            "deleted": 2, "failed": 0})
+        self.assertEqual(self._api.request_count("PATCH") + self._api.request_count("POST") +
+                         self._api.request_count("DELETE"), plan.api_calls)
+
+        converged = plan_fleet(FleetSpec.from_dict(self._fleet, self._map), self._map)
+        self.assertEqual(converged.changes, [])
+        batch = self._map.get_one_cluster(project_id(0), "batch")
+        self.assertEqual((batch.instance_size(), batch.is_paused()), ("M20", True))
+        self.assertEqual([c.name for c in self._map.get_clusters(project_id(1))], ["keep"])
+        self.assertTrue(self._map.get_one_cluster(project_id(0), "new").is_paused())
+
+    def test_failure_stops_chain(self):
+        original = self._api._route
+
+        def route(method, url, parts, body):
+            if method == "PATCH" and parts[-1] == "batch" and body == {"paused": False}:
+                return self._api._response(400, {"detail": "cannot resume"})
+            return original(method, url, parts, body)
+        self._api._route = route
+
+        plan = plan_fleet(FleetSpec.from_dict(self._fleet, self._map), self._map)
+        result = self.applier().apply(plan)
+        self.assertEqual(list(result.failed), [(project_id(0), "batch")])
+        self.assertEqual(result.summary()["modified"], 1)
+        self.assertTrue(self._map.get_one_cluster(project_id(0), "batch").is_paused())
+
+    def test_apply_cmd_exits_on_failure(self):
+        original = self._api._route
+
+        def route(method, url, parts, body):
+            if method == "PATCH" and parts[-1] == "batch":
+                return self._api._response(400, {"detail": "cannot resume"})
+            return original(method, url, parts, body)
+        self._api._route = route
+
+        fleet = {"projects": {project_id(0): {"clusters": {"batch": {"paused": False},
+                                                           "web": {"diskSizeGB": 40}}}}}
+        with tempfile.TemporaryDirectory() as d:
+            path = os.path.join(d, "fleet.json")
+            with open(path, "w", encoding="utf-8") as f:
+                jsoncodec.dump(fleet, f)
+            with redirect_stdout(io.StringIO()):
+                with self.assertRaises(SystemExit) as e:
+                    Commands(self._map).apply_cmd(path, yes=True)
+        self.assertIn("1 cluster(s)", str(e.exception))
+        self.assertEqual(self._map.get_one_cluster(project_id(0), "web").disk_size(), 40)
+
+    def test_spec_errors(self):
+        with self.assertRaises(ValueError):
+            FleetSpec.from_dict({"projects": {"nosuch": {}}}, self._map)
+        with self.assertRaises(ValueError):
+            ClusterSpec.from_dict(project_id(0), "web", {"size": "M10"})
+        self._api.cluster_docs[project_id(0)][0]["stateName"] = "DELETING"
+        self._map.refresh()
+        with self.assertRaises(ValueError):
+            plan_fleet(FleetSpec.from_dict({"projects": {project_id(0): {"clusters": {"web": {}}}}}, self._map),
+                       self._map)
+
+    def test_merge_config(self):
+        base = {"a": 1, "b": {"c": 2, "d": 3}}
+        self.assertEqual(merge_config(base, {"b": {"c": 4}, "e": 5}), {"a": 1, "b": {"c": 4, "d": 3}, "e": 5})
+        self.assertEqual(base, {"a": 1, "b": {"c": 2, "d": 3}})
+
+    def test_plan_cmd(self):
+        with tempfile.TemporaryDirectory() as d:
+            path = os.path.join(d, "fleet.json")
+            with open(path, "w", encoding="utf-8") as f:
+                jsoncodec.dump(self._fleet, f)
+            out = io.StringIO()
+            with redirect_stdout(out):
+                plan = Commands(self._map).plan_cmd(path)
+        self.assertEqual(plan.api_calls, 9)
+        self.assertIn("9 API call(s)", out.getvalue())
+
+    def test_apply_reads_current_state(self):
+        self._map.populate_cluster_map()
+        # created and resumed by someone else after the map was read
+        self._api.cluster_docs[project_id(0)].append(make_cluster("new", project_id(0), paused=True))
+        self._api.cluster_docs[project_id(0)][1]["paused"] = False
+        with tempfile.TemporaryDirectory() as d:
+            path = os.path.join(d, "fleet.json")
+            with open(path, "w", encoding="utf-8") as f:
+                jsoncodec.dump(self._fleet, f)
+            with redirect_stdout(io.StringIO()):
+                summary = Commands(self._map).apply_cmd(path, yes=True, timeout=5)
+        self.assertEqual(self._api.request_count("POST"), 0)
+        self.assertEqual(summary["resumed"], 0)
+        self.assertEqual(summary["created"], 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
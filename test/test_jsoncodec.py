@@ -0,0 +1,58 @@
+import io
+import json
+import unittest
+import unittest.mock
+from datetime import datetime, timezone
+
+from atlascli import jsoncodec
+from atlascli.atlasproject import AtlasProject
+
+DOC = {"id": "5a141a774e65811a132a8010",
+       "name": "Open Data Project",
+       "clusterCount": 3,
+       "links": [{"href": "https://cloud.mongodb.com/api/atlas/v1.0/groups", "rel": "self"}],
+       "created": datetime(2017, 11, 21, 12, 21, 11, tzinfo=timezone.utc)}
+
+
+class TestJSONCodec(unittest.TestCase):
+
+    def test_datetime(self):
+        s = jsoncodec.dumps(DOC)
+        self.assertEqual(jsoncodec.loads(s)["created"], "2017-11-21 12:21:11+00:00")
+
+    def test_backends_agree(self):
+        expected = json.dumps(DOC, indent=2, default=jsoncodec.json_datetime_encoder)
+        self.assertEqual(jsoncodec.dumps(DOC, indent=2), expected)
+        if jsoncodec.orjson:
+            self.assertEqual(jsoncodec._orjson_dumps(DOC, indent=2), expected)
+
+    def test_backends_agree_compact_and_non_ascii(self):
+        doc = dict(DOC, name="Caf\u00e9 \u2013 donn\u00e9es")
+        for indent in (None, 2):
+            with unittest.mock.patch.object(jsoncodec, "orjson", None):
+                text = jsoncodec.dumps(doc, indent=indent)
+            self.assertIn("Caf\u00e9", text)
+            if jsoncodec.orjson:
+                self.assertEqual(text, jsoncodec._orjson_dumps(doc, indent))
+        self.assertEqual(jsoncodec.dumps({"a": 1}), '{"a":1}')
+
+    def test_fallback(self):
+        self.assertEqual(jsoncodec.dumps({1: "a"}), '{"1":"a"}')
+        self.assertEqual(jsoncodec.dumps({"a": 1}, indent=4), '{\n    "a": 1\n}')
+
+    def test_loads_bytes(self):
+        self.assertEqual(jsoncodec.loads(b'{"a": [1, 2]}'), {"a": [1, 2]})
+
+    def test_file(self):
+        f = io.StringIO()
+        jsoncodec.dump(DOC, f, indent=2)
+        f.seek(0)
+        self.assertEqual(jsoncodec.load(f)["name"], "Open Data Project")
+
+    def test_resource_json(self):
+        project = AtlasProject(dict(DOC, created="2017-11-21T12:21:11Z"))
+        self.assertEqual(jsoncodec.loads(project.json())["created"], "2017-11-21T12:21:11Z")
+
+
+if __name__ == '__main__':
+    unittest.main()
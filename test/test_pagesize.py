@@ -0,0 +1,51 @@
+import unittest
+
+from atlascli.atlasapi import AtlasAPI
+from atlascli.errors import AtlasInitialisationError
+from atlascli.pagesize import PageSizeController
+
+
+class TestPageSizeController(unittest.TestCase):
+
+    def test_resource_key(self):
+        self.assertEqual(PageSizeController.resource_key(
+            "https://cloud.mongodb.com/api/atlas/v1.0/groups/5a141a774e65811a132a8010/clusters?pageNum=2"),
+            "/groups/{id}/clusters")
+        self.assertEqual(PageSizeController.resource_key("/groups"), "/groups")
+
+    def test_no_history(self):
+        c = PageSizeController(initial_page_size=200)
+        self.assertEqual(c.choose("/groups"), 200)
+
+    def test_total_count(self):
+        c = PageSizeController()
+        c.observe("/groups/5a141a774e65811a132a8010/clusters?pageNum=1", items=3, total_count=3,
+                  nbytes=3000, seconds=0.1)
+        self.assertEqual(c.choose("/groups/5a141a774e65811a132a8010/clusters?pageNum=1"), 3)
+        # a small project does not shrink the pages of another
+        self.assertEqual(c.choose("/groups/5f5fb85be8f4302a2bc457f1/clusters"), 500)
+        c.observe("/groups", items=100, total_count=2000, nbytes=100000, seconds=0.2)
+        self.assertEqual(c.choose("/groups"), 500)
+
+    def test_byte_and_latency_budget(self):
+        c = PageSizeController(max_page_bytes=100000, target_page_seconds=1000)
+        c.observe("/groups", items=10, total_count=5000, nbytes=10000, seconds=0.1)
+        self.assertEqual(c.choose("/groups"), 100)
+        c = PageSizeController(target_page_seconds=2.0)
+        c.observe("/groups", items=10, total_count=5000, nbytes=100, seconds=0.1)
+        self.assertEqual(c.choose("/groups"), 200)
+        decision = c.stats()["decisions"][-1]
+        self.assertEqual(decision["items_per_page"], 200)
+        self.assertIn("latency", decision["reason"])
+
+    def test_api_page_size(self):
+        self.assertEqual(AtlasAPI(page_size=250).items_per_page("/groups"), 250)
+        api = AtlasAPI(page_size=AtlasAPI.AUTO_PAGE_SIZE)
+        self.assertEqual(api.items_per_page("/groups"), PageSizeController.MAX_PAGE_SIZE)
+        self.assertEqual(len(api.stats()["page_size"]["decisions"]), 1)
+        with self.assertRaises(AtlasInitialisationError):
+            AtlasAPI(page_size=501)
+
+
+if __name__ == '__main__':
+    unittest.main()
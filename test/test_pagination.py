@@ -0,0 +1,81 @@
+import threading
+import time
+import unittest
+from urllib.parse import urlparse, parse_qs
+
+from atlascli.atlasapi import AtlasAPI
+
+
+class ListingAPI(AtlasAPI):
+    """
+    An AtlasAPI that paginates an in memory list of items, honouring
+    'pageNum' and 'itemsPerPage' like Atlas does.
+    """
+
+    def __init__(self, item_count, delay=0.0, **kwargs):
+        super().__init__(**kwargs)
+        self._auth = object()
+        self._items = [{"id": str(i), "name": f"item{i}"} for i in range(item_count)]
+        self._delay = delay
+        self._lock = threading.Lock()
+        self.requests = []
+        self.in_flight = 0
+        self.max_in_flight = 0
+
+    def get(self, resource, headers=None, page_num=1, items_per_page=100):
+        query = parse_qs(urlparse(resource).query)
+        page_num = int(query.get("pageNum", [page_num])[0])
+        items_per_page = int(query.get("itemsPerPage", [items_per_page])[0])
+        with self._lock:
+            self.requests.append(page_num)
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        time.sleep(self._delay)
+        with self._lock:
+            self.in_flight -= 1
+        start = (page_num - 1) * items_per_page
+        results = self._items[start:start + items_per_page]
+        links = [{"rel": "self", "href": resource}]
+        if start + items_per_page < len(self._items):
+            links.append({"rel": "next",
+                          "href": f"{self.ATLAS_BASE_URL}/groups?itemsPerPage={items_per_page}&pageNum={page_num + 1}"})
+        return {"results": results, "links": links, "totalCount": len(self._items)}
+
+
+class TestPagination(unittest.TestCase):
+
+    def test_sequential(self):
+        api = ListingAPI(250)
+        items = list(api.get_resource_by_item("/groups"))
+        self.assertEqual([i["id"] for i in items], [str(i) for i in range(250)])
+        self.assertEqual(api.requests, [1, 2, 3])
+
+    def test_page_size(self):
+        api = ListingAPI(300, page_size=250)
+        self.assertEqual(len(list(api.get_resource_by_item("/groups"))), 300)
+        self.assertEqual(api.requests, [1, 2])
+
+    def test_concurrent_in_order(self):
+        api = ListingAPI(1050, delay=0.01, page_workers=4, max_inflight_pages=3)
+        items = list(api.get_resource_by_item("/groups"))
+        self.assertEqual([i["id"] for i in items], [str(i) for i in range(1050)])
+        self.assertEqual(sorted(api.requests), list(range(1, 12)))
+        self.assertGreater(api.max_in_flight, 1)
+        self.assertLessEqual(api.max_in_flight, 3)
+
+    def test_concurrent_single_page(self):
+        api = ListingAPI(5, page_workers=4)
+        self.assertEqual(len(list(api.get_resource_by_item("/groups"))), 5)
+        self.assertEqual(api.requests, [1])
+
+    def test_abandoned_generator(self):
+        api = ListingAPI(1000, page_workers=2, max_inflight_pages=2)
+        gen = api.get_resource_by_item("/groups")
+        first = next(gen)
+        gen.close()
+        self.assertEqual(first["id"], "0")
+        self.assertLessEqual(len(api.requests), 4)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,73 @@
+import io
+import unittest
+from contextlib import redirect_stdout
+
+from atlascli.atlasmap import AtlasMap
+from atlascli.commands import Commands
+from test.fakeatlas import FakeAtlasAPI, make_cluster, project_id
+
+
+class TestPauseResumeCommands(unittest.TestCase):
+
+    def setUp(self):
+        self._api = FakeAtlasAPI.with_inventory(project_count=3, clusters_per_project=0)
+        self._api.cluster_docs[project_id(0)] = [make_cluster(f"dev{n}", project_id(0)) for n in range(6)]
+        self._api.cluster_docs[project_id(1)] = [make_cluster("paused", project_id(1), paused=True),
+                                                 make_cluster("flaky", project_id(1))]
+        self._map = AtlasMap(api=self._api)
+        self._commands = Commands(self._map)
+
+    def run_cmd(self, cmd, *args, **kwargs):
+        out = io.StringIO()
+        with redirect_stdout(out):
+            summary = cmd(*args, **kwargs)
+        return summary, out.getvalue()
+
+    def run_failing_cmd(self, cmd, *args, **kwargs):
+        out = io.StringIO()
+        with redirect_stdout(out):
+            with self.assertRaises(SystemExit) as e:
+                cmd(*args, **kwargs)
+        self.assertTrue(e.exception.code)  # a non-zero exit status
+        return str(e.exception), out.getvalue()
+
+    def test_pause_in_parallel(self):
+        names = [f"{project_id(0)}:dev{n}" for n in range(6)] + ["paused", f"{project_id(0)}:dev0", "nosuch"]
+        message, out = self.run_failing_cmd(self._commands.pause_cmd, names, parallel=4)
+        self.assertEqual(message, "1 cluster(s) could not be paused")
+        self.assertRegex(out, r"paused\s+6\s+skipped\s+1\s+failed\s+1")
+        self.assertEqual(self._api.request_count("PATCH"), 6)
+        self.assertTrue(all(c.is_paused() for c in self._map.get_clusters(project_id(0))))
+        self.assertIn("already paused", out)
+        self.assertIn("nosuch", out)
+
+    def test_failure_does_not_stop_others(self):
+        flaky = self._api.cluster_docs[project_id(1)][1]
+        original = self._api._route
+
+        def route(method, url, parts, body):
+            if method == "PATCH" and parts[-1] == flaky["name"]:
+                return self._api._response(400, {"detail": "cannot pause"})
+            return original(method, url, parts, body)
+        self._api._route = route
+
+        message, out = self.run_failing_cmd(self._commands.pause_cmd, ["flaky", "dev1", "dev2"], parallel=2)
+        self.assertEqual(message, "1 cluster(s) could not be paused")
+        self.assertEqual(self._api.request_count("PATCH"), 3)
+        self.assertTrue(self._map.get_one_cluster(project_id(0), "dev2").is_paused())
+        self.assertIn(f"{project_id(1)}:flaky", out)
+
+    def test_unknown_cluster_in_dry_run(self):
+        message, out = self.run_failing_cmd(self._commands.resume_cmd, ["paused", "nosuch"], dry_run=True)
+        self.assertEqual(message, "1 cluster(s) could not be found")
+        self.assertIn("nosuch", out)
+        self.assertEqual(self._api.request_count("PATCH"), 0)
+
+    def test_resume(self):
+        summary, _ = self.run_cmd(self._commands.resume_cmd, ["paused", "dev3"])
+        self.assertEqual(summary, {"resumed": 1, "skipped": 1, "failed": 0})
+        self.assertFalse(self._map.get_one_cluster(project_id(1), "paused").is_paused())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,71 @@
+import unittest
+
+from atlascli.atlascluster import AtlasCluster
+from atlascli.atlasmap import AtlasMap
+from atlascli.records import ClusterRecord, LoadedDocuments, ProjectRecord, loaded_documents
+from test.fakeatlas import FakeAtlasAPI, make_cluster, project_id
+
+
+class TestRecords(unittest.TestCase):
+
+    def test_cluster_record(self):
+        doc = make_cluster("c1", project_id(1), size="M30", paused=True, region="EU_WEST_1", disk=40.0)
+        cluster = AtlasCluster(project_id(1), "c1", doc)
+        record = ClusterRecord.from_cluster(cluster)
+        self.assertFalse(hasattr(record, "__dict__"))
+        self.assertEqual(record.project_id, project_id(1))
+        self.assertEqual(record.instance_size(), cluster.instance_size())
+        self.assertEqual(record.disk_size(), cluster.disk_size())
+        self.assertEqual(record.provider_name(), cluster.provider_name())
+        self.assertEqual(record.region_name(), "EU_WEST_1")
+        self.assertEqual(record.status(), cluster.status())
+        self.assertEqual(record.summary(), cluster.summary())
+        self.assertEqual(ClusterRecord.from_dict(project_id(1), record.to_dict()), record)
+        self.assertEqual(record.replace(state="DELETING").state, "DELETING")
+        self.assertEqual(record.state, "IDLE")
+
+    def test_project_record(self):
+        doc = {"id": project_id(2), "name": "p2", "orgId": "org", "clusterCount": 3, "links": []}
+        record = ProjectRecord.from_dict(doc)
+        self.assertFalse(hasattr(record, "__dict__"))
+        self.assertEqual(record.to_dict(), {"id": project_id(2), "name": "p2", "orgId": "org", "clusterCount": 3})
+
+    def test_compact_map(self):
+        api = FakeAtlasAPI.with_inventory(project_count=3, clusters_per_project=2)
+        atlas_map = AtlasMap(api=api, compact=True)
+        self.assertTrue(all(isinstance(c, ClusterRecord) for c in atlas_map.clusters))
+        self.assertTrue(all(isinstance(p, ProjectRecord) for p in atlas_map.projects))
+
+        api.requests.clear()
+        loaded_documents.clear()
+        cluster = atlas_map.get_one_cluster(project_id(1), "cluster1")
+        self.assertEqual(cluster.resource["mongoURI"], "mongodb://host1,host2,host3")
+        self.assertEqual(cluster.resource["stateName"], "IDLE")
+        self.assertEqual(api.request_count("GET"), 1)  # the document is kept after the first fetch
+        self.assertEqual(cluster.replace(state="REPAIRING").resource["stateName"], "IDLE")
+        self.assertEqual(api.request_count("GET"), 2)  # a replaced record fetches again
+
+        for other in atlas_map.clusters:
+            other.pretty()
+        self.assertEqual(len(loaded_documents), 7)  # every cluster and the replaced record
+
+        paused = atlas_map.pause_cluster(cluster)
+        self.assertIsInstance(paused, ClusterRecord)
+        self.assertTrue(atlas_map.get_one_cluster(project_id(1), "cluster1").is_paused())
+        deleted = atlas_map.delete_cluster(paused)
+        self.assertEqual(atlas_map.get_one_cluster(project_id(1), "cluster1").state, "DELETING")
+        self.assertIsInstance(deleted, ClusterRecord)
+
+    def test_loaded_documents_are_bounded(self):
+        # records keep no document of their own, only the last few fetched are kept
+        records = [ClusterRecord(project_id(0), f"c{n}", loader=lambda pid, name: name) for n in range(3)]
+        documents = LoadedDocuments(size=2)
+        fetched = []
+        for n in (0, 1, 2, 2, 0):
+            self.assertEqual(documents.get(records[n], lambda: fetched.append(n) or n), n)
+        self.assertEqual(fetched, [0, 1, 2, 0])
+        self.assertEqual(len(documents), 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,105 @@
+import os
+import shutil
+import tempfile
+import time
+import unittest
+
+import requests
+
+from atlascli.atlasapi import AtlasAPI
+from atlascli.responsecache import ResponseCache
+
+URL = "https://cloud.mongodb.com/api/atlas/v1.0/groups/5a141a774e65811a132a8010/clusters"
+
+
+def response(status, body=b"", etag=None):
+    r = requests.Response()
+    r.status_code = status
+    r._content = body
+    if etag:
+        r.headers["ETag"] = etag
+    return r
+
+
+class RecordingSession:
+
+    def __init__(self, responses):
+        self._responses = list(responses)
+        self.headers = []
+
+    def request(self, method, url, headers=None, **kwargs):
+        self.headers.append(dict(headers) if headers else {})
+        return self._responses.pop(0)
+
+
+class TestResponseCache(unittest.TestCase):
+
+    def setUp(self):
+        self._dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self._dir)
+
+    def test_lru(self):
+        cache = ResponseCache(max_entries=2)
+        for i in range(3):
+            cache.store(f"{URL}/{i}", response(200, b"{}", etag=str(i)))
+        self.assertIsNone(cache.lookup(f"{URL}/0"))
+        self.assertIsNotNone(cache.lookup(f"{URL}/1"))
+        self.assertEqual(cache.stats()["evictions"], 1)
+
+    def test_no_validators(self):
+        cache = ResponseCache()
+        cache.store(URL, response(200, b"{}"))
+        self.assertEqual(len(cache), 0)
+
+    def test_ttl(self):
+        cache = ResponseCache(default_ttl=1000, ttls={"/groups/{id}/clusters": 0.01})
+        cache.store(URL, response(200, b"{}", etag="a"))
+        cache.store("/groups", response(200, b"{}", etag="b"))
+        time.sleep(0.02)
+        self.assertIsNone(cache.lookup(URL))
+        self.assertIsNotNone(cache.lookup("/groups"))
+
+    def test_disk(self):
+        cache = ResponseCache(directory=self._dir)
+        cache.store(URL, response(200, b'{"a": 1}', etag="a"))
+        cache = ResponseCache(directory=self._dir)
+        entry = cache.lookup(URL)
+        self.assertEqual(entry.etag, "a")
+        self.assertEqual(entry.doc(), {"a": 1})
+
+    def test_disk_bound(self):
+        cache = ResponseCache(directory=self._dir, max_disk_bytes=1000)
+        for i in range(10):
+            cache.store(f"{URL}/{i}", response(200, b"x" * 200, etag=str(i)))
+        self.assertLessEqual(sum(os.path.getsize(os.path.join(self._dir, f)) for f in os.listdir(self._dir)), 1000)
+        self.assertLessEqual(cache.stats()["disk_bytes"], 1000)
+
+
+class TestConditionalGet(unittest.TestCase):
+
+    def test_revalidate(self):
+        api = AtlasAPI(cache=ResponseCache())
+        api._auth = object()
+        api._session = RecordingSession([response(200, b'{"results": []}', etag='"v1"'),
+                                         response(304)])
+        first = api.get(URL)
+        second = api.get(URL)
+        self.assertEqual(first, second)
+        self.assertIsNot(first, second)
+        self.assertNotIn("If-None-Match", api.session.headers[0])
+        self.assertEqual(api.session.headers[1]["If-None-Match"], '"v1"')
+        self.assertEqual(api.stats()["cache"]["hits"], 1)
+
+    def test_fresh(self):
+        api = AtlasAPI(cache=ResponseCache(fresh_for=60))
+        api._auth = object()
+        api._session = RecordingSession([response(200, b'{"id": 1}')])
+        self.assertEqual(api.get(URL), {"id": 1})
+        self.assertEqual(api.get(URL), {"id": 1})
+        self.assertEqual(len(api.session.headers), 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,122 @@
+import email.utils
+import time
+import unittest
+
+import requests
+
+from atlascli.atlasapi import AtlasAPI
+from atlascli.errors import AtlasGetError, AtlasPatchError
+from atlascli.retry import RetryPolicy, TokenBucket
+
+
+def response(status, body=b'{"detail": "x"}', headers=None):
+    r = requests.Response()
+    r.status_code = status
+    r._content = body
+    r.headers.update(headers or {})
+    return r
+
+
+class ScriptedSession:
+    """
+    Stands in for requests.Session, answering with a scripted list of responses
+    """
+
+    def __init__(self, responses):
+        self._responses = list(responses)
+        self.calls = []
+
+    def request(self, method, url, **kwargs):
+        self.calls.append(method)
+        r = self._responses.pop(0)
+        if isinstance(r, Exception):
+            raise r
+        return r
+
+
+def api_with(responses, **kwargs):
+    api = AtlasAPI(retry_policy=RetryPolicy(backoff_factor=0, **kwargs))
+    api._auth = object()
+    api._session = ScriptedSession(responses)
+    return api
+
+
+class TestRetryPolicy(unittest.TestCase):
+
+    def test_retryable(self):
+        self.assertTrue(RetryPolicy.is_retryable("GET", 503))
+        self.assertTrue(RetryPolicy.is_retryable("PATCH", 429))
+        self.assertTrue(RetryPolicy.is_retryable("DELETE", None))
+        self.assertFalse(RetryPolicy.is_retryable("PATCH", 503))
+        self.assertFalse(RetryPolicy.is_retryable("POST", None))
+        self.assertFalse(RetryPolicy.is_retryable("GET", 404))
+
+    def test_retry_after(self):
+        self.assertEqual(RetryPolicy.parse_retry_after("3"), 3.0)
+        when = email.utils.formatdate(time.time() + 30, usegmt=True)
+        self.assertAlmostEqual(RetryPolicy.parse_retry_after(when), 30, delta=2)
+        self.assertIsNone(RetryPolicy.parse_retry_after("soon"))
+        self.assertEqual(RetryPolicy(max_backoff=10).backoff(0, "120"), 10)
+
+    def test_backoff(self):
+        policy = RetryPolicy(backoff_factor=1, jitter=False, max_backoff=5)
+        self.assertEqual([policy.backoff(i) for i in range(4)], [1, 2, 4, 5])
+        policy = RetryPolicy(backoff_factor=1)
+        self.assertTrue(all(0 <= policy.backoff(3) <= 8 for _ in range(20)))
+
+    def test_budget(self):
+        policy = RetryPolicy(budget_min=2, budget_ratio=0)
+        self.assertTrue(policy.should_retry("GET", 503, 0))
+        self.assertTrue(policy.should_retry("GET", 503, 0))
+        self.assertFalse(policy.should_retry("GET", 503, 0))
+        self.assertEqual(policy.stats()["exhausted"], 1)
+
+
+class TestAPIRetry(unittest.TestCase):
+
+    def test_get_retried(self):
+        api = api_with([response(429, headers={"Retry-After": "0"}),
+                        response(503),
+                        response(200, b'{"id": 1}')])
+        self.assertEqual(api.get("https://example.com/x"), {"id": 1})
+        self.assertEqual(api.stats()["retry"]["retries"], 2)
+        self.assertEqual(api.stats()["retry"]["statuses"], {"429": 1, "503": 1})
+
+    def test_connection_error_retried(self):
+        api = api_with([requests.exceptions.ConnectionError(), response(200, b'{}')])
+        self.assertEqual(api.get("https://example.com/x"), {})
+
+    def test_patch_not_replayed_on_5xx(self):
+        api = api_with([response(503), response(200, b'{}')])
+        with self.assertRaises(AtlasPatchError):
+            api.patch("https://example.com/x", {"paused": True})
+        self.assertEqual(api.session.calls, ["PATCH"])
+
+    def test_patch_replayed_on_429(self):
+        api = api_with([response(429), response(200, b'{"paused": true}')])
+        self.assertEqual(api.patch("https://example.com/x", {"paused": True}), {"paused": True})
+
+    def test_max_retries(self):
+        api = api_with([response(503)] * 3, max_retries=2)
+        with self.assertRaises(AtlasGetError):
+            api.get("https://example.com/x")
+        self.assertEqual(len(api.session.calls), 3)
+
+
+class TestTokenBucket(unittest.TestCase):
+
+    def test_rate(self):
+        bucket = TokenBucket(rate=50, capacity=1)
+        start = time.monotonic()
+        for _ in range(6):
+            bucket.acquire()
+        self.assertGreaterEqual(time.monotonic() - start, 0.09)
+
+    def test_hold(self):
+        bucket = TokenBucket(rate=100)
+        bucket.hold(0.05)
+        self.assertGreater(bucket.acquire(), 0.04)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,191 @@
+import io
+import os
+import tempfile
+import unittest
+from contextlib import redirect_stdout
+from datetime import datetime, timedelta
+
+from atlascli import jsoncodec
+from atlascli.atlasmap import AtlasMap
+from atlascli.commands import Commands
+from atlascli.scheduler import CronExpr, ScheduleRule, Scheduler, load_schedule
+from test.fakeatlas import FakeAtlasAPI, make_cluster, project_id
+
+
+class FakeNow:
+
+    def __init__(self, start: datetime):
+        self.now = start
+
+    def __call__(self) -> datetime:
+        return self.now
+
+    def sleep(self, seconds: float):
+        self.now += timedelta(seconds=seconds)
+
+
+class TestCronExpr(unittest.TestCase):
+
+    def test_next_after(self):
+        weekday_evenings = CronExpr("0 19 * * mon-fri")
+        friday = datetime(2026, 10, 16, 19, 0)
+        self.assertTrue(weekday_evenings.matches(friday))
+        self.assertEqual(weekday_evenings.next_after(friday), datetime(2026, 10, 19, 19, 0))
+        self.assertEqual(CronExpr("*/15 * * * *").next_after(datetime(2026, 10, 16, 10, 7, 30)),
+                         datetime(2026, 10, 16, 10, 15))
+        self.assertEqual(CronExpr("30 2 1 jan *").next_after(datetime(2026, 10, 16)),
+                         datetime(2027, 1, 1, 2, 30))
+        # both day fields restricted: either matches
+        either = CronExpr("0 0 13 * fri")
+        self.assertEqual(either.next_after(datetime(2026, 10, 13, 0, 0)), datetime(2026, 10, 16, 0, 0))
+        self.assertTrue(CronExpr("0 0 * * 7").matches(datetime(2026, 10, 18)))
+
+    def test_invalid(self):
+        for expr in ("* * * *", "60 * * * *", "* * * * funday", "5-1 * * * *", "0 0 31 feb *"):
+            with self.assertRaises(ValueError, msg=expr):
+                CronExpr(expr).next_after(datetime(2026, 1, 1))
+
+
+class TestScheduler(unittest.TestCase):
+
+    def setUp(self):
+        self._api = FakeAtlasAPI.with_inventory(project_count=2, clusters_per_project=0)
+        self._api.cluster_docs[project_id(0)] = [make_cluster(f"dev{n}", project_id(0)) for n in range(4)]
+        self._api.cluster_docs[project_id(1)] = [make_cluster("prod", project_id(1)),
+                                                 make_cluster("test", project_id(1), paused=True)]
+        self._map = AtlasMap(api=self._api)
+        self._commands = Commands(self._map)
+        self._dir = tempfile.TemporaryDirectory()
+        self._status = os.path.join(self._dir.name, "status.json")
+        self._rules = [ScheduleRule("evening", "0 19 * * *", "pause", {"names": ["dev*"]}),
+                       ScheduleRule("test-on", "0 19 * * *", "resume", {"projects": [project_id(1)],
+                                                                        "states": ["paused"]}),
+                       ScheduleRule("morning", "0 7 * * *", "resume", {"names": ["dev*"]}, catch_up=0)]
+
+    def tearDown(self):
+        self._dir.cleanup()
+
+    def scheduler(self, now: FakeNow) -> Scheduler:
+        return Scheduler(self._commands, self._rules, self._status, now=now, sleep=now.sleep)
+
+    def test_fires_due_rules(self):
+        now = FakeNow(datetime(2026, 10, 16, 18, 59, 30))
+        scheduler = self.scheduler(now)
+        with redirect_stdout(io.StringIO()):
+            self.assertEqual(scheduler.tick(), [])
+            now.sleep(30)
+            self.assertEqual(sorted(scheduler.tick()), ["evening", "test-on"])
+            self.assertEqual(scheduler.tick(), [])
+        self.assertTrue(all(c.is_paused() for c in self._map.get_clusters(project_id(0))))
+        self.assertFalse(self._map.get_one_cluster(project_id(1), "test").is_paused())
+        self.assertFalse(self._map.get_one_cluster(project_id(1), "prod").is_paused())
+        self.assertEqual(self._api.request_count("PATCH"), 5)
+
+        with open(self._status, encoding="utf-8") as f:
+            status = jsoncodec.load(f)
+        self.assertEqual(status["rules"]["evening"]["last_result"], {"paused": 4, "skipped": 0, "failed": 0})
+        self.assertEqual(status["rules"]["evening"]["next_due"], str(datetime(2026, 10, 17, 19, 0)))
+
+    def test_rules_read_current_state(self):
+        now = FakeNow(datetime(2026, 10, 16, 18, 59, 30))
+        pause = ScheduleRule("night", "0 19 * * *", "pause", {"projects": [project_id(1)],
+                                                             "states": ["running"]})
+        scheduler = Scheduler(self._commands, [pause], self._status, now=now, sleep=now.sleep)
+        self.assertEqual(len(self._map.clusters), 6)
+        # resumed outside the scheduler after the map was warmed
+        self._api.cluster_docs[project_id(1)][1]["paused"] = False
+        self._api.requests.clear()
+        now.sleep(30)
+        with redirect_stdout(io.StringIO()):
+            self.assertEqual(scheduler.tick(), ["night"])
+        self.assertEqual(self._api.requests[("GET", "groups/{id}/clusters")], 1)  # only project 1
+        self.assertEqual(self._api.request_count("PATCH"), 2)
+        self.assertTrue(self._map.get_one_cluster(project_id(1), "test").is_paused())
+
+    def test_listing_failure_keeps_rules_due(self):
+        now = FakeNow(datetime(2026, 10, 16, 18, 59, 30))
+        scheduler = self.scheduler(now)
+        original = self._api._route
+        failing = [True]
+
+        def route(method, url, parts, body):
+            if failing[0] and method == "GET" and parts[-1] == "clusters":
+                return self._api._response(503, {"detail": "unavailable"})
+            return original(method, url, parts, body)
+        self._api._route = route
+
+        now.now = datetime(2026, 10, 16, 19, 0, 5)
+        with redirect_stdout(io.StringIO()):
+            self.assertEqual(scheduler.tick(), [])
+        self.assertEqual(scheduler.next_due()["evening"], datetime(2026, 10, 16, 19, 0))
+        self.assertIn("cannot read the clusters", scheduler.status["rules"]["evening"]["last_error"])
+        self.assertEqual(self._api.request_count("PATCH"), 0)
+
+        # Atlas is back, the rules fire once the retry interval has passed
+        failing[0] = False
+        now.sleep(10)
+        self.assertEqual(scheduler.tick(), [])
+        now.sleep(30)
+        with redirect_stdout(io.StringIO()):
+            self.assertEqual(sorted(scheduler.tick()), ["evening", "test-on"])
+        self.assertEqual(scheduler.next_due()["evening"], datetime(2026, 10, 17, 19, 0))
+        self.assertNotIn("last_error", scheduler.status["rules"]["evening"])
+        self.assertEqual(self._api.request_count("PATCH"), 5)
+
+    def test_run_survives_listing_failure(self):
+        now = FakeNow(datetime(2026, 10, 16, 18, 59, 30))
+        original = self._api._route
+
+        def route(method, url, parts, body):
+            if now.now.minute == 0 and parts[-1] == "clusters":
+                return self._api._response(503, {"detail": "unavailable"})
+            return original(method, url, parts, body)
+        self._api._route = route
+        with redirect_stdout(io.StringIO()):
+            self.scheduler(now).run(max_ticks=4)
+        # failed at 19:00:00 and 19:00:30, fired at 19:01:00
+        self.assertEqual(now.now, datetime(2026, 10, 16, 19, 1))
+        self.assertEqual(self._api.request_count("PATCH"), 5)
+
+    def test_catch_up_after_restart(self):
+        now = FakeNow(datetime(2026, 10, 16, 18, 0))
+        with redirect_stdout(io.StringIO()):
+            self.scheduler(now).run(max_ticks=1)
+            # down from 18:00 until 19:30 the next evening, and until 7:10 the morning after
+            now.now = datetime(2026, 10, 17, 19, 30)
+            self.assertEqual(sorted(self.scheduler(now).tick()), ["evening", "test-on"])
+            now.now = datetime(2026, 10, 18, 7, 10)
+            scheduler = self.scheduler(now)
+            self.assertEqual(scheduler.tick(), [])
+        self.assertEqual(scheduler.status["rules"]["morning"]["last_missed"], datetime(2026, 10, 18, 7, 0))
+        # several missed evenings are fired once
+        self.assertEqual(self._api.request_count("PATCH"), 5)
+
+    def test_run_sleeps_until_due(self):
+        now = FakeNow(datetime(2026, 10, 16, 18, 57))
+        with redirect_stdout(io.StringIO()):
+            self.scheduler(now).run(max_ticks=4)
+        self.assertEqual(now.now, datetime(2026, 10, 16, 19, 0))
+        self.assertEqual(self._api.request_count("PATCH"), 5)
+
+    def test_load_schedule(self):
+        path = os.path.join(self._dir.name, "schedule.json")
+        with open(path, "w", encoding="utf-8") as f:
+            jsoncodec.dump({"rules": [{"name": "a", "cron": "0 19 * * mon-fri", "action": "pause",
+                                       "select": {"all": True}}]}, f)
+        rules = load_schedule(path)
+        self.assertEqual(rules[0].name, "a")
+        with self.assertRaises(ValueError):
+            ScheduleRule("b", "0 19 * * *", "delete", {"all": True})
+        with self.assertRaises(ValueError):
+            ScheduleRule("c", "0 19 * * *", "pause", {})
+        with self.assertRaises(ValueError):
+            ScheduleRule("c", "0 19 * * *", "pause", {"states": ["running"]})
+        with self.assertRaises(ValueError):
+            ScheduleRule("c", "0 19 * * *", "pause", {"names": [f"{project_id(0)}:dev*"]})
+        with self.assertRaises(ValueError):
+            ScheduleRule.from_dict({"name": "d", "action": "pause"})
+
+
+if __name__ == '__main__':
+    unittest.main()
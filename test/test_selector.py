@@ -0,0 +1,93 @@
+import io
+import unittest
+from contextlib import redirect_stdout
+
+from atlascli.atlasmap import AtlasMap
+from atlascli.bulk import BulkOp
+from atlascli.commands import Commands
+from atlascli.selector import ClusterSelector, FleetPlan, is_glob
+from test.fakeatlas import FakeAtlasAPI, make_cluster, project_id
+
+
+class TestSelector(unittest.TestCase):
+
+    def setUp(self):
+        self._api = FakeAtlasAPI.with_inventory(project_count=3, clusters_per_project=0)
+        self._api.cluster_docs[project_id(0)] = [make_cluster("dev-a", project_id(0)),
+                                                 make_cluster("dev-b", project_id(0), size="M30"),
+                                                 make_cluster("dev-c", project_id(0), paused=True)]
+        self._api.cluster_docs[project_id(1)] = [make_cluster("prod-a", project_id(1), size="M60"),
+                                                 make_cluster("dev-a", project_id(1))]
+        self._map = AtlasMap(api=self._api)
+        self._commands = Commands(self._map)
+
+    def names(self, selector):
+        return sorted(f"{c.project_id[-1]}:{c.name}" for c in selector.select(self._map))
+
+    def test_select(self):
+        self.assertEqual(self.names(ClusterSelector()), [])
+        self.assertEqual(len(self.names(ClusterSelector(select_all=True))), 5)
+        self.assertEqual(self.names(ClusterSelector(projects=["project1"])), ["1:dev-a", "1:prod-a"])
+        self.assertEqual(self.names(ClusterSelector(names=["dev-*"], states=["running"])),
+                         ["0:dev-a", "0:dev-b", "1:dev-a"])
+        self.assertEqual(self.names(ClusterSelector(instance_sizes=["M30", "M60"], select_all=True)),
+                         ["0:dev-b", "1:prod-a"])
+        self.assertEqual(self.names(ClusterSelector(states=["paused"], select_all=True)), ["0:dev-c"])
+        # sizes and states only filter, on their own they select nothing
+        self.assertEqual(self.names(ClusterSelector(instance_sizes=["M30", "M60"])), [])
+        self.assertTrue(ClusterSelector(states=["running"]).is_empty())
+        with self.assertRaises(ValueError):
+            ClusterSelector(names=[f"{project_id(0)}:dev-*"])
+        self.assertTrue(is_glob("dev-*"))
+        self.assertFalse(is_glob("dev-a"))
+
+    def test_plan(self):
+        plan = FleetPlan(BulkOp.PAUSE, ClusterSelector(projects=[project_id(0)]).select(self._map))
+        self.assertEqual([c.name for c in plan.changes], ["dev-a", "dev-b"])
+        self.assertEqual([c.name for c in plan.unchanged], ["dev-c"])
+        self.assertEqual(plan.api_calls, 2)
+        with self.assertRaises(ValueError):
+            FleetPlan(BulkOp.DELETE, [])
+
+    def test_dry_run_changes_nothing(self):
+        out = io.StringIO()
+        with redirect_stdout(out):
+            summary = self._commands.pause_cmd(["dev-*"], dry_run=True)
+        self.assertEqual(summary, {"paused": 3, "skipped": 1, "failed": 0, "api_calls": 3})
+        self.assertEqual(self._api.request_count("PATCH"), 0)
+        self.assertIn("3 API call(s)", out.getvalue())
+
+    def test_instance_size_is_exact(self):
+        self._api.cluster_docs[project_id(2)] = [make_cluster("m40", project_id(2), size="M40"),
+                                                 make_cluster("r40", project_id(2), size="R40"),
+                                                 make_cluster("nvme", project_id(2), size="M40_NVME")]
+        self._map.refresh_project(project_id(2))
+        out = io.StringIO()
+        with redirect_stdout(out):
+            summary = self._commands.pause_cmd([], selector=ClusterSelector(select_all=True, instance_sizes=["m40"]),
+                                               dry_run=True)
+        self.assertEqual(summary["paused"], 1)
+        self.assertIn("m40", out.getvalue())
+        self.assertNotIn("r40", out.getvalue())
+        self.assertNotIn("nvme", out.getvalue())
+        self.assertEqual(self._api.request_count("PATCH"), 0)
+
+    def test_selector_run(self):
+        with redirect_stdout(io.StringIO()):
+            summary = self._commands.pause_cmd([f"{project_id(1)}:prod-a"],
+                                               selector=ClusterSelector(names=["dev-a"]), parallel=3)
+        self.assertEqual(summary, {"paused": 3, "skipped": 0, "failed": 0})
+        self.assertEqual(self._api.request_count("PATCH"), 3)
+
+    def test_nothing_selected(self):
+        with self.assertRaises(SystemExit):
+            self._commands.resume_cmd([], selector=ClusterSelector())
+        with self.assertRaises(SystemExit):
+            self._commands.pause_cmd([], selector=ClusterSelector(states=["running"]))
+        with self.assertRaises(SystemExit):
+            self._commands.pause_cmd([f"{project_id(0)}:dev-*"])
+        self.assertEqual(self._api.request_count("PATCH"), 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,32 @@
+import unittest
+
+from atlascli.atlasapi import AtlasAPI
+from atlascli.errors import AtlasInitialisationError
+
+
+class TestSession(unittest.TestCase):
+
+    def test_pool_settings(self):
+        api = AtlasAPI(pool_connections=4, pool_maxsize=20, pool_block=True)
+        adapter = api.session.get_adapter(AtlasAPI.SITE_URL)
+        self.assertEqual(adapter._pool_connections, 4)
+        self.assertEqual(adapter._pool_maxsize, 20)
+        self.assertTrue(adapter._pool_block)
+        self.assertIs(api.session, api.session)
+
+    def test_context_manager(self):
+        with AtlasAPI() as api:
+            session = api.session
+            self.assertIsNotNone(session)
+        self.assertIsNone(api.session)
+        # a closed API lazily creates a new pool
+        self.assertIsNotNone(api._get_session())
+        api.close()
+
+    def test_bad_pool_size(self):
+        with self.assertRaises(AtlasInitialisationError):
+            AtlasAPI(pool_maxsize=0)
+
+
+if __name__ == '__main__':
+    unittest.main()
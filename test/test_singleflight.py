@@ -0,0 +1,106 @@
+import threading
+import time
+import unittest
+
+import requests
+
+from atlascli.atlasapi import AtlasAPI
+from atlascli.errors import AtlasGetError
+from atlascli.singleflight import SingleFlight
+
+URL = "https://cloud.mongodb.com/api/atlas/v1.0/groups/5a141a774e65811a132a8010/clusters"
+
+
+def run_threads(n, target):
+    results = [None] * n
+    errors = [None] * n
+
+    def worker(i):
+        try:
+            results[i] = target()
+        except Exception as e:
+            errors[i] = e
+
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(n)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return results, errors
+
+
+class SlowSession:
+
+    def __init__(self, status=200, body=b'{"results": [{"name": "MOT"}]}'):
+        self.calls = 0
+        self._status = status
+        self._body = body
+
+    def request(self, method, url, **kwargs):
+        self.calls += 1
+        time.sleep(0.1)
+        r = requests.Response()
+        r.status_code = self._status
+        r._content = self._body
+        return r
+
+
+class TestSingleFlight(unittest.TestCase):
+
+    def test_collapse(self):
+        sf = SingleFlight()
+
+        def slow():
+            time.sleep(0.1)
+            return {"a": [1]}
+
+        results, errors = run_threads(5, lambda: sf.do("k", slow))
+        self.assertEqual(errors, [None] * 5)
+        self.assertEqual([r[0] for r in results], [{"a": [1]}] * 5)
+        self.assertEqual(sum(1 for r in results if not r[1]), 1)
+        self.assertEqual(sf.stats(), {"calls": 5, "executed": 1, "collapsed": 4, "errors": 0})
+        self.assertEqual(len({id(r[0]) for r in results}), 5)
+        self.assertEqual(sf.in_flight(), 0)
+
+    def test_error(self):
+        sf = SingleFlight()
+
+        def fail():
+            time.sleep(0.1)
+            raise ValueError("boom")
+
+        _, errors = run_threads(3, lambda: sf.do("k", fail))
+        self.assertTrue(all(isinstance(e, ValueError) for e in errors))
+        self.assertEqual(sf.stats()["errors"], 1)
+        self.assertEqual(sf.do("k", lambda: 1), (1, False))
+
+
+class TestCoalescedGet(unittest.TestCase):
+
+    def make_api(self, session, **kwargs):
+        api = AtlasAPI(**kwargs)
+        api._auth = object()
+        api._session = session
+        return api
+
+    def test_get(self):
+        api = self.make_api(SlowSession())
+        results, errors = run_threads(4, lambda: api.get(URL))
+        self.assertEqual(api.session.calls, 1)
+        self.assertEqual(results, [{"results": [{"name": "MOT"}]}] * 4)
+        self.assertEqual(api.stats()["coalesced"]["collapsed"], 3)
+
+    def test_get_error(self):
+        api = self.make_api(SlowSession(status=404, body=b'{"detail": "no such group"}'))
+        _, errors = run_threads(3, lambda: api.get(URL))
+        self.assertTrue(all(isinstance(e, AtlasGetError) for e in errors))
+        self.assertEqual(api.session.calls, 1)
+
+    def test_disabled(self):
+        api = self.make_api(SlowSession(), coalesce=False)
+        run_threads(3, lambda: api.get(URL))
+        self.assertEqual(api.session.calls, 3)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,98 @@
+import unittest
+
+from atlascli.atlasmap import AtlasMap
+from atlascli.waiter import ClusterWaiter, WaitTarget
+from test.fakeatlas import FakeAtlasAPI, project_id
+
+
+class FakeClock:
+
+    def __init__(self, on_sleep=None):
+        self.now = 0.0
+        self.sleeps = []
+        self._on_sleep = on_sleep
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.sleeps.append(seconds)
+        self.now += seconds
+        if self._on_sleep:
+            self._on_sleep()
+
+
+class TestClusterWaiter(unittest.TestCase):
+
+    def setUp(self):
+        self._api = FakeAtlasAPI.with_inventory(project_count=3, clusters_per_project=4)
+        self._map = AtlasMap(api=self._api)
+        for pid in (project_id(0), project_id(1)):
+            for cluster in self._map.get_clusters(pid):
+                self._map.pause_cluster(cluster)
+        self._api.requests.clear()
+
+    def _settle_one(self):
+        for docs in self._api.cluster_docs.values():
+            for doc in docs:
+                if doc["stateName"] == "REPAIRING":
+                    doc["stateName"] = "IDLE"
+                    return
+
+    def _targets(self):
+        return [WaitTarget.paused_cluster(c) for pid in (project_id(0), project_id(1))
+                for c in self._map.get_clusters(pid)]
+
+    def test_waits_with_one_listing_per_project(self):
+        clock = FakeClock(self._settle_one)
+        waiter = ClusterWaiter(self._api, self._map, interval=1, max_interval=8, clock=clock, sleep=clock.sleep)
+        reached = []
+        result = waiter.wait(self._targets(), on_reached=lambda t, c: reached.append(t.name))
+        self.assertFalse(result.timed_out)
+        self.assertEqual(len(reached), 8)
+        self.assertEqual(self._api.requests[("GET", "groups/{id}/clusters/{name}")], 0)
+        # one cluster settles per round, both projects are listed for the first
+        # five rounds and only project 1 once project 0 has settled
+        self.assertEqual(result.rounds, 9)
+        self.assertEqual(self._api.request_count("GET"), 5 * 2 + 4)
+        self.assertTrue(all(c.state == "IDLE" for c in self._map.get_clusters(project_id(0))))
+
+    def test_backoff_and_timeout(self):
+        clock = FakeClock()
+        waiter = ClusterWaiter(self._api, interval=1, max_interval=4, backoff=2, clock=clock, sleep=clock.sleep)
+        result = waiter.wait(self._targets(), timeout=20)
+        self.assertTrue(result.timed_out)
+        self.assertEqual(len(result.pending), 8)
+        self.assertEqual(clock.sleeps[:4], [2, 4, 4, 4])
+        self.assertEqual(clock.now, 20)
+
+    def test_changing_target_waits_for_the_change_to_start(self):
+        doc = self._api.cluster_docs[project_id(2)][0]
+        doc["paused"] = True  # Atlas has taken the PATCH but not started on it yet
+        cluster = self._map.refresh_cluster(project_id(2), "cluster0")
+        states = iter(["REPAIRING", "IDLE"])
+        clock = FakeClock(lambda: doc.update(stateName=next(states, "IDLE")))
+        waiter = ClusterWaiter(self._api, interval=1, settle_delay=30, clock=clock, sleep=clock.sleep)
+        self.assertTrue(WaitTarget.paused_cluster(cluster).reached(cluster))
+        result = waiter.wait([WaitTarget.paused_cluster(cluster, changing=True)])
+        self.assertEqual(result.rounds, 3)
+        self.assertEqual(result.pending, {})
+
+        clock = FakeClock()
+        waiter = ClusterWaiter(self._api, interval=1, max_interval=4, settle_delay=10, clock=clock, sleep=clock.sleep)
+        result = waiter.wait([WaitTarget.paused_cluster(cluster, changing=True)], timeout=60)
+        self.assertFalse(result.timed_out)
+        self.assertGreaterEqual(clock.now, 10)
+
+    def test_deleted(self):
+        cluster = self._map.get_one_cluster(project_id(2), "cluster0")
+        self._map.delete_cluster(cluster)
+        clock = FakeClock(lambda: self._api.cluster_docs[project_id(2)].pop(0))
+        waiter = ClusterWaiter(self._api, self._map, clock=clock, sleep=clock.sleep)
+        result = waiter.wait([WaitTarget.deleted_cluster(cluster)])
+        self.assertEqual(result.rounds, 2)
+        self.assertEqual(self._map.get_cluster("cluster0", project_id(2)), [])
+
+
+if __name__ == '__main__':
+    unittest.main()